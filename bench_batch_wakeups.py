@@ -0,0 +1,122 @@
+"""
+Benchmark event loop wakeups of batch_deeplx_tr: old 100 ms polling vs blocking gets.
+
+deeplx_client_async is replaced by a fake with fixed latency and a failure
+rate, so many workers sit idle while a few texts are in flight: the
+situation where polling workers keep waking up for nothing.
+
+cpu of "event" also covers what batch_deeplx_tr does besides waiting
+(selector, worker stats), which the polling baseline leaves out.
+
+uv run python bench_batch_wakeups.py [n_texts [n_workers [latency]]]
+"""
+# pylint: disable=invalid-name, protected-access
+
+import asyncio
+import random
+import sys
+from time import monotonic, perf_counter, process_time
+
+from loguru import logger
+from ycecream import y
+
+import deeplx_pool.batch_deeplx_tr as bdt
+
+logger.remove()
+y.configure(enabled=False)
+
+LATENCY = 0.5
+FAIL_RATE = 0.2
+
+# failures drawn from their own generator, the selector uses random too
+rng = random.Random()
+
+# count callbacks run by the event loop: every resume of a coroutine
+# (timer fired, future done) is one Handle._run
+wakeups = 0
+_handle_run = asyncio.events.Handle._run
+
+
+def _counting_handle_run(self):
+    global wakeups  # pylint: disable=global-statement
+    wakeups += 1
+    _handle_run(self)
+
+
+asyncio.events.Handle._run = _counting_handle_run  # type: ignore
+
+
+async def fake_deeplx_client_async(text, *args, **kwargs):  # pylint: disable=unused-argument
+    """Stand-in for deeplx_client_async."""
+    await asyncio.sleep(LATENCY)
+    if rng.random() < FAIL_RATE:
+        raise RuntimeError("fake 503")
+    return f"tr: {text}"
+
+
+async def polling_worker(queue, queue_tr, n_texts):
+    """The old worker loop: get_nowait + sleep(0.1), qsize check for the stop."""
+    then = monotonic()
+    while True:
+        if queue_tr.qsize() >= n_texts or monotonic() - then > 30 * n_texts:
+            break
+        try:
+            seqno, text = queue.get_nowait()
+        except asyncio.QueueEmpty:
+            await asyncio.sleep(0.1)
+            continue
+        try:
+            trtext = await fake_deeplx_client_async(text)
+        except Exception:  # pylint: disable=broad-exception-caught
+            await queue.put((seqno, text))
+            await asyncio.sleep(0.1)
+            continue
+        await queue_tr.put((seqno, trtext))
+
+
+async def polling_batch(texts, n_workers):
+    """The old batch engine around polling_worker."""
+    que, que_tr = asyncio.Queue(), asyncio.Queue()
+    for idx, text in enumerate(texts):
+        await que.put((idx, text))
+    await asyncio.gather(
+        *[polling_worker(que, que_tr, len(texts)) for _ in range(n_workers)]
+    )
+    return que_tr.qsize()
+
+
+async def event_batch(texts, n_workers):
+    """The current batch_deeplx_tr."""
+    return len(
+        await bdt.batch_deeplx_tr(
+            texts, n_workers=n_workers, tr_cache=False, pack=False
+        )
+    )
+
+
+def run(name, coro_func, texts, n_workers):
+    """Run one engine, print wakeups per second and cpu."""
+    global wakeups  # pylint: disable=global-statement
+    rng.seed(0)
+    wakeups = 0
+    then, cpu_then = perf_counter(), process_time()
+    n_done = asyncio.run(coro_func(texts, n_workers))
+    wall, cpu = perf_counter() - then, process_time() - cpu_then
+    print(
+        f"{name:>8}: {n_done}/{len(texts)} done, wall {wall:.2f}s, cpu {cpu:.3f}s, "
+        f"{wakeups} wakeups, {wakeups / wall:.0f} wakeups/s"
+    )
+
+
+if __name__ == "__main__":
+    n_texts_ = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    n_workers_ = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    LATENCY = float(sys.argv[3]) if len(sys.argv) > 3 else LATENCY
+
+    bdt.deeplx_client_async = fake_deeplx_client_async
+    bdt.DEQ.clear()
+    bdt.DEQ.extend(f"http://fake{idx}" for idx in range(10))
+
+    texts_ = [f"text {idx}" for idx in range(n_texts_)]
+    run("polling", polling_batch, texts_, n_workers_)
+    run("event", event_batch, texts_, n_workers_)
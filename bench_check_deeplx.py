@@ -0,0 +1,63 @@
+"""
+Benchmark check_deeplx_stream: one client per probe vs long-lived probe clients.
+
+A local aiohttp stub answers POST /<ep>/translate like a deeplx service,
+so each http://127.0.0.1:<port>/<ep> counts as a separate url.
+
+uv run python bench_check_deeplx.py [n_urls [concurrency]]
+"""
+# pylint: disable=invalid-name
+
+import asyncio
+import sys
+from time import perf_counter, process_time
+
+from aiohttp import web
+from loguru import logger
+
+from deeplx_pool.check_deeplx_stream import check_deeplx_bounded
+
+logger.remove()  # probes are silent anyway, keep the output tidy
+
+REPLY = '{"code":200,"data":"你好，世界","alternatives":[]}'
+
+
+async def translate(request):  # pylint: disable=unused-argument
+    """Stub deeplx /translate."""
+    return web.Response(text=REPLY, content_type="application/json")
+
+
+async def run(n_urls: int, concurrency: int):
+    """Start the stub, time both probe modes."""
+    app = web.Application()
+    app.router.add_post("/{ep}/translate", translate)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]  # type: ignore  # pylint: disable=protected-access
+
+    urls = [f"http://127.0.0.1:{port}/ep{idx}" for idx in range(n_urls)]
+
+    try:
+        for reuse_clients in [False, True]:
+            then, cpu_then = perf_counter(), process_time()
+            res = await check_deeplx_bounded(
+                urls, concurrency=concurrency, reuse_clients=reuse_clients
+            )
+            wall, cpu = perf_counter() - then, process_time() - cpu_then
+            n_ok = sum(isinstance(latency, float) for _, latency in res)
+            mode = "long-lived clients" if reuse_clients else "client per probe"
+            print(
+                f"{mode:>18}: {n_ok}/{n_urls} ok, wall {wall:.2f}s, "
+                f"{wall / n_urls * 1e3:.2f} ms/url wall, "
+                f"{cpu / n_urls * 1e3:.2f} ms/url cpu"
+            )
+    finally:
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    n_urls_ = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    concurrency_ = int(sys.argv[2]) if len(sys.argv) > 2 else 64
+    asyncio.run(run(n_urls_, concurrency_))
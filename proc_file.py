@@ -6,7 +6,6 @@ Inject urls in a file to diskcache deeplx-sites.
 # pylint: disable=broad-exception-caught
 
 import asyncio
-from datetime import timedelta
 from random import choices
 import re
 from pathlib import Path
@@ -17,60 +16,26 @@ import diskcache
 from loguru import logger
 from rich.console import Console
 
-from deeplx_pool.check_deeplx import check_deeplx_async
+from deeplx_pool.check_deeplx_stream import check_deeplx_bounded
+from deeplx_pool.duration_human import duration_human
+from deeplx_pool.endpoint_registry import EndpointRegistry
+from deeplx_pool.sites_snapshot import SITES
 
 cache = diskcache.Cache(Path.home() / ".diskcache" / "deeplx-sites")
-DURATION_HUMAN_SPEC = (
-    (1.0e-6, 1e9, 1e3, "ns"),
-    (1.0e-3, 1e6, 1e3, "us"),
-    (1.0, 1e3, 1e3, "ms"),
-    (60.0, 1e0, 60.0, "s"),
-)
 console = Console()
 
 
-def duration_human(value: float) -> str:
+def proc_file(filename="", full=False):
     """
-    Return a beautiful representation of the duration.
-
-    It dynamically calculates the best unit to use.
-
-    Returns
-    -------
-        str: the duration representation.
+    Process filename.
 
+    Verify and time reponse time, only urls that are due unless full is set.
     """
-    try:
-        value = round(value, 2)
-    except Exception:
-        return str(value)
-
-    for (
-        top,
-        mult,
-        size,
-        unit,
-    ) in DURATION_HUMAN_SPEC:
-        if value < top:
-            result = round(value * mult, ndigits=2)
-            if result < size:
-                return f"{result}{unit}"
-    try:
-        txt = str(timedelta(seconds=float(f"{value:.1f}")))
-        pos = txt.find(".")
-        if pos == -1:
-            return txt
-        return txt[: pos + 2]
-    except OverflowError:
-        return "quasi-infinity \n(Python int too large to convert to C int)"
+    return asyncio.run(proc_file_async(filename, full))
 
 
-def proc_file(filename=""):
-    """
-    Process filename.
-
-    Verify and time reponse time.
-    """
+async def proc_file_async(filename="", full=False):
+    """Process filename in a running event loop, e.g. fastapi_app's scheduler."""
     if not filename:
         filename = "linuxdo216930.txt"
         filename = "fofa-results.txt"
@@ -94,50 +59,53 @@ def proc_file(filename=""):
 
     urls = re.findall(r"https?://[\w.:-]+", filecont)
 
-    url_list_hist = cache.get("deeplx-sites", [])
-    _ = list(dict(url_list_hist))  # type: ignore
-    urls = set(_ + urls)
-    urls = list(urls)
+    # sqlite off the loop, fastapi_app keeps serving meanwhile
+    registry = await asyncio.to_thread(EndpointRegistry(cache).load)
+    new_urls = set(urls) - set(registry.records)
+    urls = list(set(list(registry.records) + urls))
+
+    # only probe urls that are due, unless full
+    if not full:
+        urls = registry.due_urls(urls)
 
     # if windows, pick 700
-    if "windows" in platform().lower():
+    if "windows" in platform().lower() and len(urls) > 700:
         urls = choices(urls, k=700)
 
     logger.info(f"{len(urls)=}")
 
-    async def gather():
-        return await asyncio.gather(
-            *map(check_deeplx_async, urls),
-            return_exceptions=True,
-        )
-
     then = time()
     # urls_checked = await asyncio.gather(
-    urls_checked = asyncio.run(gather())
-    console.print("Checked urls:", urls_checked)
+    urls_checked = await check_deeplx_bounded(urls)
+    n_healthy = sum(isinstance(latency, float) for _, latency in urls_checked)
+    console.print(f"Checked urls: {len(urls_checked)}, healthy: {n_healthy}")
     console.print(
         f"Time elapsed: {duration_human(time() - then)}",
         style="green",
     )
 
-    # save valid urls to cache
-    urls_valid = [_ for _ in urls_checked if isinstance(_[1], float)]  # type: ignore
+    for url, latency in urls_checked:
+        registry.update(url, latency, source="file" if url in new_urls else "")
 
-    # sorted
-    urls_valid = sorted(urls_valid, key=lambda x: x[1])  # type: ignore
+    # save valid urls to cache, sorted: healthy ones just checked
+    # and healthy ones not due yet, published as saved (rescored);
+    # none at all: records only, "deeplx-sites" is left as it is
+    if registry.ranked():
+        urls_valid = await asyncio.to_thread(registry.save, True)
+    else:
+        await asyncio.to_thread(registry.flush)
+        urls_valid = []
 
     logger.info(f"urls_valid: {len(urls_valid)}")
     if urls_valid:
-        cache.set("deeplx-sites", urls_valid)
+        SITES.publish(urls_valid)
         console.print(
-            urls_valid,
             f"{len(urls_valid)} to diskcache deeplx-sites",
             style="green",
         )
     else:
         console.print(
-            urls_valid,
-            "Is the net down?",
+            "no valid urls, is the net down?",
             style="red bold",
         )
 
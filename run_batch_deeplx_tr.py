@@ -78,6 +78,11 @@ n_workers = 0  # n_workers = len(texts)
 n_workers = 19
 n_workers = 9
 
+# None (the default): start at len(DEQ) requests in flight, then grow or
+# shrink with measured throughput, latency and errors, no tuning needed,
+# see deeplx_pool.concurrency
+n_workers = None
+
 _ = asyncio.run(batch_deeplx_tr(texts, n_workers=n_workers))
 
 # print('[int(isinstance(elm, Exception)) for elm in _])', [int(isinstance(elm, Exception)) for elm in _])
@@ -5,67 +5,329 @@ cache = diskcache.Cache(Path.home() / ".diskcache" / "deeplx-sites")
 
 # reverse, prepare for deq[-1] and deq.rotate
 deq = deque([url for url, deplay in cache.get("deeplx-sites")[::-1]]
+
+Workers pick urls through a shared endpoint_selector.Selector fed with
+the outcome of every request, see batch_deeplx_tr(..., selector="p2c").
+
+Identical texts are translated once, see batch_deeplx_tr(..., dedup=True),
+translations are looked up in tr_cache.TR_CACHE first, only misses go
+to the workers, see batch_deeplx_tr(..., tr_cache=False), short texts
+are packed into one request and long ones split, see packing.Packer and
+batch_deeplx_tr(..., pack=False). A slow request can be hedged on a
+second url, see hedge and batch_deeplx_tr(..., hedge=True).
+
+The batch deadline (batch_deeplx_tr(..., timeout=...)) bounds every
+attempt: each request gets at most ATTEMPT_TIMEOUT seconds or what is
+left, no attempt starts with less than MIN_ATTEMPT_TIME left, and texts
+not done in time come back as TranslationFailed markers.
+
+Failed attempts go through retry_policy.RetryPolicy: a text is tried at
+most max_attempts times, one the deeplx rejects (e.g. 400) is given up on
+right away, and a url that failed backs off (jittered, exponential), see
+batch_deeplx_tr(..., retry_policy=...). Urls out of rate limit tokens
+(rate_limit.LIMITER, learned from 429 and Retry-After) are avoided the
+same way.
+
+The number of requests in flight adapts to the pool by default: it
+starts at one per url in DEQ and grows or shrinks with the measured
+throughput, latency and overload errors, see concurrency and
+batch_deeplx_tr(..., n_workers=None).
 """
 
-# pylint: disable=too-many-branches, too-many-statements
+# pylint: disable=too-many-branches, too-many-statements, too-many-locals
 import asyncio
-from collections import deque
+import os
+from collections import Counter, deque
+from math import ceil
 from pathlib import Path
 from random import randrange
 from time import monotonic
-from typing import List, Tuple, Union
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Tuple, Union
 
 import diskcache
 from loguru import logger
 from ycecream import y
 
-from deeplx_pool.deeplx_client_async import deeplx_client_async
+from deeplx_pool.circuit_breaker import CircuitBreakerBoard
+from deeplx_pool.concurrency import ConcurrencyController
+from deeplx_pool.deeplx_client_async import CONCURRENCY_LIMIT, deeplx_client_async
+from deeplx_pool.endpoint_selector import Selector, make_selector
+from deeplx_pool.hedge import HEDGE, HedgeBudget, hedged
+from deeplx_pool.metrics import MetricsRegistry
+from deeplx_pool.packing import Packer
+from deeplx_pool.rate_limit import LIMITER
+from deeplx_pool.retry_policy import (
+    NON_RETRYABLE,
+    NOT_SENT,
+    RETRYABLE,
+    RetryPolicy,
+    classify,
+)
+from deeplx_pool.tr_cache import TR_CACHE, TranslationCache
 
 cache = diskcache.Cache(Path.home() / ".diskcache" / "deeplx-sites")
 _ = cache.get("deeplx-sites") or []  # "or []" takes care of first run
 DEQ = deque([url for url, delay in _[::-1]])  # type: ignore
 
+ATTEMPT_TIMEOUT = 30.0  # seconds per request at most
+MIN_ATTEMPT_TIME = 0.5  # no attempt starts with less time left (a tenth of short batches)
 
-async def cache_incr(item, idx, inc=1):
-    """Increase cache.get(item)[idx] += inc."""
-    _ = cache.get(item)
-    # silently ignore all exceptions
-    try:
-        # _[idx] = _[idx] + inc
-        _[idx] += inc
-    except Exception:
-        return
+try:
+    ATTEMPT_TIMEOUT = float(os.getenv("DXPOOL_ATTEMPT_TIMEOUT", ATTEMPT_TIMEOUT))
+except (TypeError, ValueError):
+    ...  # default 30 as above
 
-    loop = asyncio.get_running_loop()
-    await loop.run_in_executor(None, cache.set, item, _)
 
+class TranslationFailed:
+    """
+    Marker in place of the translation of a text the batch could not deliver.
+
+    Falsy, str() tells why: "translation failed (deadline, 3 attempts): ReadTimeout(...)"
+    """
+
+    __slots__ = ("reason", "attempts", "error")
+
+    def __init__(self, reason: str, attempts: int = 0, error: str = ""):
+        """
+        Init.
+
+        Args:
+        ----
+        reason: "deadline": out of time, "attempts": too many failed attempts,
+            "rejected": the deeplx said the request is bad (e.g. 400),
+            "worker error": every worker died, see the log
+        attempts: requests made for the text
+        error: the last error, if any
+
+        """
+        self.reason = reason
+        self.attempts = attempts
+        self.error = error
+
+    def __bool__(self):
+        """Return False, like a missing translation."""
+        return False
+
+    def __eq__(self, other):
+        """Compare fields."""
+        if not isinstance(other, TranslationFailed):
+            return NotImplemented
+        return (self.reason, self.attempts, self.error) == (
+            other.reason,
+            other.attempts,
+            other.error,
+        )
+
+    def __repr__(self):
+        """Show fields."""
+        return (
+            f"TranslationFailed({self.reason!r}, attempts={self.attempts}, "
+            f"error={self.error!r})"
+        )
+
+    def __str__(self):
+        """Return a line for the reader."""
+        _ = f"translation failed ({self.reason}, {self.attempts} attempts)"
+        return f"{_}: {self.error}" if self.error else _
+
+
+def dedup_texts(texts: List[str], normalize_ws: bool = False) -> Dict[int, List[int]]:
+    """
+    Group seqnos of identical texts.
+
+    Args:
+    ----
+    texts: list of text
+    normalize_ws: texts differing only in whitespace count as identical
+
+    Returns:
+    -------
+    seqno of the first occurrence -> seqnos of all occurrences, in order
+
+    """
+    firsts: Dict[str, int] = {}
+    groups: Dict[int, List[int]] = {}
+    for seqno, text in enumerate(texts):
+        key = " ".join(text.split()) if normalize_ws else text
+        first = firsts.setdefault(key, seqno)
+        groups.setdefault(first, []).append(seqno)
+    return groups
+
+
+class BatchJob:
+    """
+    State of one batch_deeplx_tr call, shared by its workers only.
+
+    Owns the work queue, the result queue, the completion counter, the
+    worker/url stats and the deadline, so concurrent batches in one process
+    do not see each other, and everything is released when the batch returns.
+    """
 
-async def worker(
-    queue, deq, wid=-1, queue_tr=asyncio.Queue()
-) -> List[List[Union[str, BaseException]]]:
+    def __init__(
+        self,
+        texts: Iterable[Tuple[int, str]],
+        selector: Selector,
+        timeout: Optional[float] = None,
+        source_lang: str = "",
+        target_lang: str = "",
+        tr_cache: Optional[TranslationCache] = None,
+        packer: Optional[Packer] = None,
+        hedge: Optional[HedgeBudget] = None,
+        retry_policy: Optional[RetryPolicy] = None,
+        concurrency: Optional[ConcurrencyController] = None,
+    ):
+        """
+        Init.
+
+        Args:
+        ----
+        texts: (seqno, text) to translate
+        selector: picks urls for all workers of the job
+        timeout: seconds for the whole job, default 30 per text
+        source_lang: passed on to deeplx_client_async
+        target_lang: passed on to deeplx_client_async
+        tr_cache: translations are stored there if not None
+        packer: turns texts into request units and back, one request per text if None
+        hedge: budget for hedged requests, no hedging if None
+        retry_policy: attempt cap and url backoff, a new RetryPolicy if None
+        concurrency: limits requests in flight, one per worker if None
+
+        """
+        if packer is None:
+            packer = Packer(budget=0, max_chars=0)
+        self.packer = packer
+
+        texts = list(texts)
+        self.texts = dict(texts)
+        self.n_texts = len(self.texts)
+
+        # queue items are (unit_id, text) from packer
+        self.queue: asyncio.Queue = asyncio.Queue()
+        for unit in packer.pack(texts):
+            self.queue.put_nowait(unit)  # attach unit id for retry
+        self.n_units = self.queue.qsize()
+
+        self.results: asyncio.Queue = asyncio.Queue()
+        self.n_done = 0  # results may be taken out of the queue as they come in
+        self.done = asyncio.Event()
+        self.selector = selector
+        self.metrics = MetricsRegistry()
+        self.source_lang = source_lang
+        self.target_lang = target_lang
+        self.tr_cache = tr_cache
+        self.hedge = hedge
+        self.retry_policy = RetryPolicy() if retry_policy is None else retry_policy
+        self.concurrency = concurrency
+
+        # seqno -> attempts made, last error
+        self.attempts: Counter = Counter()
+        self.errors: Dict[int, str] = {}
+        # unit_id -> failed attempts, the retry budget: pieces of a split
+        # text share its seqno, but each piece has its own budget
+        self.failed: Counter = Counter()
+
+        if timeout is None:
+            timeout = 30 * self.n_texts
+        self.set_deadline(timeout)
+
+    def set_deadline(self, timeout: float):
+        """Set the deadline timeout seconds from now."""
+        self.deadline = monotonic() + timeout
+        # a short batch may still start attempts close to its deadline
+        self.min_attempt_time = min(MIN_ATTEMPT_TIME, timeout / 10)
+
+    @property
+    def remaining(self) -> float:
+        """Return seconds left before the deadline, >= 0."""
+        return max(0.0, self.deadline - monotonic())
+
+    def retry(self, seqno: int, text: str):
+        """Put text back, an idle worker picks it up right away."""
+        self.queue.put_nowait((seqno, text))
+
+    def note_attempt(self, unit_id: int, error: str = ""):
+        """Count an attempt for the texts in unit_id, a failed one (error) also against its budget."""
+        if error:
+            self.failed[unit_id] += 1
+        for seqno in self.packer.seqnos(unit_id):
+            self.attempts[seqno] += 1
+            if error:
+                self.errors[seqno] = error
+
+    def failure(self, seqno: int, reason: str = "deadline") -> TranslationFailed:
+        """Return the marker for a text not done."""
+        return TranslationFailed(
+            reason, self.attempts[seqno], self.errors.get(seqno, "")
+        )
+
+    def exhausted(self, unit_id: int) -> bool:
+        """Return True if unit_id has used up its attempts, successes of other units do not count."""
+        return self.retry_policy.exhausted(self.failed[unit_id])
+
+    def put_failure(self, unit_id: int, reason: str):
+        """Give up on the texts of a unit, TranslationFailed markers as their results."""
+        finished = self.packer.drop(unit_id)
+        self.n_done += len(finished)
+        for seqno in finished:
+            self.results.put_nowait((seqno, self.failure(seqno, reason)))
+        if self.n_done >= self.n_texts:
+            self.done.set()
+
+    def put_result(self, unit_id: int, trtext: str):
+        """Store (and cache) translations of a unit, set done once all texts are in."""
+        finished, units = self.packer.unpack(unit_id, trtext)
+        for unit in units:
+            self.queue.put_nowait(unit)
+
+        self.n_done += len(finished)
+        for seqno, trtext_ in finished:
+            self.results.put_nowait((seqno, trtext_))
+            text = self.texts[seqno]
+            if self.tr_cache is not None and text.strip():
+                # memory now, disk in an executor
+                self.tr_cache.set(text, trtext_, self.source_lang, self.target_lang)
+        if self.n_done >= self.n_texts:
+            self.done.set()
+
+    def stop_workers(self, n_workers: int):
+        """Send one sentinel per worker."""
+        for _ in range(n_workers):
+            self.queue.put_nowait(None)
+
+    def drain_results(self) -> List[Tuple[int, str]]:
+        """Return and remove all translations."""
+        trtext_list = []
+        while not self.results.empty():
+            _ = self.results.get_nowait()
+            if _ is not None:  # see batch_deeplx_tr_stream's on_worker_done
+                trtext_list.append(_)
+        return trtext_list
+
+
+async def worker(job: BatchJob, wid=-1) -> List[List[Union[str, BaseException]]]:
     """
-    Translate text in the queue.
+    Translate text in the job's queue.
 
     Args:
     ----
-    queue: asyncio.Queue that contains list of texts
-    deq: collections.deque to hold deeplx urls
+    job: BatchJob with the queue of (unit_id, text) (None to stop the worker),
+        the selector shared by all workers and the result queue
     wid: identifier
-    queue_tr: common queue for all workers to store trtext and for stop condition
 
-    url: deeplx site's url from a deque
+    url: deeplx site's url picked by job.selector
 
     """
     # asign a random wid by default
     if wid < 0:
         randrange(1000)
+
+    queue, selector = job.queue, job.selector
     logger.trace(f"******** {wid=}")
     trtext_list = []
 
     # while not queue.empty():
     # try n times and break
     n_attempts = queue.qsize()
-    n_texts = n_attempts
 
     logger.trace(f"{n_attempts=} {wid=}")
 
@@ -144,81 +406,128 @@ async def worker(
         logger.trace(f" max attempts reached {wid=}")
     # """
 
-    then = monotonic()
     while True:
-        # test timeout realy exit
-        # if monotonic() - then > 1: break
+        # block until there is work, no polling: idle workers cost nothing
+        seqno_text = await queue.get()
+        logger.trace(f"{seqno_text=}")
 
-        # break based on len(trtext_list) and time
-        # if len(trtext_list) >= n_texts or monotonic() - then > 30 * n_texts:
-        if queue_tr.qsize() >= n_texts or monotonic() - then > 30 * n_texts:
+        # sentinel from batch_deeplx_tr, all done or out of time
+        if seqno_text is None:
+            queue.task_done()
             break
 
+        # there is no need for this 'if', but just to play safe
+        if len(seqno_text) == 2:
+            seqno, text = seqno_text
+        else:
+            text = str(seqno_text)
+            seqno = -1
+
+        # every url backing off after failures or out of rate limit tokens:
+        # wait for the first one to be back instead of hammering an
+        # overloaded pool (see retry_policy, rate_limit)
+        policy = job.retry_policy
+        wait = min(
+            (max(policy.wait_time([url]), LIMITER.wait_time(url)) for url in selector.stats),
+            default=0.0,
+        )
+        if wait > 0:
+            logger.trace(f"{wid=} all urls backing off, waiting {wait:.2f}s")
+            await asyncio.sleep(min(wait, job.remaining))
+
+        # a permit for the request, workers beyond the current limit wait
+        # here; given back in any case, also when cancelled at the deadline
+        concurrency = job.concurrency
+        if concurrency is not None:
+            await concurrency.acquire()
+        failed: Optional[bool] = None  # no verdict for the controller
+        started = monotonic()
         try:
-            seqno_text = queue.get_nowait()
-            logger.trace(f"{seqno_text=}")
-
-            # there is no need for this 'if', but just to play safe
-            if len(seqno_text) == 2:
-                seqno, text = seqno_text
-            else:
-                text = str(seqno_text)
-                seqno = -1
-        except asyncio.QueueEmpty:
-            # logger.info(f"Currently no items in the queue: {exc}")
-            await asyncio.sleep(0.1)
-            continue  # other worker may fail and put back items to the queue
-        except Exception as exc:
-            logger.warning(f"{exc=}")
-            raise
-
-        # process text, output from queue.get_nowait()
-        url = deq[-1]
-        deq.rotate()
-        logger.trace(f" deq rotated: {deq=}")
-        logger.trace(f" {url=}")
-        logger.trace(f" {text=}")
-
-        # httpx.HTTPStatusError
-        try:
+            # no time left for another attempt, the text ends up as TranslationFailed
+            remaining = job.remaining
+            if remaining < job.min_attempt_time:
+                logger.trace(f"{wid=} {seqno=} dropped, {remaining=:.2f}s")
+                queue.task_done()
+                continue
+
+            # process text, output from queue.get(), within what is left of the deadline
+            def call(url, text=text, timeout=min(ATTEMPT_TIMEOUT, remaining)):
+                return deeplx_client_async(
+                    text,
+                    source_lang=job.source_lang,
+                    target_lang=job.target_lang,
+                    url=url,
+                    timeout=timeout,
+                )
+
+            # empty trtext for a non-empty text counts as a failure
+            def is_ok(trtext, text=text):
+                return bool(trtext.strip() or not text.strip())
+
+            # the request goes through selector (acquire/release), a slow one
+            # is hedged on another url if job.hedge allows, urls backing off
+            # or rate limited are only used if there is no other
             logger.trace(f" try deeplx_client_async {text=} {wid=}")
-            trtext = await deeplx_client_async(text, url=url)
-            logger.trace(f" done deeplx_client_async {text=} {wid=}")
-        except Exception as exc:
-            logger.trace(f"{exc=}, {wid=}")
-            # raise
-            trtext = exc  # for retry in the subsequent round
+            avoid = policy.backing_off(selector.stats) + LIMITER.limited(selector.stats)
+            started = monotonic()
+            url, trtext = await hedged(call, selector, job.hedge, is_ok, avoid=avoid)
 
-            # optinally, remove url from DEQ since it does not deliver
-            try:
-                # DEQ.remove(url)
-                ...
-            except Exception:  # maybe another worker already did DEQ.remove(url)
-                ...
+            # only errors that may come from overload shrink the limit
+            if isinstance(trtext, BaseException):
+                failed = classify(trtext) == RETRYABLE or None
+            else:
+                failed = not is_ok(trtext)
         finally:
-            logger.trace(f" {trtext=}  {wid=} ")
-            queue.task_done()
-            logger.trace(f"\n\t >>====== que.task_done()  {wid=}")
-
-            # put text back in the queue if Exception
-            if isinstance(trtext, Exception):
-                logger.trace(f"{wid=} {seqno=} failed {trtext=}, back to the queue")
-                await queue.put((seqno, text))
-                await cache_incr("workers_fail", wid)
-                await asyncio.sleep(0.1)  # give other workers a chance to try
+            if concurrency is not None:
+                concurrency.release(monotonic() - started, failed)
+        logger.trace(f" done deeplx_client_async {text=} {url=} {wid=}")
+
+        logger.trace(f" {trtext=}  {wid=} ")
+        queue.task_done()
+        logger.trace(f"\n\t >>====== que.task_done()  {wid=}")
+
+        if isinstance(trtext, BaseException) and classify(trtext) == NOT_SENT:
+            # no rate limit token in time, nothing went out: no attempt used,
+            # the url is now avoided (or waited for if all are limited)
+            logger.trace(f"{wid=} {seqno=} {trtext}")
+            job.retry(seqno, text)
+            continue
+
+        if isinstance(trtext, BaseException) or not is_ok(trtext):
+            # exception, or text not empty but text.strip() empty
+            if isinstance(trtext, BaseException):
+                kind = policy.on_failure(url, trtext)
+                job.note_attempt(seqno, repr(trtext))
+                job.metrics.incr("workers_fail", wid)
+                job.metrics.incr("endpoints_fail", url)
             else:
-                # text not empty but text.strip() empty, try gain
-                if text.strip() and not trtext.strip():
-                    logger.trace(f"{wid=} {seqno=} empty trtext, back to the queue")
-                    # try again if trtext empty
-                    await queue.put((seqno, text))
-                    await cache_incr("workers_emp", wid)
-                    await asyncio.sleep(0.1)
-                else:
-                    logger.info(f"{wid=} {seqno=} done ")
-                    trtext_list.append((seqno, trtext))
-                    await queue_tr.put((seqno, trtext))
-                    await cache_incr("workers_succ", wid)
+                kind = policy.on_failure(url, None)
+                job.note_attempt(seqno, f"empty translation from {url}")
+                job.metrics.incr("workers_emp", wid)
+                job.metrics.incr("endpoints_emp", url)
+            logger.trace(f"{wid=} {seqno=} failed {trtext=}, {kind}")
+
+            if kind == NON_RETRYABLE:
+                # a pack: find out which text it is, one by one
+                units = job.packer.split(seqno)
+                for unit in units:
+                    job.queue.put_nowait(unit)
+                if not units:
+                    job.put_failure(seqno, "rejected")
+            elif job.exhausted(seqno):
+                job.put_failure(seqno, "attempts")
+            else:
+                # back to the queue, a blocked worker picks it up right away
+                # with another url (this one backs off)
+                job.retry(seqno, text)
+        else:
+            logger.info(f"{wid=} {seqno=} done ")
+            policy.on_success(url)
+            trtext_list.append((seqno, trtext))
+            job.note_attempt(seqno)
+            job.put_result(seqno, trtext)
+            job.metrics.incr("workers_succ", wid)
+            job.metrics.incr("endpoints_succ", url)
 
     logger.trace(f"\n\t {trtext_list=}, {wid=} fini")
 
@@ -226,47 +535,190 @@ async def worker(
 
 
 async def batch_deeplx_tr(
-    texts: List[str], n_workers: int = 4
-) -> List[Tuple[int, str]]:
+    texts: List[str],
+    n_workers: Union[int, ConcurrencyController, None] = None,
+    selector: Union[str, Selector, None] = None,
+    breakers: Optional[CircuitBreakerBoard] = None,
+    timeout: Optional[float] = None,
+    source_lang: str = "",
+    target_lang: str = "",
+    tr_cache: Union[TranslationCache, bool, None] = True,
+    dedup: bool = True,
+    normalize_ws: bool = False,
+    pack: Union[bool, Packer] = True,
+    hedge: Union[bool, HedgeBudget] = HEDGE,
+    retry_policy: Optional[RetryPolicy] = None,
+) -> List[Tuple[int, Union[str, TranslationFailed]]]:
     """
-    Translate in batch using urls from deq.
+    Translate in batch using urls from DEQ.
 
     Args:
     ----
         texts: list of text to translate
-        n_workers: number of workers
+        n_workers: None (default) to adapt the requests in flight to the pool,
+            starting at one per url in DEQ (see concurrency), a
+            ConcurrencyController to carry its limit over to the next batch,
+            or a fixed number of workers (0: one per text, < 0: one per two)
+        selector: policy name in endpoint_selector.SELECTORS (default env DXPOOL_SELECTOR or p2c)
+            or a Selector instance, shared by all workers
+        breakers: circuit breakers for a new selector, a fresh board per batch if None,
+            pass a long-lived one to share it between batches or to monitor it
+        timeout: seconds for the whole batch, default ATTEMPT_TIMEOUT per request
+            per worker (the starting limit if adaptive) plus one spare, also
+            bounds each request
+        source_lang: source language, deeplx_client_async's default if empty
+        target_lang: target language, deeplx_client_async's default if empty
+        tr_cache: True for tr_cache.TR_CACHE, a TranslationCache, False/None for no cache
+        dedup: translate identical texts once, the translation goes to all their seqnos
+        normalize_ws: with dedup, texts differing only in whitespace count as identical,
+            the first occurrence is translated
+        pack: True to pack short texts and split long ones with packing's defaults,
+            a Packer for other budgets, False for one request per text
+        hedge: True to send a request slower than its url's p95 once more to
+            another url, within hedge's default budget (about 5% extra requests),
+            a HedgeBudget for another budget, False for no hedging,
+            default env DXPOOL_HEDGE or False
+        retry_policy: attempt cap per text and url backoff, a new
+            retry_policy.RetryPolicy per batch if None, pass a long-lived one
+            to carry url backoff over to the next batch
 
     Returns:
     -------
-        list of translated texts
+        list of (seqno, trtext), in order of completion, a TranslationFailed
+        marker (falsy) as trtext for each text not done in time
 
     refer to python's official doc's example and asyncio-Queue-consumer.txt.
 
     """
-    # logger.trace(f"{texts=}")
-    # logger.trace(y(texts))
+    return [
+        seqno_trtext
+        async for seqno_trtext in batch_deeplx_tr_stream(
+            texts,
+            n_workers=n_workers,
+            selector=selector,
+            breakers=breakers,
+            timeout=timeout,
+            source_lang=source_lang,
+            target_lang=target_lang,
+            tr_cache=tr_cache,
+            dedup=dedup,
+            normalize_ws=normalize_ws,
+            pack=pack,
+            hedge=hedge,
+            retry_policy=retry_policy,
+        )
+    ]
+
+
+async def batch_deeplx_tr_stream(
+    texts: List[str],
+    n_workers: Union[int, ConcurrencyController, None] = None,
+    selector: Union[str, Selector, None] = None,
+    breakers: Optional[CircuitBreakerBoard] = None,
+    timeout: Optional[float] = None,
+    source_lang: str = "",
+    target_lang: str = "",
+    tr_cache: Union[TranslationCache, bool, None] = True,
+    dedup: bool = True,
+    normalize_ws: bool = False,
+    pack: Union[bool, Packer] = True,
+    hedge: Union[bool, HedgeBudget] = HEDGE,
+    retry_policy: Optional[RetryPolicy] = None,
+    ordered: bool = False,
+) -> AsyncIterator[Tuple[int, Union[str, TranslationFailed]]]:
+    """
+    Translate in batch using urls from DEQ, yield (seqno, trtext) as they are done.
 
-    try:
-        n_workers = int(n_workers)
-    except Exception:
-        n_workers = 4
-    if n_workers == 0:
-        n_workers = len(texts)
-    elif n_workers < 0:
-        n_workers = len(texts) // 2
+    Args:
+    ----
+        ordered: yield in seqno order, each time the longest ready prefix,
+            texts not done in time as TranslationFailed in their place
+        the rest as in batch_deeplx_tr
 
-    # cap to len(texts)
-    n_workers = min(n_workers, len(texts))
+    async for seqno, trtext in batch_deeplx_tr_stream(texts, ordered=True):
+        print(seqno, trtext)
 
-    logger.info(f"{n_workers=}")
+    Closing the generator early (break, aclose) cancels the workers.
 
-    logger.debug(y(n_workers))
+    """
+    # logger.trace(f"{texts=}")
+    # logger.trace(y(texts))
 
-    que = asyncio.Queue()
-    for idx, text in enumerate(texts):
-        await que.put((idx, text))  # attach seq no for retry
+    if not texts:
+        return
 
-    logger.trace(f"{que=}")
+    # seqno of first occurrence -> all seqnos of the same text
+    if dedup:
+        groups = dedup_texts(texts, normalize_ws)
+        if len(groups) < len(texts):
+            logger.info(f"dedup: {len(texts)} texts, {len(groups)} unique")
+    else:
+        groups = {seqno: [seqno] for seqno in range(len(texts))}
+
+    # cache hits are done, only misses go to the workers
+    if tr_cache is True:
+        tr_cache = TR_CACHE
+    elif not isinstance(tr_cache, TranslationCache):
+        tr_cache = None
+
+    # one lookup for all, the disk tier (if any) in an executor
+    if tr_cache is not None:
+        cached = await tr_cache.aget_many(
+            [texts[seqno] for seqno in groups], source_lang, target_lang
+        )
+    else:
+        cached = [None] * len(groups)
+
+    trtext_cached = []
+    texts_todo = []
+    for seqno, trtext in zip(groups, cached):
+        text = texts[seqno]
+        if trtext is None:
+            texts_todo.append((seqno, text))
+        else:
+            trtext_cached.append((seqno, trtext))
+
+    if tr_cache is not None:
+        logger.info(
+            f"tr_cache: {len(trtext_cached)} of {len(groups)} cached, {tr_cache.stats()}"
+        )
+
+    # ordered: seqno -> trtext waiting for its turn
+    pending: Dict[int, str] = {}
+    next_seqno = 0
+
+    def ready(seqno_trtext: List[Tuple[int, str]]) -> List[Tuple[int, str]]:
+        """Return what can be yielded now."""
+        nonlocal next_seqno
+        if not ordered:
+            return seqno_trtext
+        pending.update(seqno_trtext)
+        _ = []
+        while next_seqno in pending:
+            _.append((next_seqno, pending.pop(next_seqno)))
+            next_seqno += 1
+        return _
+
+    for seqno_trtext in ready(fan_out(trtext_cached, groups)):
+        yield seqno_trtext
+
+    if not texts_todo:
+        return
+
+    controller = None
+    if n_workers is None or isinstance(n_workers, ConcurrencyController):
+        controller = n_workers
+    else:
+        try:
+            n_workers = int(n_workers)
+        except Exception:
+            n_workers = 4
+        if n_workers == 0:
+            n_workers = len(texts)
+        elif n_workers < 0:
+            n_workers = len(texts) // 2
+
+        logger.debug(y(n_workers))
 
     # n_workers = 2
     # n_workers = 20
@@ -275,55 +727,163 @@ async def batch_deeplx_tr(
     # does not run, must wrap in with asyncio.create_task
     # tasks = [worker(que, DEQ, _) for _ in range(n_workers)]
 
-    # collect stats about workers
-    # cache.set('workers_succ')
-    # cache.set('workers_fail')
-    # cache.set('workers_emp')
-    cache.set("workers_succ", [0] * n_workers)
-    cache.set("workers_fail", [0] * n_workers)
-    cache.set("workers_emp", [0] * n_workers)
-
-    tasks = [asyncio.create_task(worker(que, DEQ, _)) for _ in range(n_workers)]
-
-    # no longer needed since we exit only when len(trtexts) >= len(texts) or timeout
-    # await que.join()  # queue.task_done() for each task to properly exit
-
-    logger.trace("\n\t  >>>>>>>> after  await que.join()")
-
-    # give the last task some time, no need since we monitor tretxt_list
-    # await asyncio.sleep(.1)
-
-    # Cancel our worker tasks, do we need this?
-    # for task in tasks: task.cancel()
-
-    logger.trace("\n\t >>>>>>>> Start await asyncio.gather")
-
-    # consume texts_list in an async way
-    # trtext_list = await asyncio.gather(*coros, return_exceptions=True)
-
-    # trtext_list = await asyncio.gather(*tasks, return_exceptions=True)
-    trtext_list = await asyncio.gather(*tasks)
-
-    logger.trace("\n\t  >>>>>>>> Done await asyncio.gather")
-
-    # print(trtext_list[:3])
-
-    logger.trace(f"{trtext_list=}")
-    # return trtext_list
-
-    # trtext_list can be asyncio.CancelledError in which case
+    # probe latencies as priors, live outcomes take over from there
+    if not isinstance(selector, Selector):
+        if breakers is None:
+            breakers = CircuitBreakerBoard()
+        # sqlite read in a thread, not on the loop
+        sites = dict(await asyncio.to_thread(cache.get, "deeplx-sites") or [])  # type: ignore
+        selector = make_selector(
+            selector, [(url, sites.get(url)) for url in DEQ], breakers
+        )
+    logger.info(f"selector: {selector.name}, {len(selector)} urls")
+    if not len(selector):  # pylint: disable=use-implicit-booleaness-not-len
+        # workers would fail on their first text, the batch wait out its deadline
+        raise LookupError("no deeplx url available")
+
+    # adaptive: as many workers as the limit may grow to, the controller
+    # decides how many of them have a request in flight
+    if n_workers is None:
+        controller = ConcurrencyController.for_pool(len(selector), CONCURRENCY_LIMIT)
+    if controller is not None:
+        n_workers = controller.max_limit
+        logger.info(f"concurrency: {controller.snapshot()}")
+
+    if pack is True:
+        pack = Packer()
+    packer = pack if isinstance(pack, Packer) else None
+
+    if hedge is True:
+        hedge = HedgeBudget()
+    budget = hedge if isinstance(hedge, HedgeBudget) else None
+
+    # one job per call: own queues, counter and deadline
+    job = BatchJob(
+        texts_todo,
+        selector,
+        timeout,
+        source_lang,
+        target_lang,
+        tr_cache,
+        packer,
+        budget,
+        retry_policy,
+        controller,
+    )
+    if job.n_units != job.n_texts:
+        logger.info(f"packing: {job.n_texts} texts in {job.n_units} requests")
+
+    # cap to number of requests
+    n_workers = max(1, min(n_workers, job.n_units))  # type: ignore
+    logger.info(f"{n_workers=}")
 
-    trtext_list1 = []
-    for _ in trtext_list:
-        trtext_list1.extend(_)  # type: ignore
+    # each worker's share of requests, one attempt each, plus one spare round
+    if timeout is None:
+        in_flight = n_workers if controller is None else min(n_workers, controller.permits)
+        timeout = ATTEMPT_TIMEOUT * (ceil(job.n_units / in_flight) + 1)
+        job.set_deadline(timeout)
+    logger.info(f"deadline in {timeout:.0f}s")
+
+    # stats about workers/urls in memory, to cache every FLUSH_INTERVAL and at the end
+    flusher = asyncio.create_task(job.metrics.periodic_flush())
+
+    # workers block on job.queue.get(), the last successful one sets job.done
+    tasks = [asyncio.create_task(worker(job, _)) for _ in range(n_workers)]
+    crashed = []
+
+    def on_worker_done(task: asyncio.Task):
+        # a worker that dies (a bug, not a failed request) is logged, and once
+        # none is left the batch ends right away instead of at its deadline
+        if task.cancelled():
+            return
+        exc = task.exception()
+        if exc is not None:
+            crashed.append(exc)
+            logger.opt(exception=exc).error(f"worker failed: {exc!r}")
+        if all(_.done() for _ in tasks) and job.n_done < job.n_texts:
+            job.done.set()
+            job.results.put_nowait(None)
+
+    for task in tasks:
+        task.add_done_callback(on_worker_done)
+
+    # yield results as they come in, caller may write them out right away
+    finished = False
+    taken = set()  # first seqnos done
+    try:
+        while len(taken) < job.n_texts:
+            try:
+                seqno_trtext = await asyncio.wait_for(job.results.get(), job.remaining)
+            except asyncio.TimeoutError:
+                logger.warning(
+                    f"timeout, {job.n_done} of {job.n_texts} texts translated"
+                )
+                break
+            if seqno_trtext is None:  # no worker left
+                logger.error(
+                    f"all workers failed, {job.n_done} of {job.n_texts} texts translated"
+                )
+                break
+            taken.add(seqno_trtext[0])
+            for elm in ready(fan_out([seqno_trtext], groups)):
+                yield elm
+        else:
+            finished = True
+    finally:
+        if finished:
+            # one sentinel per worker, they exit once the queue is drained
+            job.stop_workers(len(tasks))
+        else:  # out of time or closed by the consumer
+            for task in tasks:
+                task.cancel()
+
+        logger.trace("\n\t >>>>>>>> Start await asyncio.gather")
+
+        # workers cancelled return CancelledError, results are in job
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+        logger.trace("\n\t  >>>>>>>> Done await asyncio.gather")
+
+        flusher.cancel()
+        await job.metrics.aflush()
+
+        succ = job.metrics.get("workers_succ")
+        logger.info(f"""success\n\t {dict(succ)}, {sum(succ.values())}""")
+        logger.info(f"""failure\n\t {dict(job.metrics.get("workers_fail"))}""")
+        logger.info(f"""empty\n\t {dict(job.metrics.get("workers_emp"))}""")
+        if budget is not None:
+            logger.info(f"hedge: {budget.snapshot()}")
+        if controller is not None:
+            logger.info(f"concurrency: {controller.snapshot()}")
+        if selector.breakers is not None:
+            _ = selector.breakers.snapshot()
+            _ = {url: elm for url, elm in _.items() if elm["state"] != "closed"}
+            logger.info(f"""breakers not closed\n\t {_}""")
+
+    # out of time: what came in while stopping, markers for the rest,
+    # then what ordered still holds
+    trtext_list1 = job.drain_results()
     logger.trace(f"{trtext_list1=}")
-
-    succ = cache.get("workers_succ")
-    logger.info(f"""success\n\t {succ}, {sum(succ)}""")
-    logger.info(f"""failure\n\t {cache.get("workers_fail")}""")
-    logger.info(f"""empty\n\t {cache.get("workers_emp")}""")
-
-    return trtext_list1
+    taken.update(seqno for seqno, _ in trtext_list1)
+    reason = "worker error" if crashed and all(_.done() for _ in tasks) else "deadline"
+    failed = [
+        (seqno, job.failure(seqno, reason)) for seqno, _ in texts_todo if seqno not in taken
+    ]
+    if failed:
+        logger.warning(f"{len(failed)} of {job.n_texts} texts not translated ({reason})")
+    for elm in ready(fan_out(trtext_list1 + failed, groups)):  # type: ignore
+        yield elm
+    for seqno in sorted(pending):
+        yield seqno, pending.pop(seqno)
+
+
+def fan_out(
+    trtext_list: List[Tuple[int, str]], groups: Dict[int, List[int]]
+) -> List[Tuple[int, str]]:
+    """Copy the translation of each first occurrence to all seqnos of its group."""
+    return [
+        (seqno, trtext) for first, trtext in trtext_list for seqno in groups[first]
+    ]
 
 
 if __name__ == "__main__":
@@ -30,8 +30,9 @@ filter invalid
 
 # pylint: disable=invalid-name, broad-except, broad-exception-raised
 # from about_time import about_time
+import ssl
 from time import time
-from typing import Tuple, Union
+from typing import Optional, Tuple, Union
 
 import aiohttp
 import httpx
@@ -40,6 +41,56 @@ from loguru import logger
 
 data = {"text": "Hello, world!", "source_lang": "EN", "target_lang": "ZH"}
 
+# limits for the long-lived probe clients, see make_probe_client
+# httpcore's pool scans all its connections for every request, so a single
+# client with a big pool costs more cpu than it saves: keep pools small and
+# give each probe slot its own client instead (bench_check_deeplx.py)
+PROBE_MAX_CONNECTIONS = 1
+PROBE_MAX_KEEPALIVE = 1
+PROBE_KEEPALIVE_EXPIRY = 30.0
+
+
+def make_probe_ssl_context() -> ssl.SSLContext:
+    """Return an unverified ssl context, to be shared by all probe clients."""
+    ctx = ssl.create_default_context()
+    ctx.check_hostname = False
+    ctx.verify_mode = ssl.CERT_NONE
+    return ctx
+
+
+def make_probe_client(
+    max_connections: int = PROBE_MAX_CONNECTIONS,
+    max_keepalive_connections: int = PROBE_MAX_KEEPALIVE,
+    keepalive_expiry: float = PROBE_KEEPALIVE_EXPIRY,
+    ssl_context: Optional[ssl.SSLContext] = None,
+) -> httpx.AsyncClient:
+    """
+    Create a long-lived client to be reused by probes of a refresh cycle.
+
+    One connection pool, one SSL context, instead of one of each per url.
+    The caller owns the client and must await client.aclose() when done.
+
+    Args:
+    ----
+      max_connections: max number of open connections
+      max_keepalive_connections: max number of idle connections kept alive
+      keepalive_expiry: seconds an idle connection is kept
+      ssl_context: ssl context to share among clients, a new unverified one if None
+
+    Returns:
+    -------
+      httpx.AsyncClient with the given limits, certificates not verified
+
+    """
+    limits = httpx.Limits(
+        max_connections=max_connections,
+        max_keepalive_connections=max_keepalive_connections,
+        keepalive_expiry=keepalive_expiry,
+    )
+    if ssl_context is None:
+        ssl_context = make_probe_ssl_context()
+    return httpx.AsyncClient(verify=ssl_context, limits=limits)
+
 
 def check_deeplx(
     url: str, timeout: Union[float, Timeout] = Timeout(6)
@@ -82,7 +133,9 @@ def check_deeplx(
 
 
 async def check_deeplx_async(
-    url: str, timeout: Union[float, Timeout] = Timeout(10)
+    url: str,
+    timeout: Union[float, Timeout] = Timeout(10),
+    client: Optional[httpx.AsyncClient] = None,
 ) -> Tuple[str, Union[float, str]]:
     """
     Check url for valid deeplx service with async.
@@ -91,6 +144,7 @@ async def check_deeplx_async(
     ----
       url: dest url to check, must be a legit URL
       timeout: float or httpx.Timeout, default Timeout(10)
+      client: shared client (e.g. from make_probe_client), a new one per call if None
 
     Returns:
     -------
@@ -102,13 +156,20 @@ async def check_deeplx_async(
         # with about_time() as atime:
         then = time()
         # _ = httpx.post(f'{url}/translate', json=data)
-        async with httpx.AsyncClient(verify=False) as client:
+        if client is None:
+            async with httpx.AsyncClient(verify=False) as client_:
+                _ = await client_.post(
+                    f"{url}/translate",
+                    json=data,
+                    timeout=timeout,
+                )
+        else:
             _ = await client.post(
                 f"{url}/translate",
                 json=data,
                 timeout=timeout,
             )
-            _.raise_for_status()
+        _.raise_for_status()
         check = "世界" in _.text or "你好" in _.text
         if not check:
             raise Exception(f"{url}/translate returns {_.text=}")
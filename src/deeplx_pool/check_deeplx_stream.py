@@ -0,0 +1,208 @@
+"""
+Check many urls with a bounded number of probes in flight.
+
+asyncio.gather(*map(check_deeplx_async, url_list)) fires every probe at once,
+for a few thousand urls that means a few thousand sockets/TLS handshakes
+at the same time. check_deeplx_stream keeps at most `concurrency` probes
+in flight, stops at a global deadline and yields (url, latency_or_error)
+as soon as each probe finishes.
+
+async for url, latency_or_error in check_deeplx_stream(url_list, concurrency=64):
+    if isinstance(latency_or_error, float):
+        ...  # healthy, use it right away
+
+urls may also be an async iterable, e.g. urls coming in from discovery
+sources one after another: probes start with the first url.
+
+By default each probe slot keeps one long-lived httpx.AsyncClient
+(check_deeplx.make_probe_client) for the whole run and all of them share one
+ssl context, see bench_check_deeplx.py for the numbers.
+"""
+# pylint: disable=broad-exception-caught, too-many-arguments
+
+import asyncio
+import os
+from collections.abc import Sized
+from time import monotonic
+from typing import (
+    AsyncIterable,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Iterable,
+    List,
+    Optional,
+    Tuple,
+    Union,
+)
+
+import httpx
+from httpx import Timeout
+from loguru import logger
+
+from deeplx_pool.check_deeplx import (
+    check_deeplx_async,
+    make_probe_client,
+    make_probe_ssl_context,
+)
+
+# max number of probes in flight, env var DXPOOL_CHECK_CONCURRENCY
+CHECK_CONCURRENCY = 128
+try:
+    CHECK_CONCURRENCY = int(os.getenv("DXPOOL_CHECK_CONCURRENCY", CHECK_CONCURRENCY))
+except (TypeError, ValueError):
+    ...  # default 128 as above
+if CHECK_CONCURRENCY < 1:
+    CHECK_CONCURRENCY = 128
+
+# global deadline in seconds for a whole run, env var DXPOOL_CHECK_DEADLINE
+CHECK_DEADLINE = 300.0
+try:
+    CHECK_DEADLINE = float(os.getenv("DXPOOL_CHECK_DEADLINE", CHECK_DEADLINE))
+except (TypeError, ValueError):
+    ...  # default 300 as above
+
+_DONE = object()  # sentinel: a probe worker ran out of urls
+
+Checker = Callable[..., Awaitable[Tuple[str, Union[float, str]]]]
+
+
+async def check_deeplx_stream(
+    urls: Union[Iterable[str], AsyncIterable[str]],
+    concurrency: int = CHECK_CONCURRENCY,
+    deadline: Union[float, None] = CHECK_DEADLINE,
+    timeout: Union[float, Timeout] = Timeout(10),
+    checker: Checker = check_deeplx_async,
+    client: Optional[httpx.AsyncClient] = None,
+    reuse_clients: bool = True,
+) -> AsyncIterator[Tuple[str, Union[float, str]]]:
+    """
+    Check urls with at most concurrency probes in flight, yield results as they come.
+
+    Args:
+    ----
+      urls: urls to check, any iterable or async iterable (consumed lazily)
+      concurrency: max number of probes in flight, default CHECK_CONCURRENCY
+      deadline: seconds for the whole run, None for no deadline
+      timeout: per-probe timeout handed to checker
+      checker: coroutine function url -> (url, latency_or_error), default check_deeplx_async
+      client: client handed to checker for every probe, caller keeps ownership
+      reuse_clients: if client is None, give each probe slot a long-lived client
+        for the whole run (closed at the end), otherwise checker makes its own per probe
+
+    Yields:
+    ------
+      (url, latency in second) or (url, error message) in completion order,
+      urls still unchecked when the deadline expires are not yielded
+
+    """
+    try:
+        concurrency = max(1, int(concurrency))
+    except (TypeError, ValueError):
+        concurrency = CHECK_CONCURRENCY
+    if isinstance(urls, Sized):
+        concurrency = max(1, min(concurrency, len(urls)))
+
+    results: asyncio.Queue = asyncio.Queue()
+
+    # an async iterable cannot be shared by workers directly: a feeder task
+    # moves its urls to a queue, None (one per worker) ends it
+    url_queue: Optional[asyncio.Queue] = None
+    feeder = None
+    if isinstance(urls, AsyncIterable):
+        url_queue = asyncio.Queue(maxsize=concurrency)
+
+        async def feed():
+            try:
+                async for url in urls:  # type: ignore
+                    await url_queue.put(url)  # type: ignore
+            except Exception as exc:
+                logger.error(f"check_deeplx_stream: url source failed: {exc}")
+            # not reached when cancelled, nobody would take them
+            for _ in range(concurrency):
+                await url_queue.put(None)  # type: ignore
+
+        async def url_gen():
+            while (url := await url_queue.get()) is not None:  # type: ignore
+                yield url
+
+        feeder = asyncio.create_task(feed())
+    else:
+        url_iter = iter(urls)  # shared by all probe workers
+
+    own_clients = []
+    if client is None and reuse_clients:
+        ssl_context = make_probe_ssl_context()
+        own_clients = [
+            make_probe_client(ssl_context=ssl_context) for _ in range(concurrency)
+        ]
+
+    async def probe(idx):
+        kwargs = {"timeout": timeout}
+        if own_clients:
+            kwargs["client"] = own_clients[idx]
+        elif client is not None:
+            kwargs["client"] = client
+        async for url in url_gen() if url_queue is not None else _aiter(url_iter):
+            try:
+                res = await checker(url, **kwargs)
+            except Exception as exc:
+                res = url, str(exc)[:70]
+            await results.put(res)
+        await results.put(_DONE)
+
+    then = monotonic()
+    tasks = [asyncio.create_task(probe(_)) for _ in range(concurrency)]
+    n_running = len(tasks)
+    count = 0
+    try:
+        while n_running:
+            remaining = None
+            if deadline is not None:
+                remaining = max(0, deadline - (monotonic() - then))
+            try:
+                item = await asyncio.wait_for(results.get(), remaining)
+            except asyncio.TimeoutError:
+                logger.warning(
+                    f"check_deeplx_stream: deadline {deadline}s reached "
+                    f"after {count} urls, the rest are dropped"
+                )
+                break
+
+            if item is _DONE:
+                n_running -= 1
+                continue
+
+            count += 1
+            yield item
+    finally:
+        if feeder is not None:
+            tasks.append(feeder)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await asyncio.gather(*[_.aclose() for _ in own_clients])
+
+
+async def _aiter(iterable: Iterable[str]) -> AsyncIterator[str]:
+    for elm in iterable:
+        yield elm
+
+
+async def check_deeplx_bounded(
+    urls: Union[Iterable[str], AsyncIterable[str]], **kwargs
+) -> List[Tuple[str, Union[float, str]]]:
+    """
+    Collect check_deeplx_stream into a list, drop-in for asyncio.gather(*map(check_deeplx_async, urls)).
+
+    Args:
+    ----
+      urls: urls to check
+      kwargs: passed on to check_deeplx_stream
+
+    Returns:
+    -------
+      list of (url, latency_or_error) in completion order
+
+    """
+    return [_ async for _ in check_deeplx_stream(urls, **kwargs)]
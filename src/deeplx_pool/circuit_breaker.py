@@ -0,0 +1,184 @@
+"""
+Per-url circuit breaker, shared by all workers of a batch.
+
+closed -> open: failure rate over the last WINDOW calls >= FAILURE_RATE
+    (at least MIN_CALLS calls)
+open -> half_open: after cooldown seconds, let HALF_OPEN_CALLS trial calls through
+half_open -> closed: a trial call succeeds
+half_open -> open: a trial call fails, cooldown doubled (up to MAX_COOLDOWN)
+
+breakers = CircuitBreakerBoard()
+if breakers.available(url):
+    breakers.acquire(url)
+    ...
+    breakers.record(url, ok)
+
+breakers.snapshot()
+{'http://a': {'state': 'open', 'failure_rate': 0.8, 'calls': 10, 'retry_in': 21.3}, ...}
+"""
+
+from collections import deque
+from time import monotonic
+from typing import Dict, List
+
+from loguru import logger
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+FAILURE_RATE = 0.5  # open at 50% failures
+WINDOW = 20  # over the last 20 calls
+MIN_CALLS = 4  # but not before 4 calls
+COOLDOWN = 30.0  # seconds before the first trial call
+MAX_COOLDOWN = 600.0
+HALF_OPEN_CALLS = 1  # trial calls in flight while half open
+
+
+class CircuitBreaker:
+    """Circuit breaker of one url."""
+
+    def __init__(
+        self,
+        url: str = "",
+        failure_rate: float = FAILURE_RATE,
+        window: int = WINDOW,
+        min_calls: int = MIN_CALLS,
+        cooldown: float = COOLDOWN,
+        max_cooldown: float = MAX_COOLDOWN,
+        half_open_calls: int = HALF_OPEN_CALLS,
+    ):  # pylint: disable=too-many-arguments
+        """Init, closed."""
+        self.url = url
+        self.failure_rate_max = failure_rate
+        self.min_calls = min_calls
+        self.base_cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.half_open_calls = half_open_calls
+
+        self.outcomes: deque = deque(maxlen=window)  # True for ok
+        self.cooldown = cooldown
+        self.opened_at = 0.0
+        self.trials = 0  # trial calls in flight while half open
+        self._state = CLOSED
+
+    @property
+    def state(self) -> str:
+        """Return current state, open turns half_open once the cooldown is over."""
+        if self._state == OPEN and monotonic() - self.opened_at >= self.cooldown:
+            self._state = HALF_OPEN
+            self.trials = 0
+        return self._state
+
+    @property
+    def failure_rate(self) -> float:
+        """Return failure rate over the window."""
+        if not self.outcomes:
+            return 0.0
+        return 1 - sum(self.outcomes) / len(self.outcomes)
+
+    def available(self) -> bool:
+        """Return True if a call may go through, does not count the call."""
+        state = self.state
+        if state == CLOSED:
+            return True
+        if state == HALF_OPEN:
+            return self.trials < self.half_open_calls
+        return False
+
+    def acquire(self):
+        """Count a call that is about to start."""
+        if self.state == HALF_OPEN:
+            self.trials += 1
+
+    def cancel(self):
+        """Forget a call given up on (e.g. the loser of a hedge), no outcome recorded."""
+        if self.state == HALF_OPEN:
+            self.trials = max(0, self.trials - 1)
+
+    def record(self, ok: bool):
+        """Record the outcome of a call."""
+        state = self.state
+        if state == HALF_OPEN:
+            self.trials = max(0, self.trials - 1)
+            if ok:
+                self.close()
+            else:
+                self.open(min(self.cooldown * 2, self.max_cooldown))
+            return
+
+        self.outcomes.append(bool(ok))
+        if (
+            state == CLOSED
+            and len(self.outcomes) >= self.min_calls
+            and self.failure_rate >= self.failure_rate_max
+        ):
+            self.open(self.base_cooldown)
+
+    def open(self, cooldown: float):
+        """Trip the breaker."""
+        logger.info(f"circuit open: {self.url} for {cooldown:.0f}s")
+        self._state = OPEN
+        self.opened_at = monotonic()
+        self.cooldown = cooldown
+
+    def close(self):
+        """Reset the breaker."""
+        logger.info(f"circuit closed: {self.url}")
+        self._state = CLOSED
+        self.outcomes.clear()
+        self.cooldown = self.base_cooldown
+        self.trials = 0
+
+    def snapshot(self) -> dict:
+        """Return state for monitoring."""
+        state = self.state
+        retry_in = 0.0
+        if state == OPEN:
+            retry_in = round(self.cooldown - (monotonic() - self.opened_at), 1)
+        return {
+            "state": state,
+            "failure_rate": round(self.failure_rate, 2),
+            "calls": len(self.outcomes),
+            "retry_in": retry_in,
+        }
+
+
+class CircuitBreakerBoard:
+    """Circuit breakers by url, created on first use."""
+
+    def __init__(self, **kwargs):
+        """Init, kwargs are passed on to each CircuitBreaker."""
+        self.kwargs = kwargs
+        self.breakers: Dict[str, CircuitBreaker] = {}
+
+    def get(self, url: str) -> CircuitBreaker:
+        """Return breaker of url."""
+        if url not in self.breakers:
+            self.breakers[url] = CircuitBreaker(url, **self.kwargs)
+        return self.breakers[url]
+
+    def available(self, url: str) -> bool:
+        """Return True if a call to url may go through."""
+        breaker = self.breakers.get(url)
+        return breaker is None or breaker.available()
+
+    def acquire(self, url: str):
+        """Count a call to url that is about to start."""
+        self.get(url).acquire()
+
+    def record(self, url: str, ok: bool):
+        """Record the outcome of a call to url."""
+        self.get(url).record(ok)
+
+    def cancel(self, url: str):
+        """Forget a call to url given up on."""
+        self.get(url).cancel()
+
+    def open_urls(self) -> List[str]:
+        """Return urls not closed."""
+        return [url for url, elm in self.breakers.items() if elm.state != CLOSED]
+
+    def snapshot(self) -> Dict[str, dict]:
+        """Return url -> breaker state, for monitoring."""
+        return {url: elm.snapshot() for url, elm in self.breakers.items()}
@@ -0,0 +1,230 @@
+"""
+Adaptive limit on requests in flight, from measured throughput, latency and errors.
+
+controller = ConcurrencyController.for_pool(len(DEQ))
+await controller.acquire()  # waits while limit requests are in flight
+...  # the request
+controller.release(latency, failed)  # failed: an error that points to overload
+
+controller.snapshot()
+{'limit': 24.0, 'in_flight': 24, 'max_limit': 116, 'slow_start': False, ...}
+
+The limit is adjusted once per round, a round being as many completed
+requests as the limit (at least MIN_ROUND):
+    more than ERROR_RATE of them failed (timeouts, 429, 5xx, empty
+        translations): the limit drops to DECREASE times itself
+    their median latency is more than LATENCY_TOLERANCE times the lowest
+        median seen: the same, the pool queues up
+    the limit was not reached in the round (the batch runs dry): no change
+    slow start: the limit doubles as long as throughput grows by more than
+        GAIN per round, once it does not, back to the last limit that paid off
+    then: +1 per round as long as throughput does not fall by more than GAIN
+
+The start is the pool size (one request per url, what the hand-tuned runs
+in run_batch_deeplx_tr.py found best for a few dozen paragraphs), the cap
+PER_URL requests per url.
+
+env vars: DXPOOL_PER_URL_CONCURRENCY (default 4), DXPOOL_ERROR_RATE (default 0.2)
+"""
+
+import asyncio
+import os
+from collections import deque
+from time import monotonic
+from typing import List, Optional
+
+from loguru import logger
+
+from deeplx_pool.latency_stats import quantile
+
+MIN_LIMIT = 1
+PER_URL = 4  # requests in flight per url at most
+MIN_ROUND = 4  # requests per adjustment at least
+DECREASE = 0.7  # limit factor on overload
+ERROR_RATE = 0.2  # failed share of a round that counts as overload
+LATENCY_TOLERANCE = 2.0  # median latency over the lowest seen that counts as overload
+GAIN = 0.1  # throughput change per round that counts
+
+try:
+    PER_URL = int(os.getenv("DXPOOL_PER_URL_CONCURRENCY", PER_URL))
+except (TypeError, ValueError):
+    ...  # default 4 as above
+try:
+    ERROR_RATE = float(os.getenv("DXPOOL_ERROR_RATE", ERROR_RATE))
+except (TypeError, ValueError):
+    ...  # default 0.2 as above
+
+
+class ConcurrencyController:
+    """AIMD limit with slow start and a throughput gradient, shared by the workers of a batch."""
+
+    def __init__(
+        self,
+        initial: float = 8,
+        min_limit: int = MIN_LIMIT,
+        max_limit: int = 100,
+    ):
+        """
+        Init.
+
+        Args:
+        ----
+        initial: requests in flight to start with
+        min_limit: the limit never drops below this
+        max_limit: nor grows above this
+
+        """
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.limit = float(min(self.max_limit, max(self.min_limit, initial)))
+        self.slow_start = True
+        self.in_flight = 0
+        self._waiters: deque = deque()
+
+        # the current round
+        self.round_started = monotonic()
+        self.round_done = 0
+        self.round_failed = 0
+        self.round_latencies: List[float] = []
+        self.saturated = False  # the limit was reached in the round
+
+        # previous rounds
+        self.prev_throughput: Optional[float] = None
+        self.prev_limit = self.limit
+        self.min_latency: Optional[float] = None
+        self.rounds = 0
+
+    @classmethod
+    def for_pool(
+        cls, pool_size: int, max_limit: Optional[int] = None
+    ) -> "ConcurrencyController":
+        """Return a controller starting at one request per url, at most PER_URL per url and max_limit."""
+        cap = max(MIN_LIMIT, pool_size * PER_URL)
+        if max_limit is not None:
+            cap = min(cap, max_limit)
+        return cls(initial=max(MIN_LIMIT, pool_size), max_limit=cap)
+
+    @property
+    def permits(self) -> int:
+        """Return requests allowed in flight now."""
+        return max(self.min_limit, int(self.limit))
+
+    def _wake(self):
+        # hand free permits to waiters, in turn
+        while self._waiters and self.in_flight < self.permits:
+            fut = self._waiters.popleft()
+            if not fut.done():
+                self.in_flight += 1
+                fut.set_result(None)
+
+    async def acquire(self):
+        """Wait for a permit."""
+        if self.in_flight < self.permits and not self._waiters:
+            self.in_flight += 1
+            if self.in_flight >= self.permits:
+                self.saturated = True
+            return
+        self.saturated = True
+        fut = asyncio.get_running_loop().create_future()
+        self._waiters.append(fut)
+        try:
+            await fut
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():  # handed a permit just now
+                self.in_flight -= 1
+                self._wake()
+            raise
+
+    def release(
+        self,
+        latency: Optional[float] = None,
+        failed: Optional[bool] = None,
+        now: Optional[float] = None,
+    ):
+        """
+        Return a permit, count the request for the round.
+
+        Args:
+        ----
+        latency: seconds the request took
+        failed: True for an error that may be overload, False for a success,
+            None for a request that does not count (dropped, cancelled, rejected)
+        now: time of the release, default monotonic()
+
+        """
+        self.in_flight = max(0, self.in_flight - 1)
+        if failed is not None:
+            self.round_done += 1
+            if failed:
+                self.round_failed += 1
+            elif latency is not None:
+                self.round_latencies.append(latency)
+            if self.round_done >= max(MIN_ROUND, self.permits):
+                self._adjust(monotonic() if now is None else now)
+        self._wake()
+
+    def _decrease(self):
+        self.slow_start = False
+        self.limit = max(float(self.min_limit), self.limit * DECREASE)
+
+    def _adjust(self, now: float):
+        elapsed = max(now - self.round_started, 1e-6)
+        throughput = (self.round_done - self.round_failed) / elapsed
+        error_rate = self.round_failed / self.round_done
+        median = quantile(self.round_latencies, 0.5)
+        if median is not None and (self.min_latency is None or median < self.min_latency):
+            self.min_latency = median
+
+        limit = self.limit
+        if error_rate > ERROR_RATE:
+            self._decrease()
+            reason = f"error rate {error_rate:.2f}"
+        elif (
+            median is not None
+            and self.min_latency
+            and median > LATENCY_TOLERANCE * self.min_latency
+        ):
+            self._decrease()
+            reason = f"latency {median:.2f}s"
+        elif not self.saturated:
+            reason = "not saturated"
+        elif self.slow_start:
+            if self.prev_throughput is None or throughput > self.prev_throughput * (1 + GAIN):
+                self.limit = min(float(self.max_limit), self.limit * 2)
+                reason = "slow start"
+            else:
+                # doubling did not pay off
+                self.slow_start = False
+                self.limit = self.prev_limit
+                reason = "throughput flat, slow start ends"
+        elif self.prev_throughput is None or throughput >= self.prev_throughput * (1 - GAIN):
+            self.limit = min(float(self.max_limit), self.limit + 1)
+            reason = "additive increase"
+        else:
+            reason = "throughput down, hold"
+
+        if self.saturated:
+            self.prev_throughput = throughput
+            self.prev_limit = limit
+        self.rounds += 1
+        logger.debug(
+            f"concurrency {limit:.1f} -> {self.limit:.1f} ({reason}), "
+            f"{throughput:.1f}/s, {error_rate=:.2f}"
+        )
+
+        self.round_started = now
+        self.round_done = 0
+        self.round_failed = 0
+        self.round_latencies = []
+        self.saturated = self.in_flight >= self.permits
+
+    def snapshot(self) -> dict:
+        """Return limit and state, for logs."""
+        return {
+            "limit": round(self.limit, 1),
+            "in_flight": self.in_flight,
+            "max_limit": self.max_limit,
+            "slow_start": self.slow_start,
+            "rounds": self.rounds,
+            "min_latency": None if self.min_latency is None else round(self.min_latency, 3),
+        }
@@ -15,32 +15,178 @@ example return:
 {"code":200,"id":865910002,"data":"你好，世界","alternatives":["世界，你好","你好，世界！","大家好"]}
 """
 
-# pylint: disable=invalid-name,too-many-branches, too-many-statements, too-many-arguments
+# pylint: disable=invalid-name,too-many-branches, too-many-statements, too-many-arguments, too-many-instance-attributes
 import asyncio
 import os
 import sys
-from typing import Union
+import weakref
+from contextlib import asynccontextmanager
+from importlib.util import find_spec
+from time import monotonic
+from typing import Callable, Dict, List, Optional, Tuple, Union
 
 import httpx
 import nest_asyncio
 from loguru import logger
 
+from deeplx_pool.latency_stats import LATENCY
+from deeplx_pool.rate_limit import LIMITER
+
 nest_asyncio.apply()
 
 deeplx_url = "https://api.deeplx.org"
-client = httpx.AsyncClient(verify=False)
 
-CONCURRENCY_LIMIT = 5
-_ = os.getenv("CONCURRENCY_LIMIT")
-if _ is not None:
+
+def _env_number(name, default, conv=int):
+    """Return env var name converted by conv, default if not set, invalid or < 1."""
     try:
-        CONCURRENCY_LIMIT = int(os.getenv("CONCURRENCY_LIMIT"))  # type: ignore
+        _ = conv(os.getenv(name, default))
     except (TypeError, ValueError):
-        ...  # default 5 as above
-    if CONCURRENCY_LIMIT < 1:
-        CONCURRENCY_LIMIT = 5  # if < 1, set to 5
+        return default
+    return _ if _ > 0 else default
+
+
+# max requests in flight over all urls (was never applied before, hence the bump from 5)
+CONCURRENCY_LIMIT = _env_number("CONCURRENCY_LIMIT", 100)
+
+# max requests in flight to one host, e.g. one hf space
+PER_HOST_LIMIT = _env_number("DXPOOL_PER_HOST_LIMIT", 8)
+
+MAX_CONNECTIONS = _env_number("DXPOOL_MAX_CONNECTIONS", 100)
+MAX_KEEPALIVE = _env_number("DXPOOL_MAX_KEEPALIVE", 20)
+KEEPALIVE_EXPIRY = _env_number("DXPOOL_KEEPALIVE_EXPIRY", 30.0, float)
+
+# http/2 needs h2 (pip install httpx[http2]), it is negotiated per https url,
+# plain http urls stay on http/1.1
+HTTP2 = os.getenv("DXPOOL_HTTP2", "1").lower() not in ["0", "false", "no", ""]
+if HTTP2 and find_spec("h2") is None:
+    logger.trace("h2 not installed, http/2 off")
+    HTTP2 = False
+
 
-SEMAPHORE = asyncio.Semaphore(CONCURRENCY_LIMIT)
+class _LoopState:
+    """Client and semaphores of one event loop."""
+
+    def __init__(self, manager: "ClientManager"):
+        self.client = httpx.AsyncClient(
+            verify=False,
+            http2=manager.http2,
+            limits=httpx.Limits(
+                max_connections=manager.max_connections,
+                max_keepalive_connections=manager.max_keepalive,
+                keepalive_expiry=manager.keepalive_expiry,
+            ),
+        )
+        self.semaphore = asyncio.Semaphore(manager.concurrency_limit)
+        self.host_semaphores: Dict[str, asyncio.Semaphore] = {}
+
+
+class ClientManager:
+    """
+    Pooled httpx.AsyncClient with global and per-host concurrency caps.
+
+    One client (hence one connection pool) per event loop, created on first
+    use, so asyncio.run() can be called more than once in a process.
+
+    async with CLIENT_MANAGER.slot(url) as client:
+        resp = await client.post(f"{url}/translate", json=data)
+    """
+
+    def __init__(
+        self,
+        concurrency_limit: int = CONCURRENCY_LIMIT,
+        per_host_limit: int = PER_HOST_LIMIT,
+        max_connections: int = MAX_CONNECTIONS,
+        max_keepalive: int = MAX_KEEPALIVE,
+        keepalive_expiry: float = KEEPALIVE_EXPIRY,
+        http2: bool = HTTP2,
+    ):
+        """Init, nothing is created until first use."""
+        self.concurrency_limit = concurrency_limit
+        self.per_host_limit = per_host_limit
+        self.max_connections = max_connections
+        self.max_keepalive = max_keepalive
+        self.keepalive_expiry = keepalive_expiry
+        self.http2 = http2
+        self._states: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, _LoopState]" = (
+            weakref.WeakKeyDictionary()
+        )
+
+    def _state(self) -> _LoopState:
+        loop = asyncio.get_running_loop()
+        state = self._states.get(loop)
+        if state is None or state.client.is_closed:
+            state = _LoopState(self)
+            self._states[loop] = state
+        return state
+
+    def client(self) -> httpx.AsyncClient:
+        """Return the client of the running loop."""
+        return self._state().client
+
+    @asynccontextmanager
+    async def slot(self, url: str, timeout: Optional[float] = None):
+        """
+        Wait for a per-host and a global slot, yield the client.
+
+        The per-host slot comes first: requests queued behind a busy host
+        hold no global slot, other hosts are not blocked by them.
+
+        Raises:
+        ------
+        httpx.PoolTimeout if the slots are not free within timeout seconds
+
+        """
+        state = self._state()
+        try:
+            host = httpx.URL(url).host
+        except Exception:  # pylint: disable=broad-exception-caught
+            host = url
+        if host not in state.host_semaphores:
+            state.host_semaphores[host] = asyncio.Semaphore(self.per_host_limit)
+        host_semaphore = state.host_semaphores[host]
+
+        deadline = None if timeout is None else monotonic() + timeout
+
+        async def acquire(semaphore: asyncio.Semaphore):
+            if deadline is None:
+                await semaphore.acquire()
+                return
+            try:
+                await asyncio.wait_for(semaphore.acquire(), max(0.0, deadline - monotonic()))
+            except asyncio.TimeoutError:
+                raise httpx.PoolTimeout(f"{url}: no slot within {timeout}s") from None
+
+        await acquire(host_semaphore)
+        try:
+            await acquire(state.semaphore)
+            try:
+                yield state.client
+            finally:
+                state.semaphore.release()
+        finally:
+            host_semaphore.release()
+
+    async def aclose(self):
+        """Close the client of the running loop."""
+        state = self._states.pop(asyncio.get_running_loop(), None)
+        if state is not None:
+            await state.client.aclose()
+
+
+CLIENT_MANAGER = ClientManager()
+
+# called with (url, seconds, ok) after every request, slot wait not included,
+# e.g. latency_stats.LATENCY.record for tail latency ranking
+LISTENERS: List[Callable[[str, float, bool], None]] = [LATENCY.record]
+
+
+def _notify(url: str, latency: float, ok: bool):
+    for listener in LISTENERS:
+        try:
+            listener(url, latency, ok)
+        except Exception as exc:  # pylint: disable=broad-exception-caught
+            logger.debug(f"listener {listener}: {exc}")
 
 
 async def deeplx_client_async(
@@ -49,8 +195,9 @@ async def deeplx_client_async(
     target_lang: str = "",
     alternatives: bool = False,
     url: Union[str, None] = None,
-    # sem=SEMAPHORE,
-) -> str:
+    timeout: Optional[float] = None,
+    split: bool = False,
+) -> Union[str, Tuple[str, List[str]]]:
     """
     Translate via api.deeplx.org and variants.
 
@@ -65,11 +212,22 @@ async def deeplx_client_async(
     target_lang: default zh (chinese)
     alternatives: also output available alternatives if set (default False)
     url: deeplx api url, default https://api.deeplx.org/translate
-    sem: semaphore, default 5
+    timeout: seconds for the whole request, rate limit and slot waits
+        included, httpx.ReadTimeout after that, httpx's default if None
+    split: return (translation, alternatives list) instead of the
+        "translation / alt1, alt2" string, alternatives [] if not set
+
+    requests go through CLIENT_MANAGER: pooled client, at most CONCURRENCY_LIMIT
+    requests in flight and PER_HOST_LIMIT per host; each request's latency
+    and outcome go to LISTENERS
+
+    each request first takes a token of url from rate_limit.LIMITER, which
+    learns url's rate from its 429s and Retry-After; rate_limit.RateLimited
+    is raised if that would take longer than timeout (MAX_WAIT if None)
 
     Returns:
     -------
-    translation
+    translation, or (translation, alternatives) if split
 
     """
     # url = deeplx_url
@@ -98,7 +256,7 @@ async def deeplx_client_async(
         raise
     if not text:
         logger.warning("empty input, nothing to do, return ''.")
-        return ""
+        return ("", []) if split else ""
 
     try:
         source_lang = source_lang.strip()
@@ -137,7 +295,7 @@ async def deeplx_client_async(
     logger.trace(f"{source_lang=}, {target_lang=}")
 
     if source_lang == target_lang:
-        return text
+        return (text, []) if split else text
 
     data = {
         "text": text,
@@ -148,16 +306,38 @@ async def deeplx_client_async(
     logger.trace(f"{data=}")
     logger.trace(f"url = {url}/translate")
 
-    # async with semaphore:
-    # if True:
-    # async with sem:
+    def left(since: float) -> Optional[float]:
+        # what the waits left of timeout
+        return None if timeout is None else max(1e-3, timeout - (monotonic() - since))
+
+    then = None
     try:
-        resp = await client.post(f"{url}/translate", json=data)  # type: ignore
+        start = monotonic()
+        await LIMITER.acquire(url, max_wait=timeout)  # type: ignore
+        async with CLIENT_MANAGER.slot(url, left(start)) as client:  # type: ignore
+            then = monotonic()
+            kwargs = {} if timeout is None else {"timeout": left(start)}
+            post = client.post(f"{url}/translate", json=data, **kwargs)  # type: ignore
+            if timeout is None:
+                resp = await post
+            else:
+                # httpx timeouts are per phase (connect, each read ...), a server
+                # trickling bytes would outlast them: bound the whole request
+                try:
+                    resp = await asyncio.wait_for(post, left(start))
+                except asyncio.TimeoutError:
+                    raise httpx.ReadTimeout(f"{url}: no answer within {timeout}s") from None
+        if resp.status_code == 429:
+            LIMITER.on_429(url, resp.headers.get("Retry-After"), sent=then)  # type: ignore
         resp.raise_for_status()
     except Exception as exc:
+        if then is not None:
+            _notify(url, monotonic() - then, False)  # type: ignore
         # will be handled downstream
         logger.error(exc)
         raise
+    _notify(url, monotonic() - then, True)  # type: ignore
+    LIMITER.on_success(url)  # type: ignore
 
     logger.trace(f"{resp=}")
 
@@ -171,6 +351,9 @@ async def deeplx_client_async(
 
     logger.trace(f"{res=}")
 
+    if split:
+        return res, (list(alt_output or []) if alternatives else [])
+
     if alternatives and alt_output:
         return f"{res} / {', '.join(alt_output)}"
 
@@ -192,6 +375,7 @@ async def main():
         return_exceptions=True,
     )
     print(_)
+    await CLIENT_MANAGER.aclose()
 
 
 if __name__ == "__main__":
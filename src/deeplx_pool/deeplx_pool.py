@@ -1,291 +1,221 @@
 """
 Collect deeplx-urls.
 
-based on scrape_deeplx_shodan.py
+based on scrape_deeplx_shodan.py, discovery sources are in sources.py
 """
 # pylint: disable=too-many-statements, too-many-branches, broad-exception-caught, too-many-locals, line-too-long
 
 import asyncio
-import itertools
-from concurrent.futures import ThreadPoolExecutor
-from datetime import datetime, timedelta
-import re
+from datetime import datetime
+from functools import partial
 from pathlib import Path
 from time import time
+from typing import AsyncIterable, AsyncIterator, Awaitable, Callable, Dict, Iterable, List, Optional
 
 import diskcache
-import httpx
-from httpx import Timeout
 from loguru import logger
 from rich.console import Console
 
-from deeplx_pool.check_deeplx import check_deeplx_async
-from deeplx_pool.fetch_urls_fofa_hack import fetch_urls_fofa_hack
-from deeplx_pool.scrape_deeplx_fofa import scrape_deeplx_fofa
-from deeplx_pool.scrape_deeplx_shodan import scrape_deeplx_shodan
-
-DURATION_HUMAN_SPEC = (
-    (1.0e-6, 1e9, 1e3, "ns"),
-    (1.0e-3, 1e6, 1e3, "us"),
-    (1.0, 1e3, 1e3, "ms"),
-    (60.0, 1e0, 60.0, "s"),
-)
+from deeplx_pool.check_deeplx_stream import CHECK_DEADLINE, check_deeplx_stream
+from deeplx_pool.duration_human import duration_human
+from deeplx_pool.endpoint_registry import EndpointRegistry
+from deeplx_pool.sites_snapshot import SITES
+from deeplx_pool.sources import SOURCE_DEADLINE, enabled_sources
+
 console = Console()
 
-cache = diskcache.Cache(Path.home() / ".diskcache" / "deeplx-sites")
+# seconds between early saves of healthy urls while probes are still running
+PUBLISH_INTERVAL = 10
 
+cache = diskcache.Cache(Path.home() / ".diskcache" / "deeplx-sites")
 
-def duration_human(value: float) -> str:
-    """
-    Return a beautiful representation of the duration.
 
-    It dynamically calculates the best unit to use.
+def discovery_sources() -> Dict[str, Callable[[], Awaitable[List[str]]]]:
+    """Return name -> coroutine function, one per query of each enabled source (see sources)."""
+    jobs: Dict[str, Callable[[], Awaitable[List[str]]]] = {}
+    for name, source in enabled_sources().items():
+        queries = source.run_queries()
+        for query in queries:
+            key = name if len(queries) == 1 else f"{name}: {query[:30]}"
+            jobs[key] = partial(source.run_query, query)
+    return jobs
 
-    Returns
-    -------
-        str: the duration representation.
 
+async def discover_stream(
+    sources: Dict[str, Callable[[], Awaitable[List[str]]]],
+    seen: Iterable[str] = (),
+    deadline: float = SOURCE_DEADLINE,
+    found: Optional[Dict[str, str]] = None,
+) -> AsyncIterator[str]:
     """
-    try:
-        value = round(value, 2)
-    except Exception:
-        return str(value)
-
-    for (
-        top,
-        mult,
-        size,
-        unit,
-    ) in DURATION_HUMAN_SPEC:
-        if value < top:
-            result = round(value * mult, ndigits=2)
-            if result < size:
-                return f"{result}{unit}"
-    try:
-        txt = str(timedelta(seconds=float(f"{value:.1f}")))
-        pos = txt.find(".")
-        if pos == -1:
-            return txt
-        return txt[: pos + 2]
-    except OverflowError:
-        return "quasi-infinity \n(Python int too large to convert to C int)"
-
-
-# async def main():
-def main():
-    """Bootstrap."""
-    url_list_hist = cache.get("deeplx-sites", [])
-    console.print("Saved urls: ", url_list_hist, len(url_list_hist))  # type: ignore
-
-    # ########## shodan ##########
-    console.print("diggin shodan...", style="yellow")
-    then = time()
-    # try 3 times with increased timeout
-    url_list_shodan = []
-    for _ in range(3):
-        console.print(
-            "fetching info from shodan",
-            style="yellow",
-        )
-        if _ > 0:
-            logger.info(f"Retry: {_}")
-        try:
-            timeout = Timeout(60 * 1.5 ** _)
-            url_list_shodan = scrape_deeplx_shodan(timeout=timeout)
-            break
-        except httpx.ReadTimeout:
-            continue
-        except Exception as exc:
-            logger.error(exc)
-            continue
-    else:
-        url = "https://www.shodan.io/search"
-        logger.warning(
-            "Tried 3 tiems, "
-            "see previous error messages, no network? "
-            f"Make sure you can visit {url}."
-        )
-        # raise Exception(f"Make sure you can visit {url}.")
+    Run sources at the same time, yield urls not seen before as each source returns.
 
-    console.print("Fetched shodan urls: ", url_list_shodan)
-    console.print(
-        f"Time used: {duration_human(time() - then)}",
-        style="green",
-    )
-    # ---
+    Args:
+    ----
+      sources: name -> coroutine function returning a list of urls
+      seen: urls not to yield (e.g. known ones)
+      deadline: seconds a source may take, a late source is cancelled (a thread
+        it runs in is left to finish on its own) and its urls are dropped
+      found: if given, filled with url -> source name of yielded urls
 
-    url_list_fofa = []
-    # ########## fofa no more ##########
-    _ = """
-    console.print("diggin fofa...", style="yellow")
-    then = time()
-    # try 3 times with increased timeout
-    for _ in range(3):
-        console.print(
-            "fetching info from fofa",
-            style="yellow",
-        )
-        if _ > 0:
-            logger.info(f"Retry: {_}")
+    """
+    seen = set(seen)
+
+    async def run(name, func):
+        then = time()
         try:
-            timeout = Timeout(30 * 1.2**_)
-            url_list_fofa = scrape_deeplx_fofa(timeout=timeout)
-            break
-        except httpx.ReadTimeout:
-            continue
+            urls = await asyncio.wait_for(func(), deadline)
+        except asyncio.TimeoutError:
+            logger.warning(f"{name}: no result within {deadline}s, skipped")
+            urls = []
         except Exception as exc:
-            logger.error(exc)
-            continue
-    else:
-        url = "https://en.fofa.info"
-        logger.warning(
-            "Tried 3 tiems, "
-            "see previous error messages, no network? "
-            f"Make sure you can visit {url}."
+            logger.error(f"{name}: {exc}")
+            urls = []
+        console.print(
+            f"Fetched {name} urls: {len(urls)}, time used: {duration_human(time() - then)}",
+            style="green",
         )
-        # raise Exception(f"Make sure you can visit {url}.")
-        logger.warning(f"Make sure you can visit {url}.")
+        return name, urls
 
-    console.print("Fetched fofa urls: ", url_list_fofa)
-    console.print(
-        f"Time used: {duration_human(time() - then)}",
-        style="green",
-    )
-    # ---
-    # """
-
-    # ########## fofa_hack api ##########
-    then = time()
-    url_list_fofa_hack = []
+    tasks = [asyncio.create_task(run(name, func)) for name, func in sources.items()]
     try:
-        query_def1 = '''"deepl translate api" && country="CN"'''
-        query_def2 = '''body='{"code":200,"message":"DeepL Free API, Developed by sjlleo and missuo. Go to /translate with POST. http://github.com/OwO-Network/DeepLX"}' && country="CN"'''
-        query_def3 = '''"welcome to deeplx" && country="CN"'''
-        query_def4 = '''"Welcome to deeplx-pro"'''
+        for next_done in asyncio.as_completed(tasks):
+            name, urls = await next_done
+            for url in urls:
+                if url not in seen:
+                    seen.add(url)
+                    if found is not None:
+                        found[url] = name.split(":")[0]
+                    yield url
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def merge_feed(
+    url_list: Iterable[str], new_urls: AsyncIterable[str]
+) -> AsyncIterator[str]:
+    """
+    Yield url_list and new_urls, new_urls run in a task from the start.
 
-        # deeplx-serverless
-        query_def5 = '''"Welcome to the DeepL Free API."'''
-        # query_def = choice([query_def1, query_def2, query_def3])
-        queries = [query_def1, query_def2, query_def3, query_def4, query_def5]
+    A url from new_urls goes out as soon as it comes in, ahead of the
+    url_list urls not yielded yet: discovery and probes of known urls
+    overlap instead of discovery waiting for all known urls.
+    """
+    queue: asyncio.Queue = asyncio.Queue()
 
-        with ThreadPoolExecutor() as pool:
-            urls = [*pool.map(fetch_urls_fofa_hack, queries)]
+    async def collect():
+        try:
+            async for url in new_urls:
+                queue.put_nowait(url)
+        except Exception as exc:
+            logger.error(f"discovery failed: {exc}")
+        finally:
+            queue.put_nowait(None)  # new_urls done
 
-        url_list_fofa_hack = [*itertools.chain(*urls)]
+    task = asyncio.create_task(collect())
+    finished = False
+    try:
+        for url in url_list:
+            while not finished and not queue.empty():
+                new = queue.get_nowait()
+                if new is None:
+                    finished = True
+                else:
+                    yield new
+            yield url
+        while not finished:
+            new = await queue.get()
+            if new is None:
+                finished = True
+            else:
+                yield new
+    finally:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+
+def main(full: bool = False):
+    """
+    Bootstrap.
 
-    except Exception as exc:
-        logger.error(exc)
-    console.print("Fetched fofa_hack urls: ", len(url_list_fofa_hack))
-    console.print(
-        f"Time used: {duration_human(time() - then)}",
-        style="green",
-    )
+    Args:
+    ----
+      full: probe all urls, default only those due (see endpoint_registry)
 
-    # ########## misc extra ##########
-    # append extra sites to check
+    """
+    return asyncio.run(main_async(full))
 
-    # quick scrape deeplx.wangwangit.com
-    extra_urls = []
 
-    _ = r""" deeplx.wangwangit.com, no longer valid
-    # quick scrape deeplx.wangwangit.com
-    for _ in range(3):
-        try:
-            res = httpx.get(
-                "https://deepl.wangwangit.com/",
-                timeout=20,
-            )
-            lst = re.findall(
-                r"https?://[\d.]+(?::\d+)?",
-                res.text,
-            )
-            logger.trace(f"wangwangit: {lst}")
-            extra_urls.extend(lst)
-            break
-        except (
-            httpx.ConnectError,
-            httpx.ConnectTimeout,
-        ):
-            continue
-        except Exception as exc:
-            logger.error(exc)
-            break
-    else:
-        console.print(
-            "Tried 3 times, deepl.wangwangit.com probably down or blocked this ip."
-        )
-    # """
+async def main_async(full: bool = False):
+    """
+    Bootstrap in a running event loop, e.g. fastapi_app's scheduler.
 
-    _ = [
-        # "https://translates.me/v2",
-        # "https://api.deeplx.org/linxdo_key",  # from https://connect.linux.do/
-        "https://deeplx.niubipro.com",
-        "https://freedeeplxapi1.ddl.us.kg",
-        "https://ihabis-deeplx-test2-no-token.hf.space",
-        "https://wuran-deeplx.hf.space",
-        "https://uu0103-deeplx.hf.space",
-        "https://xcq-1-deeplx.hf.space",
-        "https://mikeee-deeplx.hf.space",
-        "https://deeplx.dattw.eu.org",
-        # deeplx-local at hf
-        "https://mikeee-deeplx-local.hf.space",
-        "https://bestmaple-deeplx-local.hf.space",
-    ]
-
-    # extra_urls = ["https://api.deeplx.org"]
-
-    extra_urls.extend(_)
-
-    console.print(f"{extra_urls=}")
-
-    # done in proc_static.py
-    _ = r"""
-    filename = "linuxdo216930.txt"
-    try:
-        filecont = Path(filename).read_text(encoding="utf8").strip()
-    except Exception as exc:
-        logger.error(exc)
-        filecont = ""
-    urls_file = re.split(r"[\s,;；，]+", filecont)
-    urls_file = [elm.strip() for elm in urls_file if elm.strip()]
-    logger.info(f"{len(urls_file)=}")
-    extra_urls.extend(urls_file)
-    # """
+    Known urls (endpoint_registry) that are due are probed right away, discovery
+    sources run at the same time, each in a thread, and their new urls join
+    the probes as soon as that source returns. Loading and saving the registry
+    (sqlite) run in a thread too, the loop keeps serving requests meanwhile.
 
-    _ = """
-    for elm in extra_urls:
-        if elm not in url_list:
-            url_list.append(elm)
-    # """
+    Args:
+    ----
+      full: probe all urls, default only those due (see endpoint_registry)
 
-    # extract urls, combine, deduplicate, convert back to list
-    _ = list(dict(url_list_hist))  # type: ignore
-    _ = set(_ + url_list_shodan + url_list_fofa + url_list_fofa_hack + extra_urls)
-    url_list = list(_)
-
-    console.print("Combined urls: ", url_list)
-    console.print(f"\t # of combined urls: {len(url_list)}")
+    """
+    registry = await asyncio.to_thread(EndpointRegistry(cache).load)
+    console.print(f"\t # of saved urls: {len(registry.ranked())}")
+
+    # known urls: records, including those migrated from deeplx-states/deeplx-sites
+    known = list(registry.records)
+    console.print(f"\t # of known urls: {len(known)}")
+
+    # only probe urls that are due, unless full
+    url_list = known if full else registry.due_urls(known)
+    console.print(f"\t # of known urls due for a check: {len(url_list)}")
+
+    # new url -> name of the source it came from
+    found: Dict[str, str] = {}
+
+    # sources start right away, their new urls (no record, always due) are
+    # probed ahead of the due known urls still waiting
+    url_feed = partial(
+        merge_feed,
+        url_list,
+        discover_stream(discovery_sources(), seen=known, found=found),
+    )
 
     async def gather():
-        return await asyncio.gather(
-            *map(check_deeplx_async, url_list),
-            return_exceptions=True,
-        )
+        # bounded probes, results streamed in as they finish
+        urls_checked = []
+        published = time()
+        async for url, latency in check_deeplx_stream(
+            url_feed(), deadline=SOURCE_DEADLINE + CHECK_DEADLINE
+        ):
+            urls_checked.append((url, latency))
+            registry.update(url, latency, source=found.get(url, ""))
+            if not isinstance(latency, float):
+                continue
+
+            # publish healthy urls early, changed records only; the registry
+            # is not touched meanwhile, updates happen in this loop only
+            if time() - published > PUBLISH_INTERVAL:
+                # for fastapi_app in the same process
+                SITES.publish(await asyncio.to_thread(registry.save))
+                published = time()
+        return urls_checked
 
     then = time()
     # urls_checked = await asyncio.gather(
-    urls_checked = asyncio.run(gather())
+    urls_checked = await gather()
 
     # urls_checked = [*map(check_url, url_list)]
 
-    # save valid urls to cache
-    urls_valid = [_ for _ in urls_checked if isinstance(_[1], float)]  # type: ignore
-    # sorted
-    urls_valid = sorted(urls_valid, key=lambda x: x[1])  # type: ignore
-
-    cache.set("deeplx-sites", urls_valid)
+    # save changed records and valid urls to cache, sorted: healthy ones
+    # just checked and healthy ones not due yet
+    urls_valid = await asyncio.to_thread(registry.save, True)
+    SITES.publish(urls_valid)
 
-    console.print("Checked urls:", urls_checked)
+    n_healthy = sum(isinstance(latency, float) for _, latency in urls_checked)
+    console.print(f"Checked urls: {len(urls_checked)}, healthy: {n_healthy}")
     console.print(
         f"Time elapsed: {duration_human(time() - then)}",
         style="green",
@@ -293,9 +223,7 @@ def main():
 
     total = len(urls_valid)
     console.print(
-        "Valid urls:",
-        urls_valid,
-        f"{total=}",
+        f"Valid urls: {total=}",
         datetime.now().strftime("%Y-%m-%d %H:%M"),
     )
 
@@ -0,0 +1,362 @@
+"""
+Registry of known endpoints, persisted record by record in diskcache.
+
+registry = EndpointRegistry().load()
+for url in registry.due_urls():
+    registry.update(url, latency_or_error)  # float latency, or error message
+registry.save()  # writes changed records, and "deeplx-sites" for the readers
+
+registry.records["http://107.150.100.170:8880"]
+EndpointRecord(url='http://107.150.100.170:8880', latency=0.76, failures=0, ...)
+registry.ranked()  # [(url, p95 latency), ...] healthy ones, fastest first
+
+Each record lives under its own key f"ep:{url}" as a plain tuple, so a
+probe of one endpoint rewrites one small entry instead of the whole pool.
+cache.get("deeplx-sites") is still written by save() as a derived view,
+for fastapi_app, the selector and the standalone scrapers.
+
+On first load the records are migrated from cache.get("deeplx-states")
+(the url -> state dicts of earlier versions) and cache.get("deeplx-sites");
+urls found in "deeplx-sites" but not in the registry (e.g. written by a
+standalone scraper) are merged in on every load, due for a probe.
+
+Healthy endpoints are due again after HEALTHY_INTERVAL, failed ones back
+off exponentially: HEALTHY_INTERVAL * 2 ** failures, capped at BACKOFF_MAX.
+
+"deeplx-sites" is rewritten by save() only if the ranking (the order of
+urls) changed, or with save(force=True), e.g. at the end of a run.
+
+env vars: DXPOOL_HEALTHY_INTERVAL (default 1500), DXPOOL_BACKOFF_MAX
+(default 7 days)
+
+Endpoints are ranked by tail latency (latency_stats.TAIL_QUANTILE, p95)
+over their probe history and the live translation samples in
+latency_stats.LATENCY, so an endpoint with a slow tail ranks behind a
+steady one even if its last probe was fast.
+"""
+
+import os
+from bisect import bisect_left, insort
+from pathlib import Path
+from time import time
+from typing import Dict, Iterable, List, Optional, Set, Tuple, Union
+
+import diskcache
+from loguru import logger
+
+from deeplx_pool.latency_stats import LATENCY, TAIL_QUANTILE, LatencyStats, quantile
+
+cache = diskcache.Cache(Path.home() / ".diskcache" / "deeplx-sites")
+
+PREFIX = "ep:"
+HISTORY = 20  # probe latencies kept per endpoint
+STATES_KEY = "deeplx-states"  # migrated from on first load
+
+# refresh runs every 30 minutes, re-check healthy endpoints every run
+HEALTHY_INTERVAL = 1500.0
+try:
+    HEALTHY_INTERVAL = float(os.getenv("DXPOOL_HEALTHY_INTERVAL", HEALTHY_INTERVAL))
+except (TypeError, ValueError):
+    ...  # default 1500 as above
+
+# longest wait before a dead endpoint is probed again, default 7 days
+BACKOFF_MAX = 7 * 24 * 3600.0
+try:
+    BACKOFF_MAX = float(os.getenv("DXPOOL_BACKOFF_MAX", BACKOFF_MAX))
+except (TypeError, ValueError):
+    ...  # default 7 days as above
+
+INF = float("inf")
+
+
+class EndpointRecord:
+    """Probe history of one endpoint."""
+
+    __slots__ = (
+        "url",
+        "latency",
+        "history",
+        "failures",
+        "source",
+        "last_checked",
+        "next_due",
+    )
+
+    def __init__(
+        self,
+        url: str,
+        latency: Optional[float] = None,
+        history: Iterable[float] = (),
+        failures: int = 0,
+        source: str = "",
+        last_checked: Optional[float] = None,
+        next_due: float = 0.0,
+    ):
+        """
+        Init.
+
+        Args:
+        ----
+        url: the endpoint
+        latency: of the last successful probe
+        history: latencies of the last HISTORY successful probes, oldest first
+        failures: consecutive failed probes
+        source: where the url was found, e.g. "shodan"
+        last_checked: time of the last probe, None if never probed
+        next_due: time the next probe is due, 0 for right away
+
+        """
+        self.url = url
+        self.latency = latency
+        self.history = list(history)[-HISTORY:]
+        self.failures = failures
+        self.source = source
+        self.last_checked = last_checked
+        self.next_due = next_due
+
+    def __repr__(self):
+        """Show fields."""
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"{type(self).__name__}({fields})"
+
+    def score(self, live: Iterable[float] = ()) -> float:
+        """Return the sort key: tail latency of history and live samples, inf if not healthy."""
+        if self.failures or self.latency is None:
+            return INF
+        tail = quantile([*self.history, *live], TAIL_QUANTILE)
+        return self.latency if tail is None else tail
+
+    def is_due(self, now: Optional[float] = None) -> bool:
+        """Return True if the endpoint should be probed now."""
+        if now is None:
+            now = time()
+        return self.next_due <= now
+
+    def to_tuple(self) -> tuple:
+        """Return the record as stored in diskcache."""
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    @classmethod
+    def from_tuple(cls, values: tuple) -> "EndpointRecord":
+        """Return a record from to_tuple()."""
+        return cls(*values)
+
+
+class EndpointRegistry:
+    """Endpoint records by url, kept in order of score."""
+
+    def __init__(
+        self,
+        cache_: Optional[diskcache.Cache] = None,
+        latency_stats: Optional[LatencyStats] = LATENCY,
+    ):
+        """Init empty, call load() to read the records from cache."""
+        self.cache = cache if cache_ is None else cache_
+        self.latency_stats = latency_stats
+        self.records: Dict[str, EndpointRecord] = {}
+        # (score, url), sorted, and url -> score in there
+        self.order: List[Tuple[float, str]] = []
+        self.scores: Dict[str, float] = {}
+        # urls changed or removed since the last flush
+        self.dirty: Set[str] = set()
+        # urls in "deeplx-sites" as last read or written, in order
+        self.published: Optional[List[str]] = None
+
+    def __len__(self):
+        """Return number of endpoints."""
+        return len(self.records)
+
+    def __contains__(self, url):
+        """Return True if url is known."""
+        return url in self.records
+
+    def _score(self, record: EndpointRecord) -> float:
+        live = () if self.latency_stats is None else self.latency_stats.samples(record.url)
+        return record.score(live)
+
+    def _index(self, record: EndpointRecord):
+        self.records[record.url] = record
+        score = self.scores[record.url] = self._score(record)
+        insort(self.order, (score, record.url))
+
+    def _unindex(self, record: EndpointRecord):
+        score = self.scores.pop(record.url, None)
+        if score is None:
+            return
+        idx = bisect_left(self.order, (score, record.url))
+        if idx < len(self.order) and self.order[idx][1] == record.url:
+            del self.order[idx]
+
+    def rescore(self):
+        """Re-rank all endpoints, e.g. after live samples came in."""
+        self.scores = {url: self._score(record) for url, record in self.records.items()}
+        self.order = sorted((score, url) for url, score in self.scores.items())
+
+    def load(self) -> "EndpointRegistry":
+        """Read records from cache, migrate from "deeplx-states" on first use, return self."""
+        self.records.clear()
+        self.order.clear()
+        self.scores.clear()
+        self.dirty.clear()
+
+        for key in self.cache.iterkeys():
+            if not (isinstance(key, str) and key.startswith(PREFIX)):
+                continue
+            values = self.cache.get(key)
+            if values is None:
+                continue
+            try:
+                self._index(EndpointRecord.from_tuple(values))  # type: ignore
+            except Exception as exc:  # pylint: disable=broad-exception-caught
+                logger.warning(f"{key}: {exc}")
+
+        if not self.records:
+            self._migrate()
+
+        # urls in deeplx-sites written elsewhere, probed next
+        sites = self.cache.get("deeplx-sites") or []
+        self.published = [url for url, _ in sites]  # type: ignore
+        for url, latency in sites:  # type: ignore
+            if url not in self.records:
+                self.add(url, latency=latency, source="deeplx-sites")
+
+        logger.debug(f"{len(self)} endpoints")
+        return self
+
+    def _migrate(self):
+        states = self.cache.get(STATES_KEY) or {}
+        for url, state in states.items():  # type: ignore
+            latency = state.get("latency")
+            self.add(
+                url,
+                latency=latency,
+                failures=int(state.get("failures") or 0),
+                last_checked=state.get("last_checked"),
+                next_due=state.get("next_due") or 0.0,
+            )
+        if states:
+            logger.info(f"{len(states)} endpoints migrated from {STATES_KEY}")
+
+    def add(self, url: str, source: str = "", **fields) -> EndpointRecord:
+        """Return the record of url, a new one (due right away) if url is not known."""
+        record = self.records.get(url)
+        if record is not None:
+            if source and not record.source:
+                record.source = source
+                self.dirty.add(url)
+            return record
+        latency = fields.get("latency")
+        fields.setdefault("history", [] if latency is None else [latency])
+        record = EndpointRecord(url, source=source, **fields)
+        self._index(record)
+        self.dirty.add(url)
+        return record
+
+    def remove(self, url: str):
+        """Forget url, its record is deleted from cache on the next flush."""
+        record = self.records.pop(url, None)
+        if record is not None:
+            self._unindex(record)
+            self.dirty.add(url)
+
+    def update(
+        self,
+        url: str,
+        latency_or_error: Union[float, str],
+        now: Optional[float] = None,
+        source: str = "",
+    ) -> EndpointRecord:
+        """
+        Record the outcome of a probe and schedule the next one.
+
+        healthy endpoints are due again after HEALTHY_INTERVAL, failed ones
+        back off exponentially, capped at BACKOFF_MAX.
+
+        Args:
+        ----
+          url: the probed url, added if not known
+          latency_or_error: latency (float) if healthy, error message otherwise
+          now: time of the probe, default time()
+          source: where url was found, kept if the record has none
+
+        Returns:
+        -------
+          the updated record of url
+
+        """
+        if now is None:
+            now = time()
+        record = self.add(url, source)
+        self._unindex(record)
+
+        if isinstance(latency_or_error, float):
+            record.latency = latency_or_error
+            record.history.append(latency_or_error)
+            del record.history[:-HISTORY]
+            record.failures = 0
+            delay = HEALTHY_INTERVAL
+        else:
+            record.failures += 1
+            delay = min(HEALTHY_INTERVAL * 2**record.failures, BACKOFF_MAX)
+
+        record.last_checked = now
+        record.next_due = now + delay
+        self._index(record)
+        self.dirty.add(url)
+
+        return record
+
+    def due_urls(
+        self, urls: Optional[Iterable[str]] = None, now: Optional[float] = None
+    ) -> List[str]:
+        """Return urls (default all known) that are due for a probe, unknown ones included."""
+        if now is None:
+            now = time()
+        if urls is None:
+            urls = list(self.records)
+        _ = []
+        for url in urls:
+            record = self.records.get(url)
+            if record is None or record.is_due(now):
+                _.append(url)
+        return _
+
+    def ranked(self) -> List[Tuple[str, float]]:
+        """Return [(url, tail latency), ...] of healthy endpoints, fastest first."""
+        _ = []
+        for score, url in self.order:
+            if score == INF:
+                break
+            _.append((url, round(score, 2)))
+        return _
+
+    def flush(self) -> int:
+        """Write changed records to cache, return their number."""
+        if not self.dirty:
+            return 0
+        with self.cache.transact():
+            for url in self.dirty:
+                record = self.records.get(url)
+                if record is None:
+                    self.cache.delete(PREFIX + url)
+                else:
+                    self.cache.set(PREFIX + url, record.to_tuple())
+        count = len(self.dirty)
+        self.dirty.clear()
+        return count
+
+    def save(self, force: bool = False) -> List[Tuple[str, float]]:
+        """
+        Flush records, rescore, return ranked().
+
+        ranked() is written to "deeplx-sites" only if its order of urls
+        differs from what is there, or if force is set.
+        """
+        self.flush()
+        self.rescore()
+        sites = self.ranked()
+        urls = [url for url, _ in sites]
+        if force or urls != self.published:
+            self.cache.set("deeplx-sites", sites)
+            self.published = urls
+        return sites
@@ -0,0 +1,320 @@
+"""
+Pick a deeplx url for the next request, based on live outcomes.
+
+selector = make_selector("p2c", [("http://a", 0.3), ("http://b", 9.0)])
+
+url = selector.select()
+selector.acquire(url)
+then = monotonic()
+try:
+    trtext = await deeplx_client_async(text, url=url)
+    selector.release(url, monotonic() - then, ok=True)
+except Exception:
+    selector.release(url, monotonic() - then, ok=False)
+
+policies
+    round_robin: the old deq[-1] + deq.rotate()
+    ewma: random pick weighted by 1 / (latency * (outstanding + 1))
+    p2c: power of two choices, the better of two random urls by the same cost
+    least_outstanding: fewest requests in flight, ties broken by latency
+
+latency is the ewma, or the tail latency (latency_stats.TAIL_QUANTILE) of
+the url's last requests if that is higher and there are MIN_SAMPLES of them,
+so urls with a slow tail lose traffic even if they are usually fast.
+
+urls that failed within FAIL_COOLDOWN seconds, or whose circuit breaker
+(circuit_breaker.CircuitBreakerBoard, optional) is open, are skipped
+unless nothing else is left.
+"""
+# pylint: disable=too-few-public-methods
+
+import os
+import random
+from collections import deque
+from time import monotonic
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+from loguru import logger
+
+from deeplx_pool.circuit_breaker import CircuitBreakerBoard
+from deeplx_pool.latency_stats import TAIL_QUANTILE, LatencyWindow
+
+# weight of a new sample in the latency average
+EWMA_ALPHA = 0.3
+
+# latency assumed for urls without any sample yet
+DEFAULT_LATENCY = 1.0
+
+# a failure counts as at least this latency
+FAIL_PENALTY = 10.0
+
+# seconds a failed url is skipped
+FAIL_COOLDOWN = 5.0
+
+# samples needed before the tail latency counts
+MIN_SAMPLES = 5
+
+DEFAULT_POLICY = os.getenv("DXPOOL_SELECTOR", "p2c")
+
+Urls = Iterable[Union[str, Tuple[str, Optional[float]]]]
+
+
+class EndpointStats:
+    """Live stats of one url."""
+
+    __slots__ = ("url", "ewma", "window", "outstanding", "failed_at", "n_ok", "n_fail")
+
+    def __init__(self, url: str, latency: Optional[float] = None):
+        """Init with an optional latency prior (e.g. from the probe)."""
+        self.url = url
+        self.ewma = latency if isinstance(latency, (int, float)) else DEFAULT_LATENCY
+        self.window = LatencyWindow()
+        self.outstanding = 0
+        self.failed_at = -FAIL_COOLDOWN
+        self.n_ok = 0
+        self.n_fail = 0
+
+    @property
+    def latency(self) -> float:
+        """Return the ewma, or the tail latency if higher and known."""
+        if len(self.window) < MIN_SAMPLES:
+            return self.ewma
+        return max(self.ewma, self.window.quantile(TAIL_QUANTILE))  # type: ignore
+
+    @property
+    def cost(self) -> float:
+        """Expected wait on this url: latency times queue length."""
+        return self.latency * (self.outstanding + 1)
+
+    def __repr__(self):
+        """Show url, ewma and tail latency."""
+        return (
+            f"EndpointStats({self.url!r}, ewma={self.ewma:.2f}, "
+            f"latency={self.latency:.2f}, outstanding={self.outstanding})"
+        )
+
+
+class Selector:
+    """Base class, subclasses implement pick."""
+
+    name = ""
+
+    def __init__(
+        self,
+        urls: Urls = (),
+        alpha: float = EWMA_ALPHA,
+        breakers: Optional[CircuitBreakerBoard] = None,
+    ):
+        """
+        Init.
+
+        Args:
+        ----
+          urls: urls or (url, latency) two-tuples, e.g. cache.get("deeplx-sites")
+          alpha: weight of a new latency sample
+          breakers: circuit breakers fed by acquire/release, None for no breakers
+
+        """
+        self.alpha = alpha
+        self.breakers = breakers
+        self.stats: Dict[str, EndpointStats] = {}
+        for elm in urls:
+            if isinstance(elm, str):
+                self.add(elm)
+            else:
+                self.add(*elm)
+
+    def __len__(self):
+        """Return number of urls."""
+        return len(self.stats)
+
+    def add(self, url: str, latency: Optional[float] = None):
+        """Add url, keep its stats if already known."""
+        if url not in self.stats:
+            self.stats[url] = EndpointStats(url, latency)
+
+    def remove(self, url: str):
+        """Remove url, silently ignore unknown ones."""
+        self.stats.pop(url, None)
+
+    def candidates(self, exclude: Iterable[str] = ()) -> List[EndpointStats]:
+        """Return urls not excluded, breaker not open and not in cool-down, or all not excluded if none is left."""
+        exclude = set(exclude)
+        _ = [elm for elm in self.stats.values() if elm.url not in exclude]
+        now = monotonic()
+        live = [elm for elm in _ if now - elm.failed_at >= FAIL_COOLDOWN]
+        if self.breakers is not None:
+            live = [elm for elm in live if self.breakers.available(elm.url)]
+        return live or _
+
+    def select(self, exclude: Iterable[str] = ()) -> str:
+        """Return the url for the next request."""
+        cands = self.candidates(exclude)
+        if not cands:
+            raise LookupError("no deeplx url available")
+        return self.pick(cands).url
+
+    def pick(self, cands: List[EndpointStats]) -> EndpointStats:
+        """Choose among candidates, implemented by subclasses."""
+        raise NotImplementedError
+
+    def acquire(self, url: str):
+        """Mark a request to url as started."""
+        if url in self.stats:
+            self.stats[url].outstanding += 1
+        if self.breakers is not None:
+            self.breakers.acquire(url)
+
+    def cancel(self, url: str):
+        """Mark a request to url as given up on (e.g. a hedge loser), no outcome fed."""
+        if self.breakers is not None:
+            self.breakers.cancel(url)
+        stats = self.stats.get(url)
+        if stats is not None:
+            stats.outstanding = max(0, stats.outstanding - 1)
+
+    def release(self, url: str, latency: Optional[float] = None, ok: bool = True):
+        """
+        Mark a request to url as done and feed the outcome.
+
+        Args:
+        ----
+          url: the url used
+          latency: seconds the request took, None if unknown
+          ok: False if the request failed (exception, empty translation)
+
+        """
+        if self.breakers is not None:
+            self.breakers.record(url, ok)
+
+        stats = self.stats.get(url)
+        if stats is None:  # removed in the mean time
+            return
+        stats.outstanding = max(0, stats.outstanding - 1)
+
+        if ok:
+            stats.n_ok += 1
+            if latency is not None:
+                stats.window.add(latency)
+        else:
+            stats.n_fail += 1
+            stats.failed_at = monotonic()
+            latency = max(latency or 0, FAIL_PENALTY)
+
+        if latency is not None:
+            stats.ewma = (1 - self.alpha) * stats.ewma + self.alpha * latency
+        logger.trace(f"{stats}")
+
+
+class RoundRobinSelector(Selector):
+    """Rotate through urls in turn, ignore latency."""
+
+    name = "round_robin"
+
+    def __init__(
+        self,
+        urls: Urls = (),
+        alpha: float = EWMA_ALPHA,
+        breakers: Optional[CircuitBreakerBoard] = None,
+    ):
+        """Init, keep the order of urls."""
+        self.order: deque = deque()
+        super().__init__(urls, alpha, breakers)
+
+    def add(self, url: str, latency: Optional[float] = None):
+        """Add url at the end of the rotation."""
+        if url not in self.stats:
+            self.order.appendleft(url)
+        super().add(url, latency)
+
+    def remove(self, url: str):
+        """Remove url from the rotation."""
+        super().remove(url)
+        try:
+            self.order.remove(url)
+        except ValueError:
+            ...
+
+    def pick(self, cands: List[EndpointStats]) -> EndpointStats:
+        """Take the next url in turn among candidates, deq[-1] then deq.rotate()."""
+        urls = {elm.url: elm for elm in cands}
+        for _ in range(len(self.order)):
+            url = self.order[-1]
+            self.order.rotate()
+            if url in urls:
+                return urls[url]
+        return cands[0]
+
+
+class EwmaSelector(Selector):
+    """Random pick weighted by 1 / cost, fast idle urls get most of the traffic."""
+
+    name = "ewma"
+
+    def pick(self, cands: List[EndpointStats]) -> EndpointStats:
+        """Weighted random choice."""
+        weights = [1 / max(elm.cost, 1e-3) for elm in cands]
+        return random.choices(cands, weights=weights)[0]
+
+
+class P2CSelector(Selector):
+    """Power of two choices: the cheaper of two random urls."""
+
+    name = "p2c"
+
+    def pick(self, cands: List[EndpointStats]) -> EndpointStats:
+        """Compare two random candidates."""
+        if len(cands) == 1:
+            return cands[0]
+        one, two = random.sample(cands, 2)
+        return one if one.cost <= two.cost else two
+
+
+class LeastOutstandingSelector(Selector):
+    """Fewest requests in flight, then lowest latency."""
+
+    name = "least_outstanding"
+
+    def pick(self, cands: List[EndpointStats]) -> EndpointStats:
+        """Min by (outstanding, latency)."""
+        return min(cands, key=lambda elm: (elm.outstanding, elm.latency))
+
+
+SELECTORS = {
+    _.name: _
+    for _ in [RoundRobinSelector, EwmaSelector, P2CSelector, LeastOutstandingSelector]
+}
+
+
+def make_selector(
+    policy: Union[str, Selector, None] = None,
+    urls: Urls = (),
+    breakers: Optional[CircuitBreakerBoard] = None,
+) -> Selector:
+    """
+    Return a selector for policy.
+
+    Args:
+    ----
+      policy: a name in SELECTORS or a Selector instance (returned as is), default DEFAULT_POLICY
+      urls: urls or (url, latency) two-tuples for a new selector
+      breakers: circuit breakers for a new selector
+
+    Returns:
+    -------
+      Selector
+
+    """
+    if isinstance(policy, Selector):
+        return policy
+
+    if policy is None:
+        policy = DEFAULT_POLICY
+
+    try:
+        cls = SELECTORS[str(policy).lower().replace("-", "_")]
+    except KeyError:
+        logger.warning(f"unknown selector policy {policy=}, using {DEFAULT_POLICY}")
+        cls = SELECTORS.get(DEFAULT_POLICY, P2CSelector)
+
+    return cls(urls, breakers=breakers)
@@ -4,38 +4,47 @@ Modified from deeplpro-tr\app.py.
 curl -X POST "http://127.0.0.1:8000/translate" \
 -H "Authorization: Bearer token123" \
 -H "Content-Type: application/json" \
--d '{"text": "hello"}'
+-d '{"text": "hello", "source_lang": "EN", "target_lang": "ZH"}'
+
+curl -X POST "http://127.0.0.1:8000/translate/batch" \
+-H "Content-Type: application/json" \
+-d '{"texts": ["hello", "world"], "target_lang": "DE"}'
 
 # note the double quotes
 set TOKENS=["abc"]
 
+url list refresh runs in the app's event loop (scheduler.Scheduler, started
+in lifespan), intervals in seconds via env vars DXPOOL_REFRESH_INTERVAL
+(deeplx_pool.main_async, default 1800), DXPOOL_PROC_FILE_INTERVAL
+(proc_file_async, default 9000, first run right after startup) and
+DXPOOL_SNAPSHOT_INTERVAL (reload of what other processes wrote, default 60),
+set DXPOOL_SCHEDULER=0 to turn it off.
+
 refer also to https://github.com/snailyp/yeschat-reverse/blob/main/api/main.py
 """
 # pylint: disable=broad-exception-caught, invalid-name
 
-from itertools import cycle
+import asyncio
+from contextlib import asynccontextmanager
 import os
-from pathlib import Path
 import json
-import subprocess
-from time import sleep
-from typing import Optional
-from threading import Thread
+from typing import List, Optional, Tuple
 
-import diskcache
 from fastapi import FastAPI, HTTPException, Header, Depends, status
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi.responses import HTMLResponse, JSONResponse, Response
 from loguru import logger
 
-# from pydantic import BaseModel
+from pydantic import BaseModel
 from ycecream import y
 import uvicorn
 
 from deeplx_pool import __version__, deeplx_pool
-from proc_file import proc_file
-
-_ = Path.home() / ".diskcache" / "deeplx-sites"
-cache = diskcache.Cache(_)
+from deeplx_pool.latency_stats import LATENCY
+from deeplx_pool.pool_translator import PoolTranslator, TranslateError, TranslateRejected
+from deeplx_pool.rate_limit import LIMITER
+from deeplx_pool.scheduler import Scheduler
+from deeplx_pool.sites_snapshot import SITES
+from proc_file import proc_file_async
 
 y.configure(sln=1, e=0)
 
@@ -45,10 +54,49 @@ e.g. export DXPOOL_TOKENS='["abc123", "linux1", "LINUXDO"]', but is not recommen
 the spirit of sharing.
 """
 
+REFRESH_INTERVAL = 1800.0  # 30 minutes
+PROC_FILE_INTERVAL = 5 * REFRESH_INTERVAL
+SNAPSHOT_INTERVAL = 60.0
+try:
+    REFRESH_INTERVAL = float(os.getenv("DXPOOL_REFRESH_INTERVAL", REFRESH_INTERVAL))
+except (TypeError, ValueError):
+    ...  # default 1800 as above
+try:
+    PROC_FILE_INTERVAL = float(
+        os.getenv("DXPOOL_PROC_FILE_INTERVAL", PROC_FILE_INTERVAL)
+    )
+except (TypeError, ValueError):
+    ...  # default 9000 as above
+try:
+    SNAPSHOT_INTERVAL = float(os.getenv("DXPOOL_SNAPSHOT_INTERVAL", SNAPSHOT_INTERVAL))
+except (TypeError, ValueError):
+    ...  # default 60 as above
+
+SCHEDULER = Scheduler()
+# probing jobs share group "probe": never two at a time
+SCHEDULER.add(
+    "proc_file", proc_file_async, PROC_FILE_INTERVAL, first_delay=0, group="probe"
+)
+SCHEDULER.add("deeplx_pool", deeplx_pool.main_async, REFRESH_INTERVAL, group="probe")
+SCHEDULER.add(
+    "snapshot", lambda: asyncio.to_thread(SITES.reload), SNAPSHOT_INTERVAL
+)
+
+
+@asynccontextmanager
+async def lifespan(app_: FastAPI):  # pylint: disable=unused-argument
+    """Start refresh jobs without waiting for them, stop them on shutdown."""
+    if os.getenv("DXPOOL_SCHEDULER", "1").lower() not in ["0", "false", "no"]:
+        SCHEDULER.start()
+    yield
+    await SCHEDULER.stop()
+
+
 app = FastAPI(
     title="deeplx-pool",
     description=DESC,
     version=__version__,
+    lifespan=lifespan,
 )
 
 # Define a list of valid tokens
@@ -65,6 +113,30 @@ except Exception as exc:
 
 y(TOKENS)
 
+# one selector/breaker board for all translate requests
+TRANSLATOR = PoolTranslator()
+
+# read endpoints serve the last known list right from the start,
+# swapped when a new list is published
+SITES.reload()
+
+
+class TranslateRequest(BaseModel):
+    """DeepLX request body."""
+
+    text: str
+    source_lang: str = ""
+    target_lang: str = ""
+    alternatives: bool = False
+
+
+class BatchTranslateRequest(BaseModel):
+    """Batch request body."""
+
+    texts: List[str]
+    source_lang: str = ""
+    target_lang: str = ""
+
 
 def authenticate_token(authorization: Optional[str] = Header(None)):
     """Authenticate TOKENS if defined."""
@@ -101,116 +173,162 @@ async def read_root():
     return "Welcome to deeplx-pool!"
 
 
+def snapshot_response(body_etag: Tuple[bytes, str], if_none_match: Optional[str]):
+    """Return pre-serialized json, or 304 if the client has it already."""
+    body, etag = body_etag
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if if_none_match:
+        tags = [_.strip().removeprefix("W/") for _ in if_none_match.split(",")]
+        if etag in tags or "*" in tags:
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
 @app.post("/")
 async def fetch_urls(
+    if_none_match: Optional[str] = Header(None),
     token: str = Depends(authenticate_token),  # pylint: disable=unused-argument
 ):
     """Return deeplx site urls."""
-    try:
-        _ = dict(cache.get("deeplx-sites")[:1])  # type: ignore
-    except Exception as exc:
-        logger.error(exc)
-        _ = {"errors": str(exc)}
-    return _
+    return snapshot_response(SITES.current.body(1), if_none_match)
 
 
 @app.post("/all")
 async def fetch_all_urls(
+    if_none_match: Optional[str] = Header(None),
     token: str = Depends(authenticate_token),  # pylint: disable=unused-argument
 ):
     """Return all deeplx site urls."""
-    try:
-        _ = dict(cache.get("deeplx-sites"))  # type: ignore
-    except Exception as exc:
-        logger.error(exc)
-        _ = {"errors": str(exc)}
-    return _
+    return snapshot_response(SITES.current.body(), if_none_match)
 
 
 @app.get("/all")
 async def fetch_all_urls_get(
+    if_none_match: Optional[str] = Header(None),
     token: str = Depends(authenticate_token),  # pylint: disable=unused-argument
 ):
     """Return all deeplx site urls."""
-    try:
-        _ = dict(cache.get("deeplx-sites"))  # type: ignore
-    except Exception as exc:
-        logger.error(exc)
-        _ = {"errors": str(exc)}
-    return _
+    return snapshot_response(SITES.current.body(), if_none_match)
 
 
 @app.post("/num")
 async def post_num(
+    if_none_match: Optional[str] = Header(None),
     token: str = Depends(authenticate_token),  # pylint: disable=unused-argument
 ):
-    """Return all deeplx site urls."""
-    try:
-        _ = len(cache.get("deeplx-sites"))  # type: ignore
-    except Exception as exc:
-        logger.error(exc)
-        _ = str(exc)
-    return _
+    """Return number of deeplx site urls."""
+    return snapshot_response(SITES.current.num_body(), if_none_match)
 
 
 @app.get("/num")
 async def get_num(
+    if_none_match: Optional[str] = Header(None),
     token: str = Depends(authenticate_token),  # pylint: disable=unused-argument
 ):
-    """Return all deeplx site urls."""
-    try:
-        _ = len(cache.get("deeplx-sites"))  # type: ignore
-    except Exception as exc:
-        logger.error(exc)
-        _ = str(exc)
-    return _
+    """Return number of deeplx site urls."""
+    return snapshot_response(SITES.current.num_body(), if_none_match)
 
 
 @app.post("/set")
 async def fetch_n_urls(
     num: int = 0,
+    if_none_match: Optional[str] = Header(None),
     token: str = Depends(authenticate_token),  # pylint: disable=unused-argument
 ):
-    """Return deeplx site urls."""
-    if num == 0:
-        try:
-            _ = dict(cache.get("deeplx-sites"))  # type: ignore
-        except Exception as exc:
-            logger.error(exc)
-            _ = {"errors": str(exc)}
-        return _
-
-    num = max(num, 1)
-
-    try:
-        _ = dict(cache.get("deeplx-sites")[:num])  # type: ignore
-    except Exception as exc:
-        logger.error(exc)
-        _ = {"errors": str(exc)}
-    return _
+    """Return the num fastest deeplx site urls, all if num is 0."""
+    return snapshot_response(SITES.current.body(num), if_none_match)
 
 
 @app.get("/set")
 async def fetch_n_urls_get(
     num: int = 0,
+    if_none_match: Optional[str] = Header(None),
     token: str = Depends(authenticate_token),  # pylint: disable=unused-argument
 ):
-    """Return deeplx site urls."""
-    if num == 0:
-        try:
-            _ = dict(cache.get("deeplx-sites"))  # type: ignore
-        except Exception as exc:
-            logger.error(exc)
-            _ = {"errors": str(exc)}
-        return _
-
-    num = max(num, 1)
+    """Return the num fastest deeplx site urls, all if num is 0."""
+    return snapshot_response(SITES.current.body(num), if_none_match)
+
+
+@app.post("/translate")
+async def translate(
+    req: TranslateRequest,
+    token: str = Depends(authenticate_token),  # pylint: disable=unused-argument
+):
+    """Translate via the pool, DeepLX-compatible request and response."""
     try:
-        _ = dict(cache.get("deeplx-sites")[:num])  # type: ignore
-    except Exception as exc:
-        logger.error(exc)
-        _ = {"errors": str(exc)}
-    return _
+        trtext, alts = await TRANSLATOR.translate_full(
+            req.text, req.source_lang, req.target_lang, req.alternatives
+        )
+    except TranslateRejected as exc:
+        # the text, not the pool: a client error
+        logger.info(exc)
+        status_code = exc.status if exc.status in (400, 422) else 422
+        raise HTTPException(status_code=status_code, detail=str(exc)) from exc
+    except TranslateError as exc:
+        logger.warning(exc)
+        raise HTTPException(status_code=503, detail=str(exc)) from exc
+    return {
+        "code": 200,
+        "data": trtext,
+        "alternatives": alts,
+        "source_lang": req.source_lang,
+        "target_lang": req.target_lang,
+        "method": "deeplx-pool",
+    }
+
+
+@app.post("/translate/batch")
+async def translate_batch(
+    req: BatchTranslateRequest,
+    token: str = Depends(authenticate_token),  # pylint: disable=unused-argument
+):
+    """Translate texts via the pool, null for texts not done in time."""
+    try:
+        trtexts = await TRANSLATOR.translate_batch(
+            req.texts, req.source_lang, req.target_lang
+        )
+    except TranslateError as exc:
+        logger.warning(exc)
+        raise HTTPException(status_code=503, detail=str(exc)) from exc
+    return {
+        "code": 200,
+        "data": trtexts,
+        "source_lang": req.source_lang,
+        "target_lang": req.target_lang,
+        "method": "deeplx-pool",
+    }
+
+
+@app.get("/jobs")
+async def get_jobs(
+    token: str = Depends(authenticate_token),  # pylint: disable=unused-argument
+):
+    """Return run stats of the refresh jobs."""
+    return SCHEDULER.snapshot()
+
+
+@app.get("/breakers")
+async def get_breakers(
+    token: str = Depends(authenticate_token),  # pylint: disable=unused-argument
+):
+    """Return circuit breaker states of urls used by /translate."""
+    return TRANSLATOR.breakers.snapshot()
+
+
+@app.get("/latency")
+async def get_latency(
+    token: str = Depends(authenticate_token),  # pylint: disable=unused-argument
+):
+    """Return p50/p95/p99 of recent translation calls per url."""
+    return LATENCY.snapshot()
+
+
+@app.get("/limits")
+async def get_limits(
+    token: str = Depends(authenticate_token),  # pylint: disable=unused-argument
+):
+    """Return learned rate limits of urls that answered 429."""
+    return LIMITER.snapshot()
 
 
 @app.get("/health", include_in_schema=False)
@@ -229,21 +347,7 @@ async def health_head():
     )
 
 
-def run_deeplx_pool_main():
-    """Prep for Thread."""
-    # while True:
-    for count in cycle(range(5)):
-        if count:
-            y(count)
-            deeplx_pool.main()
-        else:  # run proc_file every 5 runs
-            y(count)
-            proc_file()
-        sleep(1800)  # 30 minutes
-
-
 if __name__ == "__main__":
-    Thread(target=run_deeplx_pool_main).start()
     host = os.getenv("DXPOOL_HOST", "0.0.0.0")
     port = os.getenv("DXPOOL_PORT", "8787")
     try:
@@ -254,7 +358,4 @@ if __name__ == "__main__":
         logger.warning(f"port: {port} is reserved, setting to 8787")
         port = 8787
 
-    # run proc_file.py first, default linuxdo216930.txt
-    subprocess.run("uv run python proc_file.py", shell=True)
-
     uvicorn.run(app, host=host, port=port)
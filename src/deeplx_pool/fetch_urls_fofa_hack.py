@@ -2,6 +2,7 @@
 # pylint: disable=invalid-name, line-too-long, broad-exception-caught
 
 from random import choice
+from time import monotonic
 
 from fofa_hack import fofa
 from loguru import logger
@@ -13,19 +14,24 @@ query_def3 = '''"welcome to deeplx" && country="CN"'''
 queries = [query_def1, query_def2, query_def3]
 
 
-def fetch_urls_fofa_hack(query="", endcount=10, proxies=None):
+def fetch_urls_fofa_hack(query="", endcount=10, proxies=None, timeout=None):
     """
     Fetch urls from fofa using fofa-hack.
 
     e.g. proxies={"https": "socks5://127.0.0.1:11080"}
+
+    timeout: seconds for each fofa request and for all of them, no next
+    page is fetched once it has passed, None for fofa-hack's 180 per request
     """
     if not query:
         query = choice(queries)
         logger.debug(f"{query=}")
     urls = []
 
-    result_generator = fofa.api(query, endcount=endcount, proxy=proxies)
+    kwargs = {} if timeout is None else {"timeout": timeout}
+    result_generator = fofa.api(query, endcount=endcount, proxy=proxies, **kwargs)
 
+    then = monotonic()
     for elm in result_generator:
         try:
             urls.extend(elm)
@@ -33,4 +39,7 @@ def fetch_urls_fofa_hack(query="", endcount=10, proxies=None):
             logger.error(exc)
         except Exception as exc:
             logger.error(exc)
+        if timeout is not None and monotonic() - then > timeout:
+            logger.info(f"{len(urls)} urls, {timeout=} reached")
+            break
     return urls
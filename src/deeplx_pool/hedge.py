@@ -0,0 +1,207 @@
+"""
+Hedged requests: a slow request gets a duplicate on a second url, the first good answer wins.
+
+budget = HedgeBudget()  # one per batch, hedges at most ~HEDGE_BUDGET of requests
+url, trtext = await hedged(
+    lambda url: deeplx_client_async(text, url=url), selector, budget
+)
+# trtext is the translation, or the exception of the last request that failed
+
+A request not back within the p95 latency of its url (selector stats,
+latency_stats.TAIL_QUANTILE, the ewma prior until MIN_SAMPLES are in, at
+least HEDGE_MIN_DELAY seconds) is sent again to another url if the budget
+has a token. Every request earns the budget `ratio` tokens, a hedge costs
+one, so hedges stay at about ratio of all requests (plus one to start with).
+The loser is cancelled and released with selector.cancel: it is neither
+a failure nor a latency sample. So is a request the deeplx rejected
+(retry_policy.NON_RETRYABLE, e.g. 400): the text is bad, not the url,
+and one that never went out (NOT_SENT, rate_limit.RateLimited).
+
+env vars: DXPOOL_HEDGE=1 turns hedging on by default in batch_deeplx_tr,
+DXPOOL_HEDGE_BUDGET (default 0.05), DXPOOL_HEDGE_MIN_DELAY (default 1)
+"""
+
+import asyncio
+import os
+from time import monotonic
+from typing import Awaitable, Callable, Dict, Iterable, Optional, Tuple, Union
+
+from loguru import logger
+
+from deeplx_pool.endpoint_selector import DEFAULT_LATENCY, MIN_SAMPLES, Selector
+from deeplx_pool.latency_stats import TAIL_QUANTILE
+from deeplx_pool.retry_policy import NON_RETRYABLE, NOT_SENT, classify
+
+HEDGE = os.getenv("DXPOOL_HEDGE", "0").lower() in ["1", "true", "yes"]
+
+HEDGE_BUDGET = 0.05  # hedges per request
+HEDGE_MIN_DELAY = 1.0  # seconds, never hedge earlier
+HEDGE_BURST = 2.0  # max tokens saved up
+
+try:
+    HEDGE_BUDGET = float(os.getenv("DXPOOL_HEDGE_BUDGET", HEDGE_BUDGET))
+except (TypeError, ValueError):
+    ...  # default 0.05 as above
+try:
+    HEDGE_MIN_DELAY = float(os.getenv("DXPOOL_HEDGE_MIN_DELAY", HEDGE_MIN_DELAY))
+except (TypeError, ValueError):
+    ...  # default 1 as above
+
+
+class HedgeBudget:
+    """Token bucket for hedges, refilled by requests, not by time."""
+
+    def __init__(
+        self,
+        ratio: float = HEDGE_BUDGET,
+        burst: float = HEDGE_BURST,
+        min_delay: float = HEDGE_MIN_DELAY,
+    ):
+        """
+        Init with one token.
+
+        Args:
+        ----
+        ratio: tokens earned per request, i.e. the share of extra requests
+        burst: max tokens saved up
+        min_delay: seconds a request has at least before it is hedged
+
+        """
+        self.ratio = ratio
+        self.burst = max(1.0, burst)
+        self.min_delay = min_delay
+        self.tokens = 1.0
+        self.requests = 0
+        self.hedges = 0
+        self.wins = 0  # hedges that answered first
+
+    def on_request(self):
+        """Count a (primary) request."""
+        self.requests += 1
+        self.tokens = min(self.burst, self.tokens + self.ratio)
+
+    def try_spend(self) -> bool:
+        """Take a token for a hedge, return False if there is none."""
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        self.hedges += 1
+        return True
+
+    def snapshot(self) -> dict:
+        """Return counts, for logs."""
+        return {"requests": self.requests, "hedges": self.hedges, "wins": self.wins}
+
+
+def hedge_delay(selector: Selector, url: str, min_delay: float = HEDGE_MIN_DELAY) -> float:
+    """Return seconds to wait for url before hedging: its p95, or latency prior."""
+    stats = selector.stats.get(url)
+    if stats is None:  # removed in the mean time
+        return max(min_delay, DEFAULT_LATENCY)
+    if len(stats.window) >= MIN_SAMPLES:
+        delay = stats.window.quantile(TAIL_QUANTILE)
+    else:
+        delay = stats.latency
+    return max(min_delay, delay or 0.0)
+
+
+async def hedged(
+    call: Callable[[str], Awaitable[str]],
+    selector: Selector,
+    budget: Optional[HedgeBudget] = None,
+    is_ok: Callable[[str], bool] = lambda trtext: bool(trtext.strip()),
+    avoid: Iterable[str] = (),
+) -> Tuple[str, Union[str, BaseException]]:
+    """
+    Call a url picked by selector, hedge on a second url if it is slow.
+
+    Args:
+    ----
+    call: coroutine function url -> translation
+    selector: picks the urls, acquire/release/cancel are done here
+    budget: hedges allowed, no hedging if None
+    is_ok: tells a good translation from a bad one (e.g. empty)
+    avoid: urls not to pick unless there is no other, e.g. backing off
+
+    Returns:
+    -------
+    (url, translation) of the first good answer, or (url, exception or bad
+    translation) of the last request if none was good; a result that is not
+    a str (e.g. None, json without "data") comes back as a TypeError
+
+    Raises:
+    ------
+    LookupError if selector has no url
+
+    """
+    async def run(url_):
+        # errors raised by call itself end up in the task too
+        return await call(url_)
+
+    avoid = list(avoid)
+
+    def select(exclude):
+        try:
+            return selector.select(exclude=[*exclude, *avoid])
+        except LookupError:
+            return selector.select(exclude=exclude)
+
+    url = select([])
+    selector.acquire(url)
+    # task -> (url, started)
+    tasks: Dict[asyncio.Task, Tuple[str, float]] = {
+        asyncio.create_task(run(url)): (url, monotonic())
+    }
+    if budget is not None:
+        budget.on_request()
+
+    result: Tuple[str, Union[str, BaseException]] = (url, LookupError("no result"))
+    try:
+        if budget is not None:
+            delay = hedge_delay(selector, url, budget.min_delay)
+            _, slow = await asyncio.wait(set(tasks), timeout=delay)
+            if slow and budget.try_spend():
+                try:
+                    url2 = select([url])
+                except LookupError:
+                    url2 = ""
+                if url2:
+                    logger.trace(f"hedge: {url} slower than {delay:.1f}s, also {url2}")
+                    selector.acquire(url2)
+                    task = asyncio.create_task(run(url2))
+                    tasks[task] = (url2, monotonic())
+
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            good = False
+            for task in done:
+                url_, started = tasks.pop(task)
+                exc = asyncio.CancelledError() if task.cancelled() else task.exception()
+                trtext = exc if exc is not None else task.result()
+                if exc is None and not isinstance(trtext, str):
+                    # not a deeplx answer, a failed attempt (ENDPOINT_FATAL)
+                    exc = trtext = TypeError(f"{url_}: {trtext!r} instead of a translation")
+                ok = exc is None and is_ok(trtext)  # type: ignore
+                if exc is not None and classify(exc) in (NON_RETRYABLE, NOT_SENT):
+                    selector.cancel(url_)  # no verdict on the url
+                else:
+                    selector.release(url_, monotonic() - started, ok=ok)
+                if ok and not good:
+                    good = True
+                    result = (url_, trtext)  # type: ignore
+                    if budget is not None and url_ != url:
+                        budget.wins += 1
+                elif not good:
+                    result = (url_, trtext)  # type: ignore
+            if good:
+                break
+    finally:
+        # the loser, or all of them if cancelled from outside
+        for task, (url_, _) in tasks.items():
+            task.cancel()
+            selector.cancel(url_)
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    return result
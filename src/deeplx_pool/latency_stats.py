@@ -0,0 +1,114 @@
+"""
+Rolling latency windows per url, for ranking by tail latency instead of one probe.
+
+LATENCY.record("http://a", 0.42)  # every deeplx_client_async call does this
+LATENCY.quantile("http://a", 0.95)
+LATENCY.snapshot()
+{'http://a': {'n': 57, 'p50': 0.41, 'p95': 1.9, 'p99': 3.2}, ...}
+
+Each url keeps its last WINDOW successful latencies. Quantiles are
+nearest-rank over the sorted window, sorted at most once per change.
+Probe latencies live in endpoint_registry's per-record history and are
+combined with these live samples there (EndpointRegistry.rescore).
+
+env vars: DXPOOL_LATENCY_WINDOW (default 100), DXPOOL_TAIL_QUANTILE (default 0.95)
+"""
+
+import os
+from collections import deque
+from math import ceil
+from typing import Dict, Iterable, List, Optional
+
+WINDOW = 100  # samples kept per url
+TAIL_QUANTILE = 0.95  # used for ranking
+
+try:
+    WINDOW = int(os.getenv("DXPOOL_LATENCY_WINDOW", WINDOW))
+except (TypeError, ValueError):
+    ...  # default 100 as above
+try:
+    TAIL_QUANTILE = float(os.getenv("DXPOOL_TAIL_QUANTILE", TAIL_QUANTILE))
+except (TypeError, ValueError):
+    ...  # default 0.95 as above
+
+
+def quantile(samples: Iterable[float], q: float, is_sorted: bool = False) -> Optional[float]:
+    """Return the nearest-rank q-quantile (0 < q <= 1) of samples, None if there are none."""
+    _ = list(samples) if is_sorted else sorted(samples)
+    if not _:
+        return None
+    idx = min(len(_) - 1, max(0, ceil(q * len(_)) - 1))
+    return _[idx]
+
+
+class LatencyWindow:
+    """The last maxlen latencies of one url."""
+
+    __slots__ = ("samples", "_sorted")
+
+    def __init__(self, maxlen: int = WINDOW):
+        """Init empty."""
+        self.samples: deque = deque(maxlen=max(1, maxlen))
+        self._sorted: Optional[List[float]] = None
+
+    def __len__(self):
+        """Return number of samples."""
+        return len(self.samples)
+
+    def add(self, latency: float):
+        """Add a sample, the oldest one drops out when full."""
+        self.samples.append(latency)
+        self._sorted = None
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Return the q-quantile, None if empty."""
+        if self._sorted is None:
+            self._sorted = sorted(self.samples)
+        return quantile(self._sorted, q, is_sorted=True)
+
+    def snapshot(self) -> dict:
+        """Return n, p50, p95, p99."""
+        _ = {"n": len(self.samples)}
+        for name, q in [("p50", 0.5), ("p95", 0.95), ("p99", 0.99)]:
+            value = self.quantile(q)
+            _[name] = None if value is None else round(value, 3)
+        return _
+
+
+class LatencyStats:
+    """LatencyWindow per url."""
+
+    def __init__(self, window: int = WINDOW):
+        """Init."""
+        self.window = window
+        self.windows: Dict[str, LatencyWindow] = {}
+
+    def record(self, url: str, latency: float, ok: bool = True):
+        """Add a latency of url, failed requests are left to the circuit breakers."""
+        if not ok or latency is None:
+            return
+        _ = self.windows.get(url)
+        if _ is None:
+            _ = self.windows[url] = LatencyWindow(self.window)
+        _.add(latency)
+
+    def samples(self, url: str) -> List[float]:
+        """Return the samples of url, oldest first."""
+        _ = self.windows.get(url)
+        return [] if _ is None else list(_.samples)
+
+    def quantile(self, url: str, q: float = TAIL_QUANTILE) -> Optional[float]:
+        """Return the q-quantile of url, None if no samples."""
+        _ = self.windows.get(url)
+        return None if _ is None else _.quantile(q)
+
+    def clear(self):
+        """Forget all samples."""
+        self.windows.clear()
+
+    def snapshot(self) -> Dict[str, dict]:
+        """Return url -> n, p50, p95, p99."""
+        return {url: _.snapshot() for url, _ in self.windows.items()}
+
+
+LATENCY = LatencyStats()
@@ -0,0 +1,112 @@
+"""
+In-process counters, flushed to diskcache now and then instead of on every increment.
+
+metrics = MetricsRegistry()
+metrics.incr("workers_succ", wid)
+metrics.incr("endpoints_fail", url)
+
+metrics.get("workers_succ")  # Counter({0: 12, 1: 9, ...})
+
+# add what was counted since the last flush to the cache ("workers_succ" ->
+# {0: 12, 1: 9, ...}) in an executor
+await metrics.aflush()
+
+# or every FLUSH_INTERVAL seconds until cancelled
+flusher = asyncio.create_task(metrics.periodic_flush())
+
+incr never awaits, so with all workers on one event loop an increment
+cannot be interleaved with another one: no lock, no lost update.
+
+Flushes merge into the cached counters instead of overwriting them, so
+registries of concurrent batches (e.g. PoolTranslator's in fastapi_app)
+sharing a cache all end up in the totals.
+"""
+
+import asyncio
+import os
+import threading
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Dict, Hashable, Optional
+
+import diskcache
+from loguru import logger
+
+cache = diskcache.Cache(Path.home() / ".diskcache" / "deeplx-sites")
+
+FLUSH_INTERVAL = 10.0
+try:
+    FLUSH_INTERVAL = float(os.getenv("DXPOOL_METRICS_FLUSH_INTERVAL", FLUSH_INTERVAL))
+except (TypeError, ValueError):
+    ...  # default 10 as above
+
+
+class MetricsRegistry:
+    """Named counters keyed by worker id, url etc."""
+
+    def __init__(self, cache_: Optional[diskcache.Cache] = None, prefix: str = ""):
+        """
+        Init.
+
+        Args:
+        ----
+        cache_: diskcache to flush to, default ~/.diskcache/deeplx-sites
+        prefix: prepended to counter names for the cache keys
+
+        """
+        self.cache = cache if cache_ is None else cache_
+        self.prefix = prefix
+        self.counters: Dict[str, Counter] = defaultdict(Counter)
+        # what is in the cache already, flushes may run in executor threads
+        self.flushed: Dict[str, Counter] = defaultdict(Counter)
+        self.lock = threading.Lock()
+
+    def incr(self, name: str, key: Hashable, inc: int = 1):
+        """Increase counter name[key] by inc."""
+        self.counters[name][key] += inc
+
+    def get(self, name: str) -> Counter:
+        """Return counter name (empty if unknown)."""
+        return self.counters.get(name) or Counter()
+
+    def total(self, name: str) -> int:
+        """Return sum of counter name."""
+        return sum(self.get(name).values())
+
+    def snapshot(self) -> Dict[str, dict]:
+        """Return a plain-dict copy of all counters."""
+        return {name: dict(counter) for name, counter in self.counters.items()}
+
+    def flush(self, snapshot: Optional[Dict[str, dict]] = None):
+        """Add counts not flushed yet to the cached counters, blocking."""
+        if snapshot is None:
+            snapshot = self.snapshot()
+        with self.lock:
+            for name, counter in snapshot.items():
+                delta = Counter(counter) - self.flushed[name]
+                if not delta:
+                    continue
+                key = f"{self.prefix}{name}"
+                with self.cache.transact():
+                    cached = self.cache.get(key)
+                    # older versions stored lists (one count per worker), start over
+                    merged = Counter(cached) if isinstance(cached, dict) else Counter()
+                    merged.update(delta)
+                    self.cache.set(key, dict(merged))
+                # a late older snapshot must not undo a newer one
+                self.flushed[name] |= Counter(counter)
+
+    async def aflush(self):
+        """Write counters to cache in an executor, snapshot taken on the loop."""
+        snapshot = self.snapshot()
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.flush, snapshot)
+
+    async def periodic_flush(self, interval: float = FLUSH_INTERVAL):
+        """Flush every interval seconds until cancelled."""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.aflush()
+            except Exception as exc:  # pylint: disable=broad-exception-caught
+                logger.warning(f"metrics flush failed: {exc}")
@@ -0,0 +1,243 @@
+"""
+Pack short texts into one request, split overlong ones, and undo both afterwards.
+
+packer = Packer()
+units = packer.pack([(0, "one"), (1, "two"), (2, long_text)])
+# [(0, "one\ntwo"), (1, "first sentences..."), (2, "more sentences...")]
+
+# per translated unit: finished (seqno, trtext) and units to (re)send
+done, units1 = packer.unpack(0, "eins\nzwei")
+# [(0, "eins"), (1, "zwei")], []
+
+Short texts are joined with DELIM (a newline, which survives translation)
+up to PACK_BUDGET chars. If a translated pack does not split back into as
+many lines, its texts are sent again one by one; so are texts whose line
+came back empty (an empty translation of a single text is a failure too). Texts longer than
+MAX_CHARS are cut at sentence boundaries (a sentence longer than that at
+whitespace) and the translated pieces are joined with the whitespace
+that followed each piece in the original.
+"""
+
+import os
+import re
+from typing import Dict, List, Tuple
+
+DELIM = "\n"
+PACK_BUDGET = 1000  # chars per packed request
+PACK_MAX_ITEMS = 50  # texts per packed request
+MAX_CHARS = 3000  # longer texts are split
+
+try:
+    PACK_BUDGET = int(os.getenv("DXPOOL_PACK_BUDGET", PACK_BUDGET))
+except (TypeError, ValueError):
+    ...  # default 1000 as above
+try:
+    MAX_CHARS = int(os.getenv("DXPOOL_MAX_CHARS", MAX_CHARS))
+except (TypeError, ValueError):
+    ...  # default 3000 as above
+
+# end of a sentence: terminal punctuation, closing quotes/brackets, whitespace
+SENTENCE_END = re.compile(r"""[.!?;。！？；…]+["'”’)\]）」』]*\s*""")
+
+
+def split_sentences(text: str, max_chars: int = MAX_CHARS) -> List[str]:
+    """
+    Split text into pieces of at most max_chars, at sentence boundaries if possible.
+
+    "".join(pieces) == text, trailing whitespace stays with each piece.
+    """
+    if len(text) <= max_chars:
+        return [text]
+
+    sentences = []
+    start = 0
+    for match in SENTENCE_END.finditer(text):
+        if match.end() > start:
+            sentences.append(text[start : match.end()])
+            start = match.end()
+    if start < len(text):
+        sentences.append(text[start:])
+
+    # a sentence too long on its own: cut at the last whitespace within max_chars
+    chunks = []
+    for sentence in sentences:
+        while len(sentence) > max_chars:
+            cut = max(sentence.rfind(" ", 0, max_chars), sentence.rfind("\n", 0, max_chars))
+            cut = cut + 1 if cut > 0 else max_chars
+            chunks.append(sentence[:cut])
+            sentence = sentence[cut:]
+        if sentence:
+            chunks.append(sentence)
+
+    # greedily merge sentences back up to max_chars
+    pieces = [chunks[0]]
+    for chunk in chunks[1:]:
+        if len(pieces[-1]) + len(chunk) <= max_chars:
+            pieces[-1] += chunk
+        else:
+            pieces.append(chunk)
+    return pieces
+
+
+class Packer:
+    """
+    Turn (seqno, text) into request units and translated units back into (seqno, trtext).
+
+    Keeps track of what each unit id stands for:
+    a single text, a pack of texts or a piece of a split text.
+    """
+
+    def __init__(
+        self,
+        budget: int = PACK_BUDGET,
+        max_chars: int = MAX_CHARS,
+        max_items: int = PACK_MAX_ITEMS,
+        delim: str = DELIM,
+    ):
+        """
+        Init.
+
+        Args:
+        ----
+        budget: max chars of a packed request, 0 to not pack
+        max_chars: texts longer than this are split, 0 to not split
+        max_items: max texts in a packed request
+        delim: joins packed texts, must survive translation
+
+        """
+        self.budget = budget
+        self.max_chars = max_chars
+        self.max_items = max_items
+        self.delim = delim
+
+        self.next_id = 0
+        # unit_id -> ("single", seqno) | ("pack", [seqno, ...]) | ("piece", seqno, idx)
+        self.units: Dict[int, tuple] = {}
+        self.texts: Dict[int, str] = {}
+        # seqno -> [trtext or None per piece], [trailing whitespace per piece]
+        self.pieces: Dict[int, Tuple[List, List[str]]] = {}
+
+    def _new_unit(self, plan: tuple, text: str, units: List[Tuple[int, str]]):
+        units.append((self.next_id, text))
+        self.units[self.next_id] = plan
+        self.next_id += 1
+
+    def packable(self, text: str) -> bool:
+        """Return True if text can share a request with others."""
+        return (
+            self.budget > 0
+            and 0 < len(text) < self.budget
+            and self.delim not in text
+            and bool(text.strip())
+        )
+
+    def pack(self, items: List[Tuple[int, str]]) -> List[Tuple[int, str]]:
+        """Return (unit_id, text) to send for (seqno, text) items."""
+        units: List[Tuple[int, str]] = []
+        batch: List[int] = []
+        size = 0
+
+        def flush():
+            nonlocal size
+            if len(batch) == 1:
+                self._new_unit(("single", batch[0]), self.texts[batch[0]], units)
+            elif batch:
+                text = self.delim.join(self.texts[seqno] for seqno in batch)
+                self._new_unit(("pack", batch[:]), text, units)
+            batch.clear()
+            size = 0
+
+        for seqno, text in items:
+            self.texts[seqno] = text
+            if self.packable(text):
+                if batch and (
+                    size + len(self.delim) + len(text) > self.budget
+                    or len(batch) >= self.max_items
+                ):
+                    flush()
+                size += len(text) + (len(self.delim) if batch else 0)
+                batch.append(seqno)
+            elif self.max_chars > 0 and len(text) > self.max_chars:
+                pieces = split_sentences(text, self.max_chars)
+                trailing = [piece[len(piece.rstrip()) :] for piece in pieces]
+                self.pieces[seqno] = ([None] * len(pieces), trailing)
+                for idx, piece in enumerate(pieces):
+                    self._new_unit(("piece", seqno, idx), piece.rstrip(), units)
+            else:
+                self._new_unit(("single", seqno), text, units)
+        flush()
+
+        return units
+
+    def seqnos(self, unit_id: int) -> List[int]:
+        """Return seqnos of the texts in a unit not unpacked yet, [] if unknown."""
+        plan = self.units.get(unit_id)
+        if plan is None:
+            return []
+        if plan[0] == "pack":
+            return list(plan[1])
+        return [plan[1]]
+
+    def split(self, unit_id: int) -> List[Tuple[int, str]]:
+        """Replace a pack by one unit per text and return those, [] if unit_id is not a pack."""
+        plan = self.units.get(unit_id)
+        if plan is None or plan[0] != "pack":
+            return []
+        del self.units[unit_id]
+        units: List[Tuple[int, str]] = []
+        for seqno in plan[1]:
+            self._new_unit(("single", seqno), self.texts[seqno], units)
+        return units
+
+    def drop(self, unit_id: int) -> List[int]:
+        """Forget a unit given up on, return the seqnos in it, other pieces of a split text are ignored."""
+        seqnos = self.seqnos(unit_id)
+        plan = self.units.pop(unit_id, None)
+        if plan is not None and plan[0] == "piece":
+            self.pieces.pop(plan[1], None)
+        return seqnos
+
+    def unpack(
+        self, unit_id: int, trtext: str
+    ) -> Tuple[List[Tuple[int, str]], List[Tuple[int, str]]]:
+        """
+        Take the translation of a unit.
+
+        Returns:
+        -------
+        finished (seqno, trtext), units to send (again) if a pack did not split back
+
+        """
+        plan = self.units.pop(unit_id)
+        kind = plan[0]
+
+        if kind == "single":
+            return [(plan[1], trtext)], []
+
+        if kind == "pack":
+            seqnos = plan[1]
+            parts = trtext.strip(self.delim).split(self.delim)
+            units: List[Tuple[int, str]] = []
+            if len(parts) == len(seqnos):
+                finished = []
+                for seqno, part in zip(seqnos, parts):
+                    if part.strip():
+                        finished.append((seqno, part))
+                    else:  # packed texts are never empty: send it again alone
+                        self._new_unit(("single", seqno), self.texts[seqno], units)
+                return finished, units
+            # lines merged or split by the translator: one request per text
+            for seqno in seqnos:
+                self._new_unit(("single", seqno), self.texts[seqno], units)
+            return [], units
+
+        # a piece, of a text not given up on
+        _, seqno, idx = plan
+        if seqno not in self.pieces:
+            return [], []
+        trpieces, trailing = self.pieces[seqno]
+        trpieces[idx] = trtext.rstrip()
+        if any(elm is None for elm in trpieces):
+            return [], []
+        del self.pieces[seqno]
+        return [(seqno, "".join(p + ws for p, ws in zip(trpieces, trailing)))], []
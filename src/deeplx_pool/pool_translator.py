@@ -0,0 +1,267 @@
+"""
+Translate through the pool: pick a url, fail over to another one on errors.
+
+translator = PoolTranslator()
+trtext = await translator.translate("hello", target_lang="de")
+trtext, alts = await translator.translate_full("hello", target_lang="de", alternatives=True)
+trtexts = await translator.translate_batch(["hello", "world"], target_lang="de")
+# ["hallo", "Welt"], None for a text not done in time
+
+One long-lived selector and circuit breaker board serve all requests, so
+every request benefits from what earlier ones learned about the urls.
+Urls are reloaded from cache.get("deeplx-sites") every REFRESH_INTERVAL
+seconds, known urls keep their stats.
+
+Used by fastapi_app's POST /translate and POST /translate/batch.
+"""
+
+import asyncio
+import os
+from pathlib import Path
+from time import monotonic
+from typing import List, Optional, Tuple, Union
+
+import diskcache
+from loguru import logger
+
+from deeplx_pool.batch_deeplx_tr import ATTEMPT_TIMEOUT, batch_deeplx_tr
+from deeplx_pool.circuit_breaker import CircuitBreakerBoard
+from deeplx_pool.deeplx_client_async import deeplx_client_async
+from deeplx_pool.endpoint_selector import Selector, make_selector
+from deeplx_pool.rate_limit import LIMITER
+from deeplx_pool.retry_policy import NON_RETRYABLE, NOT_SENT, RetryPolicy
+from deeplx_pool.tr_cache import TR_CACHE, TranslationCache
+
+cache = diskcache.Cache(Path.home() / ".diskcache" / "deeplx-sites")
+
+MAX_ATTEMPTS = 3  # urls tried per text in translate
+REFRESH_INTERVAL = 60  # seconds between url reloads
+BATCH_WORKERS = None  # adaptive, see concurrency
+BATCH_TIMEOUT = 60.0  # seconds for translate_batch
+
+try:
+    MAX_ATTEMPTS = int(os.getenv("DXPOOL_TR_MAX_ATTEMPTS", MAX_ATTEMPTS))
+except (TypeError, ValueError):
+    ...  # default 3 as above
+try:
+    BATCH_TIMEOUT = float(os.getenv("DXPOOL_TR_BATCH_TIMEOUT", BATCH_TIMEOUT))
+except (TypeError, ValueError):
+    ...  # default 60 as above
+
+
+class TranslateError(Exception):
+    """No url delivered a translation."""
+
+
+class TranslateRejected(TranslateError):
+    """The deeplx rejected the text (retry_policy.NON_RETRYABLE), no url will take it."""
+
+    def __init__(self, message: str, status: int = 400):
+        """Init with the deeplx's http status."""
+        super().__init__(message)
+        self.status = status
+
+
+class PoolTranslator:
+    """Translate with failover over urls in cache.get("deeplx-sites")."""
+
+    def __init__(
+        self,
+        policy: Union[str, Selector, None] = None,
+        breakers: Optional[CircuitBreakerBoard] = None,
+        max_attempts: int = MAX_ATTEMPTS,
+        cache_: Optional[diskcache.Cache] = None,
+        tr_cache: Optional[TranslationCache] = TR_CACHE,
+    ):
+        """
+        Init.
+
+        Args:
+        ----
+        policy: selector policy name or a Selector, default env DXPOOL_SELECTOR or p2c
+        breakers: circuit breakers, a new board if None
+        max_attempts: urls tried per text before giving up
+        cache_: diskcache with the "deeplx-sites" key, default ~/.diskcache/deeplx-sites
+        tr_cache: translation cache, None for no cache
+
+        """
+        self.cache = cache if cache_ is None else cache_
+        if breakers is None:
+            breakers = CircuitBreakerBoard()
+        self.selector = make_selector(policy, (), breakers)
+        if self.selector.breakers is None:
+            self.selector.breakers = breakers
+        self.breakers = self.selector.breakers
+        self.max_attempts = max(1, max_attempts)
+        self.tr_cache = tr_cache
+        # url backoff shared by translate and all batches
+        self.retry_policy = RetryPolicy()
+        self.refreshed_at = -float("inf")
+
+    async def refresh(self, force: bool = False):
+        """Sync selector urls with cache.get("deeplx-sites"), at most every REFRESH_INTERVAL seconds."""
+        if not force and monotonic() - self.refreshed_at < REFRESH_INTERVAL:
+            return
+        self.refreshed_at = monotonic()
+
+        # sqlite read in a thread, the loop keeps serving requests
+        sites = await asyncio.to_thread(self.cache.get, "deeplx-sites") or []
+        urls = dict(sites)  # type: ignore
+        for url in list(self.selector.stats):
+            if url not in urls:
+                self.selector.remove(url)
+        for url, latency in urls.items():
+            self.selector.add(url, latency)
+        logger.debug(f"{len(self.selector)} urls")
+
+    async def translate(
+        self,
+        text: str,
+        source_lang: str = "",
+        target_lang: str = "",
+        alternatives: bool = False,
+    ) -> str:
+        """
+        Translate text, trying up to max_attempts different urls.
+
+        With alternatives, they are appended as "translation / alt1, alt2"
+        (deeplx_client_async's format), see translate_full for a list.
+
+        Raises:
+        ------
+        TranslateError if no url delivered a translation
+
+        """
+        trtext, alts = await self.translate_full(text, source_lang, target_lang, alternatives)
+        if alts:
+            return f"{trtext} / {', '.join(alts)}"
+        return trtext
+
+    async def translate_full(
+        self,
+        text: str,
+        source_lang: str = "",
+        target_lang: str = "",
+        alternatives: bool = False,
+    ) -> Tuple[str, List[str]]:
+        """
+        Translate text, return the translation and the deeplx's alternatives.
+
+        urls backing off after recent failures are tried last, a request
+        the deeplx rejects (e.g. 400) is not tried on other urls.
+
+        Returns:
+        -------
+        (translation, alternatives), alternatives [] if not asked for
+
+        Raises:
+        ------
+        TranslateError if no url delivered a translation
+
+        """
+        await self.refresh()
+
+        if not text.strip():
+            return "", []
+
+        use_cache = self.tr_cache is not None and not alternatives
+        if use_cache:
+            trtext = await self.tr_cache.aget(text, source_lang, target_lang)  # type: ignore
+            if trtext is not None:
+                return trtext, []
+
+        tried: List[str] = []
+        error: Union[str, Exception] = "no deeplx url available"
+        attempts = 0  # requests that went out; tried urls end the loop anyway
+        while attempts < self.max_attempts:
+            try:
+                url = self.selector.select(
+                    exclude=tried
+                    + self.retry_policy.backing_off(self.selector.stats)
+                    + LIMITER.limited(self.selector.stats)
+                )
+            except LookupError:
+                try:
+                    url = self.selector.select(exclude=tried)
+                except LookupError:
+                    break
+            tried.append(url)
+
+            self.selector.acquire(url)
+            started = monotonic()
+            # None: no verdict for url (cancelled, not sent or rejected)
+            verdict: Optional[bool] = None
+            try:
+                trtext, alts = await deeplx_client_async(  # type: ignore
+                    text,
+                    source_lang,
+                    target_lang,
+                    alternatives,
+                    url=url,
+                    timeout=ATTEMPT_TIMEOUT,
+                    split=True,
+                )
+            except Exception as exc:  # pylint: disable=broad-exception-caught
+                logger.debug(f"{url=} failed: {exc}")
+                error = exc
+                kind = self.retry_policy.on_failure(url, exc)
+                if kind == NOT_SENT:
+                    # no rate limit token in time: next url, no attempt used
+                    continue
+                attempts += 1
+                if kind == NON_RETRYABLE:
+                    # the text is bad, not the url
+                    status = getattr(getattr(exc, "response", None), "status_code", 400)
+                    raise TranslateRejected(f"rejected by {url}: {exc}", status) from exc
+                verdict = False
+                continue
+            else:
+                # empty translation of a non-empty text counts as a failure
+                attempts += 1
+                verdict = isinstance(trtext, str) and bool(trtext.strip())
+                if verdict:
+                    self.retry_policy.on_success(url)
+                    if use_cache:
+                        self.tr_cache.set(text, trtext, source_lang, target_lang)  # type: ignore
+                    return trtext, alts
+                if isinstance(trtext, str):
+                    self.retry_policy.on_failure(url, None)
+                    error = f"empty translation from {url}"
+                else:  # json without "data": not a working deeplx
+                    error = TypeError(f"{url}: {trtext!r} instead of a translation")
+                    self.retry_policy.on_failure(url, error)
+            finally:
+                # also on CancelledError, e.g. the http client went away
+                if verdict is None:
+                    self.selector.cancel(url)
+                else:
+                    self.selector.release(url, monotonic() - started, ok=verdict)
+
+        raise TranslateError(f"{len(tried)} url(s) tried, last error: {error}")
+
+    async def translate_batch(
+        self,
+        texts: List[str],
+        source_lang: str = "",
+        target_lang: str = "",
+        timeout: float = BATCH_TIMEOUT,
+    ) -> List[Optional[str]]:
+        """Translate texts with batch_deeplx_tr on the shared selector, None for texts not done in time."""
+        await self.refresh()
+
+        if not self.selector.stats:
+            raise TranslateError("no deeplx url available")
+
+        _ = await batch_deeplx_tr(
+            texts,
+            n_workers=BATCH_WORKERS,
+            selector=self.selector,
+            timeout=timeout,
+            source_lang=source_lang,
+            target_lang=target_lang,
+            tr_cache=self.tr_cache if self.tr_cache is not None else False,
+            retry_policy=self.retry_policy,
+        )
+        # TranslationFailed markers become None
+        trtexts = {seqno: trtext for seqno, trtext in _ if isinstance(trtext, str)}
+        return [trtexts.get(seqno) for seqno in range(len(texts))]
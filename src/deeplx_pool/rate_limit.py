@@ -0,0 +1,233 @@
+"""
+Per-url token buckets whose rates are learned from 429 responses and Retry-After.
+
+await LIMITER.acquire(url)  # deeplx_client_async does this before each request
+LIMITER.on_429(url, resp.headers.get("Retry-After"), sent)  # and this on a 429
+LIMITER.on_success(url)
+
+LIMITER.limited(urls)  # urls without a token now, for the selector to skip
+LIMITER.snapshot()
+{'http://a': {'rate': 1.5, 'tokens': 0.0, 'wait': 0.67}, ...}
+
+A url starts unlimited. Its first 429 sets its rate to DECREASE times the
+request rate it was seeing over the last RATE_WINDOW seconds (at least
+MIN_RATE), and no request goes out before Retry-After (or one token) has
+passed. 429s of requests sent before that cut are part of the same
+overload episode: they may extend the block but do not cut the rate
+again. Each success raises the rate by INCREASE, once above MAX_RATE the
+url is unlimited again. Waiting requests reserve their tokens, so they are
+served in turn; a request that would wait longer than its timeout fails
+right away with RateLimited instead of burning a round trip on a 429.
+
+One LIMITER per process, shared by all batches, workers and
+deeplx_client_async callers.
+
+env vars: DXPOOL_RATE_BURST (default 5), DXPOOL_RATE_MAX_WAIT (default 10)
+"""
+
+import asyncio
+import os
+from collections import deque
+from email.utils import parsedate_to_datetime
+from time import monotonic, time
+from typing import Dict, Iterable, List, Optional
+
+from loguru import logger
+
+INF = float("inf")
+
+BURST = 5.0  # tokens saved up
+MIN_RATE = 0.2  # requests per second
+MAX_RATE = 50.0  # above this a url is unlimited again
+DECREASE = 0.5  # rate factor on a 429
+INCREASE = 0.05  # requests per second added per success
+RATE_WINDOW = 10.0  # seconds of requests the rate on a 429 is learned from
+MAX_RETRY_AFTER = 300.0  # seconds, longer Retry-After are capped
+MAX_WAIT = 10.0  # seconds a request waits for a token if it has no timeout
+
+try:
+    BURST = float(os.getenv("DXPOOL_RATE_BURST", BURST))
+except (TypeError, ValueError):
+    ...  # default 5 as above
+try:
+    MAX_WAIT = float(os.getenv("DXPOOL_RATE_MAX_WAIT", MAX_WAIT))
+except (TypeError, ValueError):
+    ...  # default 10 as above
+
+
+class RateLimited(Exception):
+    """No token for url within the time the request has."""
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Return seconds from a Retry-After header (seconds or http date), None if absent or invalid."""
+    if not value:
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            seconds = parsedate_to_datetime(value).timestamp() - time()
+        except (TypeError, ValueError):
+            return None
+    return min(max(0.0, seconds), MAX_RETRY_AFTER)
+
+
+class TokenBucket:
+    """Token bucket of one url, unlimited until its first 429."""
+
+    __slots__ = ("rate", "burst", "tokens", "stamp", "blocked_until", "recent", "cut_at")
+
+    def __init__(self, burst: float = BURST):
+        """Init, unlimited."""
+        self.rate = INF
+        self.burst = max(1.0, burst)
+        self.tokens = self.burst
+        self.stamp = monotonic()
+        self.blocked_until = 0.0
+        self.recent: deque = deque(maxlen=1000)  # request times
+        self.cut_at = -INF  # time of the last rate cut
+
+    def _refill(self, now: float):
+        # no refill while blocked by Retry-After
+        if self.rate == INF:
+            self.tokens = max(self.tokens, self.burst)
+        elif now > self.blocked_until:
+            elapsed = now - max(self.stamp, self.blocked_until)
+            self.tokens = min(self.burst, self.tokens + elapsed * self.rate)
+        self.stamp = now
+
+    def wait_time(self, now: Optional[float] = None) -> float:
+        """Return seconds until a token is free, 0 if one is free now."""
+        if now is None:
+            now = monotonic()
+        self._refill(now)
+        # the block, then the refill of the tokens reserved by earlier waiters
+        wait = max(0.0, self.blocked_until - now)
+        if self.tokens < 1:
+            wait += (1 - self.tokens) / self.rate
+        return wait
+
+    def take(self, now: Optional[float] = None):
+        """Take a token, possibly one not there yet (a reservation, see wait_time)."""
+        if now is None:
+            now = monotonic()
+        self._refill(now)
+        self.tokens -= 1
+        self.recent.append(now)
+
+    def on_429(
+        self,
+        retry_after: Optional[float] = None,
+        now: Optional[float] = None,
+        sent: Optional[float] = None,
+    ):
+        """
+        Lower the rate to below what was just too much, block for retry_after.
+
+        Args:
+        ----
+        retry_after: seconds from the Retry-After header, None if there is none
+        now: time of the 429, default monotonic()
+        sent: time the request was sent, a request sent before the last cut
+            does not cut the rate again, default now
+
+        """
+        if now is None:
+            now = monotonic()
+        if sent is None:
+            sent = now
+        self._refill(now)
+        if sent >= self.cut_at:
+            observed = sum(1 for elm in self.recent if elm >= now - RATE_WINDOW) / RATE_WINDOW
+            self.rate = max(MIN_RATE, min(self.rate, observed) * DECREASE)
+            self.cut_at = now
+        self.tokens = min(self.tokens, 0.0)
+        if retry_after is None:
+            retry_after = 1 / self.rate
+        self.blocked_until = max(self.blocked_until, now + retry_after)
+
+    def on_success(self):
+        """Raise the rate a bit, unlimited again once above MAX_RATE."""
+        if self.rate == INF:
+            return
+        self.rate += INCREASE
+        if self.rate > MAX_RATE:
+            self.rate = INF
+
+    def snapshot(self) -> dict:
+        """Return rate, tokens and wait, for monitoring."""
+        wait = self.wait_time()
+        return {
+            "rate": None if self.rate == INF else round(self.rate, 2),
+            "tokens": round(self.tokens, 2),
+            "wait": round(wait, 2),
+        }
+
+
+class RateLimiter:
+    """TokenBucket per url, created on first use."""
+
+    def __init__(self, burst: float = BURST):
+        """Init."""
+        self.burst = burst
+        self.buckets: Dict[str, TokenBucket] = {}
+
+    def get(self, url: str) -> TokenBucket:
+        """Return the bucket of url."""
+        bucket = self.buckets.get(url)
+        if bucket is None:
+            bucket = self.buckets[url] = TokenBucket(self.burst)
+        return bucket
+
+    def wait_time(self, url: str) -> float:
+        """Return seconds until url has a token."""
+        bucket = self.buckets.get(url)
+        return 0.0 if bucket is None else bucket.wait_time()
+
+    def limited(self, urls: Iterable[str]) -> List[str]:
+        """Return urls without a token now."""
+        return [url for url in urls if self.wait_time(url) > 0]
+
+    async def acquire(self, url: str, max_wait: Optional[float] = None):
+        """
+        Wait for a token of url.
+
+        Raises:
+        ------
+        RateLimited if that takes longer than max_wait (default MAX_WAIT) seconds
+
+        """
+        if max_wait is None:
+            max_wait = MAX_WAIT
+        bucket = self.get(url)
+        wait = bucket.wait_time()
+        if wait > max_wait:
+            raise RateLimited(f"{url}: no token for {wait:.1f}s")
+        bucket.take()
+        if wait > 0:
+            logger.trace(f"{url}: rate limited, waiting {wait:.2f}s")
+            await asyncio.sleep(wait)
+
+    def on_429(self, url: str, retry_after: Optional[str] = None, sent: Optional[float] = None):
+        """Learn from a 429 of url, retry_after the Retry-After header if any, sent the monotonic() the request went out."""
+        bucket = self.get(url)
+        bucket.on_429(parse_retry_after(retry_after), sent=sent)
+        logger.info(f"{url}: 429, rate now {bucket.rate:.2f}/s")
+
+    def on_success(self, url: str):
+        """Count a success of url."""
+        bucket = self.buckets.get(url)
+        if bucket is not None:
+            bucket.on_success()
+
+    def snapshot(self) -> Dict[str, dict]:
+        """Return url -> bucket state of urls that were ever limited."""
+        return {
+            url: bucket.snapshot()
+            for url, bucket in self.buckets.items()
+            if bucket.rate != INF or bucket.blocked_until > monotonic()
+        }
+
+
+LIMITER = RateLimiter()
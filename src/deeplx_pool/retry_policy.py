@@ -0,0 +1,170 @@
+"""
+What to do after a failed translation attempt: retry, give up on the text, or avoid the url.
+
+policy = RetryPolicy()
+kind = policy.on_failure(url, exc)  # exc None for an empty translation
+if kind == NON_RETRYABLE or attempts >= policy.max_attempts:
+    ...  # give up on the text
+else:
+    ...  # try again, on a url not in policy.backing_off()
+policy.on_success(url)
+
+classify(exc)
+    NON_RETRYABLE: the request itself is bad (400, 413, 422), no url will take it
+    ENDPOINT_FATAL: the url is not a working deeplx (401, 403, 404, 405, 410,
+        tls errors, a body that is not deeplx json), avoided for FATAL_BACKOFF
+    NOT_SENT: rate_limit.RateLimited, the request never went out: no
+        penalty for the url, no attempt used, another url is picked
+    RETRYABLE: everything else (timeouts, connection errors, 429, 5xx, empty
+        translation), the url backs off for a while
+
+Backoff per url is exponential in its consecutive failures with full jitter,
+random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (failures - 1))),
+so workers retrying after a burst of errors do not come back in lockstep.
+
+env vars: DXPOOL_RETRY_MAX_ATTEMPTS (default 5), DXPOOL_RETRY_BACKOFF_BASE
+(default 0.5), DXPOOL_RETRY_BACKOFF_MAX (default 30)
+"""
+
+import json
+import os
+import random
+import ssl
+from time import monotonic
+from typing import Dict, Iterable, List, Optional
+
+import httpx
+from loguru import logger
+
+from deeplx_pool.rate_limit import RateLimited
+
+RETRYABLE = "retryable"
+NON_RETRYABLE = "non_retryable"
+ENDPOINT_FATAL = "endpoint_fatal"
+NOT_SENT = "not_sent"
+
+MAX_ATTEMPTS = 5  # per text
+BACKOFF_BASE = 0.5  # seconds
+BACKOFF_MAX = 30.0
+FATAL_BACKOFF = 600.0  # seconds an endpoint-fatal url is avoided
+
+try:
+    MAX_ATTEMPTS = int(os.getenv("DXPOOL_RETRY_MAX_ATTEMPTS", MAX_ATTEMPTS))
+except (TypeError, ValueError):
+    ...  # default 5 as above
+try:
+    BACKOFF_BASE = float(os.getenv("DXPOOL_RETRY_BACKOFF_BASE", BACKOFF_BASE))
+except (TypeError, ValueError):
+    ...  # default 0.5 as above
+try:
+    BACKOFF_MAX = float(os.getenv("DXPOOL_RETRY_BACKOFF_MAX", BACKOFF_MAX))
+except (TypeError, ValueError):
+    ...  # default 30 as above
+
+NON_RETRYABLE_STATUS = {400, 413, 422}
+ENDPOINT_FATAL_STATUS = {401, 403, 404, 405, 410}
+
+
+def classify(exc: Optional[BaseException]) -> str:
+    """Return RETRYABLE, NON_RETRYABLE, ENDPOINT_FATAL or NOT_SENT for an error of deeplx_client_async."""
+    if exc is None:  # empty translation
+        return RETRYABLE
+
+    if isinstance(exc, RateLimited):
+        return NOT_SENT
+
+    if isinstance(exc, httpx.HTTPStatusError):
+        status = exc.response.status_code
+        if status in NON_RETRYABLE_STATUS:
+            return NON_RETRYABLE
+        if status in ENDPOINT_FATAL_STATUS:
+            return ENDPOINT_FATAL
+        return RETRYABLE
+
+    if isinstance(exc, ssl.SSLError):
+        return ENDPOINT_FATAL
+    if isinstance(exc, httpx.ConnectError) and (
+        "ssl" in str(exc).lower() or "certificate" in str(exc).lower()
+    ):
+        return ENDPOINT_FATAL
+
+    # 200 but not deeplx json, e.g. a parked domain or a login page
+    if isinstance(exc, (json.JSONDecodeError, AttributeError, TypeError)):
+        return ENDPOINT_FATAL
+
+    return RETRYABLE
+
+
+class RetryPolicy:
+    """Error classification, attempt cap and per-url backoff, shared by the workers of a batch."""
+
+    def __init__(
+        self,
+        max_attempts: int = MAX_ATTEMPTS,
+        backoff_base: float = BACKOFF_BASE,
+        backoff_max: float = BACKOFF_MAX,
+        fatal_backoff: float = FATAL_BACKOFF,
+    ):
+        """
+        Init.
+
+        Args:
+        ----
+        max_attempts: attempts per text before giving up on it
+        backoff_base: backoff cap after the first failure of a url, doubled per failure
+        backoff_max: backoff cap
+        fatal_backoff: seconds an endpoint-fatal url is avoided
+
+        """
+        self.max_attempts = max(1, max_attempts)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.fatal_backoff = fatal_backoff
+
+        self.failures: Dict[str, int] = {}  # url -> consecutive failures
+        self.until: Dict[str, float] = {}  # url -> monotonic() it may be used again
+
+    def backoff(self, url: str) -> float:
+        """Return a jittered backoff for url's consecutive failures."""
+        cap = self.backoff_base * 2 ** (self.failures.get(url, 1) - 1)
+        return random.uniform(0, min(self.backoff_max, cap))
+
+    def on_failure(self, url: str, exc: Optional[BaseException]) -> str:
+        """Classify exc (None for an empty translation), back url off, return the kind."""
+        kind = classify(exc)
+        if kind in (NON_RETRYABLE, NOT_SENT):
+            # the text, not the url; or nothing was sent
+            return kind
+
+        self.failures[url] = self.failures.get(url, 0) + 1
+        if kind == ENDPOINT_FATAL:
+            delay = self.fatal_backoff
+            logger.info(f"{url}: {exc!r}, avoided for {delay:.0f}s")
+        else:
+            delay = self.backoff(url)
+        self.until[url] = max(self.until.get(url, 0.0), monotonic() + delay)
+        return kind
+
+    def on_success(self, url: str):
+        """Reset url's backoff."""
+        self.failures.pop(url, None)
+        self.until.pop(url, None)
+
+    def exhausted(self, attempts: int) -> bool:
+        """Return True if a text with this many attempts is given up on."""
+        return attempts >= self.max_attempts
+
+    def backing_off(self, urls: Optional[Iterable[str]] = None) -> List[str]:
+        """Return urls (default all known to the policy) that should not be used now."""
+        now = monotonic()
+        if urls is None:
+            urls = list(self.until)
+        return [url for url in urls if self.until.get(url, 0.0) > now]
+
+    def wait_time(self, urls: Iterable[str]) -> float:
+        """Return seconds until one of urls may be used, 0 if one may now."""
+        now = monotonic()
+        _ = [self.until.get(url, 0.0) - now for url in urls]
+        if not _:
+            return 0.0
+        return max(0.0, min(_))
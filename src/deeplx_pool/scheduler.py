@@ -0,0 +1,180 @@
+"""
+Run periodic async jobs in the running event loop, e.g. in fastapi_app's lifespan.
+
+scheduler = Scheduler()
+scheduler.add("deeplx_pool", deeplx_pool.main_async, interval=1800, group="probe")
+scheduler.add("proc_file", proc_file_async, interval=9000, first_delay=0, group="probe")
+scheduler.start()
+...
+await scheduler.stop()
+
+Each job sleeps interval seconds (+/- jitter, a fraction of interval)
+after its previous run has finished, so a job never overlaps itself.
+Jobs in the same group share a lock: a job due while another one of its
+group is running skips that turn instead of piling up.
+"""
+
+import asyncio
+import os
+import random
+from time import monotonic
+from typing import Awaitable, Callable, Dict, Optional
+
+from loguru import logger
+
+JITTER = 0.1
+try:
+    JITTER = float(os.getenv("DXPOOL_SCHEDULER_JITTER", JITTER))
+except (TypeError, ValueError):
+    ...  # default 0.1 as above
+
+
+class Job:
+    """A periodic job and its run stats."""
+
+    __slots__ = (
+        "name",
+        "func",
+        "interval",
+        "jitter",
+        "first_delay",
+        "group",
+        "runs",
+        "skips",
+        "failures",
+        "last_started",
+        "last_duration",
+        "last_error",
+    )
+
+    def __init__(
+        self,
+        name: str,
+        func: Callable[[], Awaitable],
+        interval: float,
+        jitter: float = JITTER,
+        first_delay: Optional[float] = None,
+        group: Optional[str] = None,
+    ):
+        """
+        Init.
+
+        Args:
+        ----
+        name: for logs and snapshot
+        func: coroutine function called without arguments
+        interval: seconds between the end of a run and the start of the next one
+        jitter: fraction of interval (and first_delay) added or taken off at random
+        first_delay: seconds before the first run, default interval
+        group: jobs in the same group do not run at the same time
+
+        """
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.jitter = jitter
+        self.first_delay = interval if first_delay is None else first_delay
+        self.group = group
+        self.runs = 0
+        self.skips = 0
+        self.failures = 0
+        self.last_started: Optional[float] = None
+        self.last_duration: Optional[float] = None
+        self.last_error = ""
+
+    def delay(self, first: bool = False) -> float:
+        """Return seconds to sleep before the next run, jittered."""
+        base = self.first_delay if first else self.interval
+        return max(0.0, base * (1 + random.uniform(-self.jitter, self.jitter)))
+
+    def snapshot(self) -> dict:
+        """Return run stats, for monitoring."""
+        return {
+            "interval": self.interval,
+            "group": self.group,
+            "runs": self.runs,
+            "skips": self.skips,
+            "failures": self.failures,
+            "last_duration": self.last_duration,
+            "last_error": self.last_error,
+        }
+
+
+class Scheduler:
+    """Periodic jobs as tasks of the running loop."""
+
+    def __init__(self):
+        """Init."""
+        self.jobs: Dict[str, Job] = {}
+        self.tasks: Dict[str, asyncio.Task] = {}
+        self.locks: Dict[str, asyncio.Lock] = {}
+
+    def add(
+        self,
+        name: str,
+        func: Callable[[], Awaitable],
+        interval: float,
+        jitter: float = JITTER,
+        first_delay: Optional[float] = None,
+        group: Optional[str] = None,
+    ) -> Job:
+        """Register a job, see Job for the args, start() runs it."""
+        job = Job(name, func, interval, jitter, first_delay, group)
+        self.jobs[name] = job
+        return job
+
+    async def run_job(self, job: Job) -> bool:
+        """Run job once unless another job of its group is running, return True if run."""
+        lock = None
+        if job.group is not None:
+            lock = self.locks.setdefault(job.group, asyncio.Lock())
+            if lock.locked():
+                job.skips += 1
+                logger.info(f"{job.name}: group {job.group} busy, skipped")
+                return False
+            await lock.acquire()
+
+        job.last_started = monotonic()
+        try:
+            logger.info(f"{job.name}: start")
+            await job.func()
+            job.last_error = ""
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:  # pylint: disable=broad-exception-caught
+            job.failures += 1
+            job.last_error = str(exc)
+            logger.error(f"{job.name}: {exc}")
+        finally:
+            job.runs += 1
+            job.last_duration = round(monotonic() - job.last_started, 2)
+            if lock is not None:
+                lock.release()
+        logger.info(f"{job.name}: done in {job.last_duration}s")
+        return True
+
+    async def _loop(self, job: Job):
+        delay = job.delay(first=True)
+        while True:
+            await asyncio.sleep(delay)
+            await self.run_job(job)
+            delay = job.delay()
+
+    def start(self):
+        """Start all jobs not started yet, must be called with a running loop."""
+        for name, job in self.jobs.items():
+            task = self.tasks.get(name)
+            if task is None or task.done():
+                self.tasks[name] = asyncio.create_task(self._loop(job), name=name)
+
+    async def stop(self):
+        """Cancel all jobs, running ones included, and wait for them."""
+        tasks = list(self.tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.tasks.clear()
+
+    def snapshot(self) -> Dict[str, dict]:
+        """Return job name -> run stats."""
+        return {name: job.snapshot() for name, job in self.jobs.items()}
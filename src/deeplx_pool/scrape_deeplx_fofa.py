@@ -18,7 +18,6 @@ invoke
 import asyncio
 import base64
 import re
-from datetime import timedelta
 from pathlib import Path
 from random import choice
 from time import time
@@ -31,7 +30,8 @@ from loguru import logger
 from pyquery import PyQuery as pq
 from rich.console import Console
 
-from deeplx_pool.check_deeplx import check_deeplx_async
+from deeplx_pool.check_deeplx_stream import check_deeplx_bounded
+from deeplx_pool.duration_human import duration_human
 
 cache = diskcache.Cache(Path.home() / ".diskcache" / "deeplx-sites")
 
@@ -44,8 +44,6 @@ SENTINEL_EXPIRE = 600  # 10 minutes
 # sentinel will be None after sentinel_expire
 # only scrape if cache.get("sentinel") is not None
 
-# from duration_human import duration_human
-
 # url = httpx.get("""https://www.shodan.io/search?query=DeepL+Translate+Api""", timeout=120)
 # url = "https://www.shodan.io/search"
 
@@ -59,51 +57,9 @@ query_def3 = '''"welcome to deeplx" && country="CN"'''
 query_def4 = '''"Welcome to deeplx-pro" && country="CN"'''
 query_def = choice([query_def1, query_def2, query_def3, query_def4])
 
-DURATION_HUMAN_SPEC = (
-    (1.0e-6, 1e9, 1e3, "ns"),
-    (1.0e-3, 1e6, 1e3, "us"),
-    (1.0, 1e3, 1e3, "ms"),
-    (60.0, 1e0, 60.0, "s"),
-)
 console = Console()
 
 
-def duration_human(value: float) -> str:
-    """
-    Return a beautiful representation of the duration.
-
-    It dynamically calculates the best unit to use.
-
-    Returns
-    -------
-        str: the duration representation.
-
-    """
-    try:
-        value = round(value, 2)
-    except Exception:
-        return str(value)
-
-    for (
-        top,
-        mult,
-        size,
-        unit,
-    ) in DURATION_HUMAN_SPEC:
-        if value < top:
-            result = round(value * mult, ndigits=2)
-            if result < size:
-                return f"{result}{unit}"
-    try:
-        txt = str(timedelta(seconds=float(f"{value:.1f}")))
-        pos = txt.find(".")
-        if pos == -1:
-            return txt
-        return txt[: pos + 2]
-    except OverflowError:
-        return "quasi-infinity \n(Python int too large to convert to C int)"
-
-
 def scrape_deeplx_fofa(
     query: str = "",
     timeout: Union[float, Timeout] = Timeout(30),
@@ -275,10 +231,7 @@ async def main():
     console.print("Combined urls: ", url_list)
 
     then = time()
-    urls_checked = await asyncio.gather(
-        *map(check_deeplx_async, url_list),
-        return_exceptions=True,
-    )
+    urls_checked = await check_deeplx_bounded(url_list)
 
     # urls_checked = [*map(check_url, url_list)]
 
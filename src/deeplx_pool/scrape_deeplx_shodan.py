@@ -14,7 +14,7 @@ invoke
 
 # pylint: disable=invalid-name, broad-except, line-too-long, too-many-statements, too-many-branches
 import asyncio
-from datetime import datetime, timedelta
+from datetime import datetime
 from pathlib import Path
 # from random import choices
 from random import choice
@@ -28,7 +28,8 @@ from loguru import logger
 from pyquery import PyQuery as pq
 from rich.console import Console
 
-from deeplx_pool.check_deeplx import check_deeplx_async
+from deeplx_pool.check_deeplx_stream import check_deeplx_bounded
+from deeplx_pool.duration_human import duration_human
 from deeplx_pool.scrape_deeplx_fofa import scrape_deeplx_fofa
 
 cache = diskcache.Cache(Path.home() / ".diskcache" / "deeplx-sites")
@@ -42,56 +43,12 @@ SENTINEL_EXPIRE = 600  # 10 minutes
 # sentinel will be None after sentinel_expire
 # only scrape if cache.get("sentinel") is not None
 
-# from duration_human import duration_human
-
 # url = res1 = httpx.get("""https://www.shodan.io/search?query=DeepL+Translate+Api""", timeout=120)
 url = "https://www.shodan.io/search"
 
-DURATION_HUMAN_SPEC = (
-    (1.0e-6, 1e9, 1e3, "ns"),
-    (1.0e-3, 1e6, 1e3, "us"),
-    (1.0, 1e3, 1e3, "ms"),
-    (60.0, 1e0, 60.0, "s"),
-)
 console = Console()
 
 
-def duration_human(value: float) -> str:
-    """
-    Return a beautiful representation of the duration.
-
-    It dynamically calculates the best unit to use.
-
-    Returns
-    -------
-        str: the duration representation.
-
-    """
-    try:
-        value = round(value, 2)
-    except Exception:
-        return str(value)
-
-    for (
-        top,
-        mult,
-        size,
-        unit,
-    ) in DURATION_HUMAN_SPEC:
-        if value < top:
-            result = round(value * mult, ndigits=2)
-            if result < size:
-                return f"{result}{unit}"
-    try:
-        txt = str(timedelta(seconds=float(f"{value:.1f}")))
-        pos = txt.find(".")
-        if pos == -1:
-            return txt
-        return txt[: pos + 2]
-    except OverflowError:
-        return "quasi-infinity \n(Python int too large to convert to C int)"
-
-
 def scrape_deeplx_shodan(
     query: str = "",
     timeout: Union[float, Timeout] = Timeout(30),
@@ -336,10 +293,7 @@ async def main():
     console.print("Combined urls: ", url_list)
 
     then = time()
-    urls_checked = await asyncio.gather(
-        *map(check_deeplx_async, url_list),
-        return_exceptions=True,
-    )
+    urls_checked = await check_deeplx_bounded(url_list)
 
     # urls_checked = [*map(check_url, url_list)]
 
@@ -0,0 +1,94 @@
+"""
+Immutable in-process snapshot of cache.get("deeplx-sites") for the read endpoints.
+
+SITES.publish(urls_valid)  # after cache.set("deeplx-sites", urls_valid)
+SITES.reload()  # or pick up what another process wrote, blocking sqlite read
+
+snapshot = SITES.current  # one attribute read, never half-updated
+body, etag = snapshot.body(num=5)  # pre-serialized json of the 5 fastest urls
+
+A new snapshot is built in full and then swapped in with a single
+assignment, so readers in the event loop thread never block on sqlite
+or see a partial list. json bodies are serialized once per snapshot.
+"""
+
+import hashlib
+import json
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import diskcache
+from loguru import logger
+
+cache = diskcache.Cache(Path.home() / ".diskcache" / "deeplx-sites")
+
+
+class SitesSnapshot:
+    """One version of the url list with its serialized bodies, do not mutate."""
+
+    __slots__ = ("sites", "digest", "all_json", "num_json", "_bodies")
+
+    def __init__(self, sites: List[Tuple[str, float]]):
+        """Serialize sites, a list of (url, latency) two-tuples."""
+        self.sites: Tuple[Tuple[str, float], ...] = tuple(
+            (url, latency) for url, latency in sites
+        )
+        self.all_json = json.dumps(dict(self.sites)).encode()
+        self.num_json = json.dumps(len(self.sites)).encode()
+        self.digest = hashlib.sha1(self.all_json).hexdigest()[:16]
+        # num -> json of the first num urls, filled on demand
+        self._bodies: Dict[int, bytes] = {}
+
+    def __len__(self):
+        """Return number of urls."""
+        return len(self.sites)
+
+    def body(self, num: int = 0) -> Tuple[bytes, str]:
+        """Return json of the first num urls (all if num is 0 or beyond, 1 if negative) and its ETag."""
+        if num != 0:
+            num = max(num, 1)
+        if num == 0 or num >= len(self.sites):
+            return self.all_json, f'"{self.digest}"'
+        body = self._bodies.get(num)
+        if body is None:
+            body = json.dumps(dict(self.sites[:num])).encode()
+            self._bodies[num] = body
+        return body, f'"{self.digest}-{num}"'
+
+    def num_body(self) -> Tuple[bytes, str]:
+        """Return json of the number of urls and its ETag."""
+        return self.num_json, f'"{self.digest}-n"'
+
+
+class SnapshotHolder:
+    """Holds the current SitesSnapshot, swapped as a whole."""
+
+    def __init__(self, cache_: Optional[diskcache.Cache] = None):
+        """Init with an empty snapshot, call reload() to load from cache."""
+        self.cache = cache if cache_ is None else cache_
+        self.current = SitesSnapshot([])
+
+    def publish(self, sites) -> bool:
+        """Swap in a snapshot of sites, return True if the list changed."""
+        try:
+            snapshot = SitesSnapshot(sites or [])
+        except Exception as exc:  # pylint: disable=broad-exception-caught
+            logger.warning(f"cannot snapshot sites: {exc}")
+            return False
+        if snapshot.digest == self.current.digest:
+            return False
+        self.current = snapshot
+        logger.debug(f"sites snapshot {snapshot.digest}: {len(snapshot)} urls")
+        return True
+
+    def reload(self) -> bool:
+        """Publish cache.get("deeplx-sites"), blocking, run it off the event loop."""
+        try:
+            sites = self.cache.get("deeplx-sites")
+        except Exception as exc:  # pylint: disable=broad-exception-caught
+            logger.warning(f"cannot read deeplx-sites: {exc}")
+            return False
+        return self.publish(sites)
+
+
+SITES = SnapshotHolder()
@@ -0,0 +1,311 @@
+"""
+Discovery sources of deeplx urls behind one async interface.
+
+for name, source in enabled_sources().items():
+    urls = await source.run()  # all its queries, or one picked at random
+
+urls = await SOURCES["shodan"].run_query("deepl api")
+
+Each source owns its throttling and a cache of raw results in diskcache:
+    source-last:{name}:{query}  set on every upstream query, expires after min_interval
+    source-raw:{name}:{query}   last non-empty result, expires after ttl
+A query within min_interval of the previous one (e.g. after a restart)
+returns the cached raw result instead of hitting upstream, and so does a
+failed query. Failed or empty upstream queries are retried up to
+`attempts` times with the timeout growing by `backoff` each time, each
+attempt's timeout cut to what is left of `deadline` (just under
+SOURCE_DEADLINE, env var DXPOOL_SOURCE_DEADLINE, the time
+deeplx_pool.discover_stream gives a source), no attempt is started past it.
+
+New source: subclass Source, implement fetch(query, timeout) (blocking,
+run in a thread of EXECUTOR, honouring timeout), register() an instance.
+
+A query (throttle check, fetches, raw result cache: all blocking) runs in
+its own bounded thread pool (SOURCE_THREADS, env var DXPOOL_SOURCE_THREADS),
+not on the loop and not in the loop's default executor: a fetch still
+hanging after discover_stream gave up on it cannot starve metrics or the
+registry of threads.
+
+env var DXPOOL_SOURCES (comma separated names) picks the enabled sources,
+default those with enabled = True.
+"""
+
+import asyncio
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain
+from pathlib import Path
+from random import choice
+from time import time
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import diskcache
+from httpx import Timeout
+from loguru import logger
+
+from deeplx_pool.duration_human import duration_human
+from deeplx_pool.fetch_urls_fofa_hack import fetch_urls_fofa_hack
+from deeplx_pool.scrape_deeplx_fofa import scrape_deeplx_fofa
+from deeplx_pool.scrape_deeplx_shodan import scrape_deeplx_shodan
+
+cache = diskcache.Cache(Path.home() / ".diskcache" / "deeplx-sites")
+
+# seconds a discovery source may take, env var DXPOOL_SOURCE_DEADLINE
+SOURCE_DEADLINE = 240.0
+try:
+    SOURCE_DEADLINE = float(os.getenv("DXPOOL_SOURCE_DEADLINE", SOURCE_DEADLINE))
+except (TypeError, ValueError):
+    ...  # default 240 as above
+
+# threads for blocking fetches, env var DXPOOL_SOURCE_THREADS
+SOURCE_THREADS = 8
+try:
+    SOURCE_THREADS = int(os.getenv("DXPOOL_SOURCE_THREADS", SOURCE_THREADS))
+except (TypeError, ValueError):
+    ...  # default 8 as above
+if SOURCE_THREADS < 1:
+    SOURCE_THREADS = 8
+
+EXECUTOR = ThreadPoolExecutor(max_workers=SOURCE_THREADS, thread_name_prefix="source")
+
+FOFA_HACK_QUERIES = [
+    '''"deepl translate api" && country="CN"''',
+    '''body='{"code":200,"message":"DeepL Free API, Developed by sjlleo and missuo. Go to /translate with POST. http://github.com/OwO-Network/DeepLX"}' && country="CN"''',  # pylint: disable=line-too-long
+    '''"welcome to deeplx" && country="CN"''',
+    '''"Welcome to deeplx-pro"''',
+    # deeplx-serverless
+    '''"Welcome to the DeepL Free API."''',
+]
+
+SHODAN_QUERIES = [
+    "deepl api",
+    "welcome to deeplx",
+    "Welcome to deeplx-pro",
+    # deeplx-serverless
+    "Welcome to the DeepL Free API.",
+]
+
+EXTRA_URLS = [
+    # "https://translates.me/v2",
+    # "https://api.deeplx.org/linxdo_key",  # from https://connect.linux.do/
+    "https://deeplx.niubipro.com",
+    "https://freedeeplxapi1.ddl.us.kg",
+    "https://ihabis-deeplx-test2-no-token.hf.space",
+    "https://wuran-deeplx.hf.space",
+    "https://uu0103-deeplx.hf.space",
+    "https://xcq-1-deeplx.hf.space",
+    "https://mikeee-deeplx.hf.space",
+    "https://deeplx.dattw.eu.org",
+    # deeplx-local at hf
+    "https://mikeee-deeplx-local.hf.space",
+    "https://bestmaple-deeplx-local.hf.space",
+]
+
+# text files with urls, relative to the working directory
+FILE_SOURCES = ["linuxdo216930.txt", "fofa-results6.txt", "fofa-results.txt"]
+
+
+class Source:
+    """Base class: throttling, raw result cache and retries around fetch."""
+
+    name = ""
+    enabled = True
+    queries: Sequence[str] = ("",)
+    one_query_per_run = False  # run() picks one query at random instead of all
+    min_interval = 600.0  # seconds between upstream queries for the same query
+    ttl = 7 * 24 * 3600.0  # seconds raw results are kept
+    attempts = 1
+    timeout = 30.0  # of the first attempt
+    backoff = 1.0  # timeout factor per retry
+    # seconds for all attempts of a query, a few less than discover_stream
+    # allows so a failed query still gets to return the cached raw result
+    deadline = max(1.0, SOURCE_DEADLINE - 5)
+
+    def __init__(self, cache_: Optional[diskcache.Cache] = None, **kwargs):
+        """Init, kwargs override class attributes, e.g. Source(min_interval=0)."""
+        self.cache = cache if cache_ is None else cache_
+        for key, value in kwargs.items():
+            if not hasattr(type(self), key):
+                raise TypeError(f"unknown source attribute {key!r}")
+            setattr(self, key, value)
+
+    def fetch(self, query: str, timeout: float) -> List[str]:
+        """Return urls for query from upstream, blocking, implemented by subclasses."""
+        raise NotImplementedError
+
+    def run_queries(self) -> List[str]:
+        """Return queries for one run."""
+        if self.one_query_per_run:
+            return [choice(list(self.queries))]
+        return list(self.queries)
+
+    async def run(self) -> List[str]:
+        """Return urls of all queries of one run."""
+        results = await asyncio.gather(*map(self.run_query, self.run_queries()))
+        return list(chain(*results))
+
+    async def run_query(self, query: str = "") -> List[str]:
+        """Return urls for query: cached if throttled, else fetched with retries, in EXECUTOR."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(EXECUTOR, self.query, query)
+
+    def query(self, query: str = "") -> List[str]:
+        """Return urls for query, blocking: throttle check, fetch with retries, raw cache."""
+        last_key = f"source-last:{self.name}:{query}"
+        raw_key = f"source-raw:{self.name}:{query}"
+        cached = self.cache.get(raw_key) if self.ttl > 0 else None
+
+        if self.min_interval > 0:
+            if self.cache.get(last_key) is not None:
+                logger.info(
+                    f"{self.name}: {query=} throttled, "
+                    f"{len(cached or [])} cached urls"
+                )
+                return list(cached or [])
+            self.cache.set(last_key, time(), expire=self.min_interval)
+
+        then = time()
+        urls: List[str] = []
+        for attempt in range(max(1, self.attempts)):
+            left = self.deadline - (time() - then)
+            if left <= 0:
+                logger.info(f"{self.name}: {query=} out of time after {attempt} attempts")
+                break
+            timeout = min(self.timeout * self.backoff**attempt, left)
+            if attempt:
+                logger.info(f"{self.name}: retry {attempt}, {timeout=:.0f}")
+            try:
+                urls = self.fetch(query, timeout)
+            except Exception as exc:  # pylint: disable=broad-exception-caught
+                logger.error(f"{self.name}: {exc}")
+                continue
+            if urls:
+                break
+        logger.debug(
+            f"{self.name}: {query=} {len(urls)} urls in {duration_human(time() - then)}"
+        )
+
+        if not urls:
+            return list(cached or [])
+        if self.ttl > 0:
+            self.cache.set(raw_key, urls, expire=self.ttl)
+        return urls
+
+
+class ShodanSource(Source):
+    """shodan.io search page, one random query per run."""
+
+    name = "shodan"
+    queries = SHODAN_QUERIES
+    one_query_per_run = True
+    attempts = 3
+    timeout = 60.0
+    backoff = 1.5
+
+    def fetch(self, query: str, timeout: float) -> List[str]:
+        """Scrape shodan."""
+        return scrape_deeplx_shodan(query, timeout=Timeout(timeout), throttle=False)
+
+
+class FofaSource(Source):
+    """en.fofa.info result page, disabled: fofa blocks scraping."""
+
+    name = "fofa"
+    enabled = False
+    queries = FOFA_HACK_QUERIES[:3]
+    one_query_per_run = True
+    attempts = 3
+    backoff = 1.2
+
+    def fetch(self, query: str, timeout: float) -> List[str]:
+        """Scrape fofa."""
+        return scrape_deeplx_fofa(query, timeout=Timeout(timeout), throttle=False)
+
+
+class FofaHackSource(Source):
+    """fofa via fofa_hack, all queries every run."""
+
+    name = "fofa_hack"
+    queries = FOFA_HACK_QUERIES
+
+    def fetch(self, query: str, timeout: float) -> List[str]:
+        """Query fofa_hack, no next page after timeout seconds."""
+        return fetch_urls_fofa_hack(query, timeout=timeout)
+
+
+class FileSource(Source):
+    """Urls in local text files, e.g. fofa exports."""
+
+    name = "files"
+    min_interval = 0.0
+    ttl = 0.0
+
+    def __init__(
+        self,
+        filenames: Iterable[str] = FILE_SOURCES,
+        cache_: Optional[diskcache.Cache] = None,
+        **kwargs,
+    ):
+        """Init with the files to read, missing ones are skipped."""
+        super().__init__(cache_, **kwargs)
+        self.filenames = list(filenames)
+
+    def fetch(self, query: str, timeout: float) -> List[str]:
+        """Extract urls from the files."""
+        urls = []
+        for filename in self.filenames:
+            try:
+                filecont = Path(filename).read_text(encoding="utf8")
+            except Exception as exc:  # pylint: disable=broad-exception-caught
+                logger.debug(exc)
+                continue
+            urls.extend(re.findall(r"https?://[\w.:-]+", filecont))
+        return urls
+
+
+class StaticSource(Source):
+    """A fixed list of urls."""
+
+    name = "extra"
+    min_interval = 0.0
+    ttl = 0.0
+
+    def __init__(
+        self,
+        urls: Iterable[str] = EXTRA_URLS,
+        cache_: Optional[diskcache.Cache] = None,
+        **kwargs,
+    ):
+        """Init with the urls."""
+        super().__init__(cache_, **kwargs)
+        self.urls = list(urls)
+
+    def fetch(self, query: str, timeout: float) -> List[str]:
+        """Return the urls."""
+        return list(self.urls)
+
+
+SOURCES: Dict[str, Source] = {}
+
+
+def register(source: Source) -> Source:
+    """Add source to SOURCES under its name, replacing one of the same name."""
+    SOURCES[source.name] = source
+    return source
+
+
+for _ in [ShodanSource(), FofaSource(), FofaHackSource(), FileSource(), StaticSource()]:
+    register(_)
+
+
+def enabled_sources() -> Dict[str, Source]:
+    """Return sources named in env var DXPOOL_SOURCES, default those enabled."""
+    names = os.getenv("DXPOOL_SOURCES", "")
+    if names.strip():
+        wanted = [_.strip() for _ in names.split(",") if _.strip()]
+        unknown = [_ for _ in wanted if _ not in SOURCES]
+        if unknown:
+            logger.warning(f"unknown sources in DXPOOL_SOURCES: {unknown}")
+        return {_: SOURCES[_] for _ in wanted if _ in SOURCES}
+    return {name: elm for name, elm in SOURCES.items() if elm.enabled}
@@ -0,0 +1,227 @@
+"""
+Translation cache keyed by (text, source_lang, target_lang).
+
+tier 1: in-memory LRU, LRU_SIZE entries
+tier 2: optional diskcache (~/.diskcache/deeplx-tr), entries expire after TTL
+    seconds, least recently used ones are evicted beyond DISK_SIZE_LIMIT bytes
+
+tr_cache = TranslationCache(disk=True)
+trtext = tr_cache.get("Hello", "en", "zh")  # None on a miss
+tr_cache.set("Hello", "你好", "en", "zh")
+tr_cache.stats()
+{'hits': 1, 'disk_hits': 0, 'misses': 1, 'size': 1, 'hit_rate': 0.5}
+
+# in a running loop: disk lookups of all memory misses in one executor call
+trtexts = await tr_cache.aget_many(["Hello", "World"], "en", "zh")  # [str or None, ...]
+
+In a running loop set() writes the disk tier in an executor (like
+metrics.MetricsRegistry.aflush), the sqlite write does not block the loop.
+
+TR_CACHE is the process-wide cache used by batch_deeplx_tr,
+its disk tier is on if env var DXPOOL_TR_CACHE_DISK is set to 1/true.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Union
+
+import diskcache
+from loguru import logger
+
+LRU_SIZE = 10000
+DISK_DIR = Path.home() / ".diskcache" / "deeplx-tr"
+DISK_SIZE_LIMIT = 2**28  # 256 MB
+TTL = 7 * 24 * 3600  # a week
+
+try:
+    LRU_SIZE = int(os.getenv("DXPOOL_TR_CACHE_SIZE", LRU_SIZE))
+except (TypeError, ValueError):
+    ...  # default 10000 as above
+try:
+    TTL = int(os.getenv("DXPOOL_TR_CACHE_TTL", TTL))
+except (TypeError, ValueError):
+    ...  # default a week as above
+
+
+class TranslationCache:
+    """Two-tier translation cache with hit/miss counters."""
+
+    def __init__(
+        self,
+        maxsize: int = LRU_SIZE,
+        disk: Union[bool, str, Path, diskcache.Cache] = False,
+        ttl: Optional[float] = TTL,
+        size_limit: int = DISK_SIZE_LIMIT,
+    ):
+        """
+        Init.
+
+        Args:
+        ----
+        maxsize: max entries in memory
+        disk: False for memory only, True for DISK_DIR, a directory or a diskcache.Cache
+        ttl: seconds a disk entry lives, None for no expiry
+        size_limit: bytes on disk before least recently used entries are evicted
+
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.memory: OrderedDict = OrderedDict()
+
+        self.disk: Optional[diskcache.Cache] = None
+        if isinstance(disk, diskcache.Cache):
+            self.disk = disk
+        elif disk:
+            directory = DISK_DIR if disk is True else Path(disk)  # type: ignore
+            self.disk = diskcache.Cache(
+                directory,
+                size_limit=size_limit,
+                eviction_policy="least-recently-used",
+            )
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(text: str, source_lang: str = "", target_lang: str = "") -> str:
+        """Return sha256 hex digest of (text, source_lang, target_lang)."""
+        _ = json.dumps(
+            [text, source_lang.strip().lower(), target_lang.strip().lower()],
+            ensure_ascii=False,
+        )
+        return hashlib.sha256(_.encode("utf8")).hexdigest()
+
+    def get(
+        self, text: str, source_lang: str = "", target_lang: str = ""
+    ) -> Optional[str]:
+        """Return cached translation or None."""
+        key = self.key(text, source_lang, target_lang)
+
+        trtext = self.memory.get(key)
+        if trtext is not None:
+            self.memory.move_to_end(key)
+            self.hits += 1
+            return trtext
+
+        if self.disk is not None:
+            try:
+                trtext = self.disk.get(key)
+            except Exception as exc:  # pylint: disable=broad-exception-caught
+                logger.warning(f"tr_cache disk get: {exc}")
+                trtext = None
+            if trtext is not None:
+                self._remember(key, trtext)  # promote to memory
+                self.hits += 1
+                self.disk_hits += 1
+                return trtext
+
+        self.misses += 1
+        return None
+
+    def _disk_get_many(self, keys: List[str]) -> Dict[str, str]:
+        # blocking, run in an executor
+        found = {}
+        for key in keys:
+            try:
+                trtext = self.disk.get(key)  # type: ignore
+            except Exception as exc:  # pylint: disable=broad-exception-caught
+                logger.warning(f"tr_cache disk get: {exc}")
+                continue
+            if isinstance(trtext, str) and trtext.strip():
+                found[key] = trtext
+        return found
+
+    async def aget_many(
+        self, texts: Iterable[str], source_lang: str = "", target_lang: str = ""
+    ) -> List[Optional[str]]:
+        """Return cached translations (None on a miss) of texts, memory misses looked up on disk in one executor call."""
+        keys = [self.key(text, source_lang, target_lang) for text in texts]
+        result: List[Optional[str]] = []
+        missing: List[int] = []
+        for idx, key in enumerate(keys):
+            trtext = self.memory.get(key)
+            if trtext is None:
+                missing.append(idx)
+            else:
+                self.memory.move_to_end(key)
+                self.hits += 1
+            result.append(trtext)
+
+        if missing and self.disk is not None:
+            loop = asyncio.get_running_loop()
+            found = await loop.run_in_executor(
+                None, self._disk_get_many, [keys[idx] for idx in missing]
+            )
+            for idx in missing:
+                trtext = found.get(keys[idx])
+                if trtext is not None:
+                    self._remember(keys[idx], trtext)  # promote to memory
+                    self.hits += 1
+                    self.disk_hits += 1
+                    result[idx] = trtext
+
+        self.misses += sum(1 for trtext in result if trtext is None)
+        return result
+
+    async def aget(
+        self, text: str, source_lang: str = "", target_lang: str = ""
+    ) -> Optional[str]:
+        """Return cached translation or None, disk lookup in an executor."""
+        return (await self.aget_many([text], source_lang, target_lang))[0]
+
+    def _disk_set(self, key: str, trtext: str):
+        try:
+            self.disk.set(key, trtext, expire=self.ttl)  # type: ignore
+        except Exception as exc:  # pylint: disable=broad-exception-caught
+            logger.warning(f"tr_cache disk set: {exc}")
+
+    def set(
+        self, text: str, trtext: str, source_lang: str = "", target_lang: str = ""
+    ):
+        """Store a translation in both tiers, an empty one is never stored."""
+        if not isinstance(trtext, str) or not trtext.strip():
+            return
+        key = self.key(text, source_lang, target_lang)
+        self._remember(key, trtext)
+        if self.disk is None:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:  # no loop to block
+            self._disk_set(key, trtext)
+        else:
+            loop.run_in_executor(None, self._disk_set, key, trtext)
+
+    def _remember(self, key: str, trtext: str):
+        self.memory[key] = trtext
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.maxsize:
+            self.memory.popitem(last=False)
+
+    def clear(self):
+        """Drop all entries and reset counters."""
+        self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
+        self.hits = self.disk_hits = self.misses = 0
+
+    def stats(self) -> dict:
+        """Return hit/miss counters."""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "size": len(self.memory),
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+        }
+
+
+TR_CACHE = TranslationCache(
+    disk=os.getenv("DXPOOL_TR_CACHE_DISK", "").lower() in ["1", "true", "yes"]
+)
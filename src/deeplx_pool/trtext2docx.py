@@ -20,7 +20,7 @@ from loguru import logger
 from rich.console import Console
 from ycecream import y
 
-from deeplx_pool.batch_deeplx_tr import batch_deeplx_tr
+from deeplx_pool.batch_deeplx_tr import TranslationFailed, batch_deeplx_tr_stream
 
 # from deeplx_pool.batch_newapi_tr import batch_newapi_tr
 from deeplx_pool.duration_human import duration_human
@@ -162,15 +162,21 @@ async def main():  # pylint: disable=missing-function-docstring
     _ = "\n"
     console.print(f"""total: {len(texts)} paras, {_.join(texts[:3])}...""")
 
-    n_workers = max(30, n_paras)
-
     then = monotonic()
     # dxtext = asyncio.run(batch_deeplx_tr(texts, n_workers=n_workers))
-    dxtext = await batch_deeplx_tr(texts, n_workers=n_workers)
-    # convert two-tuples to dict, in case there are missing entries
-    dxtex_dict = dict(dxtext)
-    col1 = [dxtex_dict.get(elm, "") for elm in range(n_paras)]
-    console.print(f"done deeplx in {duration_human(monotonic() - then)}")
+    # paragraphs in order as they are done, every seqno comes back,
+    # those not translated in time as TranslationFailed
+    col1 = [""] * n_paras
+    n_failed = 0
+    # requests in flight adapt to the pool (n_workers=None)
+    async for seqno, trtext in batch_deeplx_tr_stream(texts, ordered=True):
+        if isinstance(trtext, TranslationFailed):
+            n_failed += 1
+            logger.warning(f"{seqno=} {trtext}")
+            trtext = f"[{trtext}]"  # visible in the docx
+        col1[seqno] = trtext
+        logger.debug(f"{seqno=} {trtext[:40]=}")
+    console.print(f"done deeplx in {duration_human(monotonic() - then)}, {n_failed=}")
 
     # ofile = f"temp-{token_hex(3)}.docx"
 
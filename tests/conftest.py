@@ -0,0 +1,15 @@
+"""Shared fixtures: keep tests out of the real ~/.diskcache."""
+
+import diskcache
+import pytest
+
+import deeplx_pool.metrics
+
+
+@pytest.fixture(autouse=True)
+def metrics_cache(monkeypatch, tmp_path):
+    """Batch metrics flush to a cache at tmp_path."""
+    cache_ = diskcache.Cache(tmp_path / "metrics")
+    monkeypatch.setattr(deeplx_pool.metrics, "cache", cache_)
+    yield cache_
+    cache_.close()
@@ -0,0 +1,250 @@
+"""
+Test batch_deeplx_tr with a fake deeplx_client_async, no network needed.
+
+Use -s or --capture=no e.g., pytest -s test_foobar.py to show output
+"""
+# pylint: disable=redefined-outer-name, unused-argument
+
+import asyncio
+import random
+import time
+
+import pytest
+
+import deeplx_pool.batch_deeplx_tr as bdt
+from deeplx_pool.packing import Packer, split_sentences
+from deeplx_pool.retry_policy import RetryPolicy
+from deeplx_pool.tr_cache import TranslationCache
+
+URLS = ["http://fake1", "http://fake2", "http://fake3"]
+
+
+@pytest.fixture
+def fake_client(monkeypatch):
+    """Replace deeplx_client_async, DEQ and TR_CACHE, record calls."""
+    calls = []
+
+    async def fake(text, source_lang="", target_lang="", alternatives=False, url=None, **kwargs):
+        calls.append((url, text))
+        await asyncio.sleep(0.001)
+        if url == "http://fake3":
+            raise RuntimeError("fake 503")
+        # line by line, like deepl does with packed texts
+        return "\n".join(f"tr: {line}" for line in text.split("\n"))
+
+    monkeypatch.setattr(bdt, "deeplx_client_async", fake)
+    monkeypatch.setattr(bdt, "DEQ", bdt.deque(URLS))
+    monkeypatch.setattr(bdt, "TR_CACHE", TranslationCache())
+    return calls
+
+
+def test_batch_deeplx_tr_all_done(fake_client):
+    """Every text comes back once, failed attempts are retried elsewhere."""
+    random.seed(0)
+    texts = [f"text {idx}" for idx in range(30)]
+    _ = asyncio.run(bdt.batch_deeplx_tr(texts, n_workers=8))
+
+    assert sorted(_) == [(idx, f"tr: {text}") for idx, text in enumerate(texts)]
+
+
+def test_batch_deeplx_tr_empty(fake_client):
+    """Nothing to do."""
+    assert not asyncio.run(bdt.batch_deeplx_tr([]))
+    assert not fake_client
+
+
+def test_batch_deeplx_tr_concurrent_batches(fake_client):
+    """Batches running at the same time each get exactly their own results."""
+    texts1 = [f"one {idx}" for idx in range(20)]
+    texts2 = [f"two {idx}" for idx in range(5)]
+
+    async def main():
+        return await asyncio.gather(
+            bdt.batch_deeplx_tr(texts1, n_workers=6),
+            bdt.batch_deeplx_tr(texts2, n_workers=6),
+        )
+
+    res1, res2 = asyncio.run(main())
+    assert sorted(res1) == [(idx, f"tr: {text}") for idx, text in enumerate(texts1)]
+    assert sorted(res2) == [(idx, f"tr: {text}") for idx, text in enumerate(texts2)]
+
+
+def test_batch_deeplx_tr_timeout(monkeypatch):
+    """Out of time: partial results, workers cancelled."""
+
+    async def fake(text, *args, **kwargs):
+        await asyncio.sleep(0 if text == "fast" else 10)
+        return f"tr: {text}"
+
+    monkeypatch.setattr(bdt, "deeplx_client_async", fake)
+    monkeypatch.setattr(bdt, "DEQ", bdt.deque(URLS))
+    monkeypatch.setattr(bdt, "TR_CACHE", TranslationCache())
+
+    _ = asyncio.run(bdt.batch_deeplx_tr(["fast", "slow"], n_workers=2, timeout=0.2, pack=False))
+    assert _ == [(0, "tr: fast"), (1, bdt.TranslationFailed("deadline", 0))]
+    assert not _[1][1]
+
+
+def test_batch_deeplx_tr_deadline_bounds_attempts(monkeypatch):
+    """Each request gets what is left of the deadline, failures are marked per text."""
+    timeouts = []
+
+    async def fake(text, *args, timeout=None, **kwargs):
+        timeouts.append(timeout)
+        if text == "bad":
+            raise RuntimeError("fake 503")
+        return f"tr: {text}"
+
+    monkeypatch.setattr(bdt, "deeplx_client_async", fake)
+    monkeypatch.setattr(bdt, "DEQ", bdt.deque(URLS))
+    monkeypatch.setattr(bdt, "TR_CACHE", TranslationCache())
+
+    async def main():
+        return [
+            _
+            async for _ in bdt.batch_deeplx_tr_stream(
+                ["bad", "good", "bad"],
+                timeout=0.6,
+                pack=False,
+                ordered=True,
+                retry_policy=RetryPolicy(max_attempts=100, backoff_base=0.01),
+            )
+        ]
+
+    (_, failed), good, (_, failed2) = asyncio.run(main())
+    assert good == (1, "tr: good")
+    assert failed2 is failed  # identical texts, translated (or not) once
+    assert failed.reason == "deadline" and failed.attempts > 1
+    assert "fake 503" in failed.error and "fake 503" in str(failed)
+    assert max(timeouts) <= 0.6
+
+
+def test_batch_deeplx_tr_cached(fake_client):
+    """Second run is served from the cache, a different language pair is not."""
+    texts = [f"text {idx}" for idx in range(5)]
+    res1 = asyncio.run(bdt.batch_deeplx_tr(texts, n_workers=2, target_lang="de"))
+    n_calls = len(fake_client)
+
+    res2 = asyncio.run(bdt.batch_deeplx_tr(texts, n_workers=2, target_lang="de"))
+    assert sorted(res2) == sorted(res1)
+    assert len(fake_client) == n_calls
+    assert bdt.TR_CACHE.stats()["hits"] == 5
+
+    asyncio.run(bdt.batch_deeplx_tr(texts, n_workers=2, target_lang="fr"))
+    assert len(fake_client) > n_calls
+
+    # tr_cache=False bypasses the cache
+    n_calls = len(fake_client)
+    asyncio.run(bdt.batch_deeplx_tr(texts[:1], target_lang="de", tr_cache=False))
+    assert len(fake_client) > n_calls
+
+
+def test_batch_deeplx_tr_dedup(fake_client):
+    """Each unique text is sent once, all seqnos get the translation."""
+    texts = ["a", "b", "a", " a ", "b", "a"]
+    _ = asyncio.run(bdt.batch_deeplx_tr(texts, n_workers=3, pack=False))
+    assert sorted(_) == [(idx, f"tr: {text}") for idx, text in enumerate(texts)]
+    assert sorted({text for _, text in fake_client}) == [" a ", "a", "b"]
+    assert len([url for url, _ in fake_client if url != "http://fake3"]) == 3
+
+
+def test_dedup_texts_normalize_ws():
+    """Whitespace-normalized grouping keeps the first occurrence."""
+    texts = ["a  b", "c", " a b\n", "c"]
+    assert bdt.dedup_texts(texts) == {0: [0], 1: [1, 3], 2: [2]}
+    assert bdt.dedup_texts(texts, normalize_ws=True) == {0: [0, 2], 1: [1, 3]}
+
+
+def test_batch_deeplx_tr_packed(fake_client):
+    """Short texts share requests, a long one is split, output contract unchanged."""
+    long_text = "Sentence one. " * 30 + "End."
+    texts = [f"cell {idx}" for idx in range(20)] + [long_text]
+    packer = Packer(budget=50, max_chars=100)
+    _ = dict(asyncio.run(bdt.batch_deeplx_tr(texts, n_workers=4, pack=packer)))
+
+    assert [_[idx] for idx in range(20)] == [f"tr: cell {idx}" for idx in range(20)]
+    pieces = split_sentences(long_text, 100)
+    assert len(pieces) > 1
+    assert _[20] == " ".join(f"tr: {piece.strip()}" for piece in pieces)
+
+    n_requests = len([url for url, _ in fake_client if url != "http://fake3"])
+    assert n_requests < len(texts)
+
+
+def test_batch_deeplx_tr_stream_ordered(monkeypatch):
+    """Ordered stream yields seqnos in order though they complete in reverse."""
+
+    async def fake(text, *args, **kwargs):
+        await asyncio.sleep(0.05 * (5 - int(text)))
+        return f"tr: {text}"
+
+    monkeypatch.setattr(bdt, "deeplx_client_async", fake)
+    monkeypatch.setattr(bdt, "DEQ", bdt.deque(URLS[:2]))
+    monkeypatch.setattr(bdt, "TR_CACHE", TranslationCache())
+
+    async def collect(ordered):
+        return [
+            seqno
+            async for seqno, _ in bdt.batch_deeplx_tr_stream(
+                [str(idx) for idx in range(5)], n_workers=5, pack=False, ordered=ordered
+            )
+        ]
+
+    assert asyncio.run(collect(False)) == [4, 3, 2, 1, 0]
+    bdt.TR_CACHE.clear()
+    assert asyncio.run(collect(True)) == [0, 1, 2, 3, 4]
+
+
+def test_batch_deeplx_tr_stream_early_close(fake_client):
+    """Leaving the loop early stops the workers."""
+
+    async def main():
+        stream = bdt.batch_deeplx_tr_stream(
+            [f"text {idx}" for idx in range(50)], n_workers=2, pack=False
+        )
+        async for _ in stream:
+            break
+        await stream.aclose()
+        n_calls = len(fake_client)
+        await asyncio.sleep(0.05)
+        return n_calls
+
+    assert asyncio.run(main()) == len(fake_client) < 50
+
+
+def test_batch_deeplx_tr_pack_empty_line(monkeypatch):
+    """An empty line in a translated pack is sent again alone, never cached empty."""
+    tr_cache = TranslationCache()
+
+    async def fake(text, *args, **kwargs):
+        if text == "a\nb":
+            return "A\n "
+        return text.upper()
+
+    monkeypatch.setattr(bdt, "deeplx_client_async", fake)
+    monkeypatch.setattr(bdt, "DEQ", bdt.deque(URLS))
+
+    _ = dict(asyncio.run(bdt.batch_deeplx_tr(["a", "b"], n_workers=1, tr_cache=tr_cache)))
+    assert _ == {0: "A", 1: "B"}
+    assert tr_cache.get("b") == "B"
+
+
+def test_batch_deeplx_tr_empty_pool(fake_client, monkeypatch):
+    """No url at all: LookupError right away, not markers at the deadline."""
+    monkeypatch.setattr(bdt, "DEQ", bdt.deque())
+    with pytest.raises(LookupError):
+        asyncio.run(bdt.batch_deeplx_tr(["a", "b", "c"], n_workers=2, timeout=5))
+
+
+def test_batch_deeplx_tr_workers_crash(fake_client, monkeypatch):
+    """Workers dying of a bug end the batch at once, marked "worker error"."""
+
+    async def broken(*args, **kwargs):
+        raise AttributeError("a bug")
+
+    monkeypatch.setattr(bdt, "hedged", broken)
+    then = time.monotonic()
+    _ = asyncio.run(bdt.batch_deeplx_tr(["a", "b", "c"], n_workers=2, timeout=5, pack=False))
+    assert time.monotonic() - then < 2
+    assert sorted(seqno for seqno, _ in _) == [0, 1, 2]
+    assert all(trtext.reason == "worker error" for _, trtext in _)
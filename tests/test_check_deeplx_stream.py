@@ -0,0 +1,82 @@
+"""
+Test check_deeplx_stream with a fake checker, no network needed.
+
+Use -s or --capture=no e.g., pytest -s test_foobar.py to show output
+"""
+
+import asyncio
+
+from deeplx_pool.check_deeplx_stream import check_deeplx_bounded, check_deeplx_stream
+
+
+def test_check_deeplx_stream_bounded():
+    """Never more than concurrency probes in flight, every url checked once."""
+    in_flight = max_in_flight = 0
+
+    async def checker(url, **kwargs):  # pylint: disable=unused-argument
+        nonlocal in_flight, max_in_flight
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        await asyncio.sleep(0.001)
+        in_flight -= 1
+        return url, 0.1
+
+    urls = [f"http://url{idx}" for idx in range(50)]
+    _ = asyncio.run(check_deeplx_bounded(urls, concurrency=5, checker=checker))
+
+    assert max_in_flight == 5
+    assert sorted(url for url, _ in _) == sorted(urls)
+
+
+def test_check_deeplx_stream_deadline():
+    """Slow probes beyond the deadline are dropped, fast ones come through first."""
+
+    async def checker(url, **kwargs):  # pylint: disable=unused-argument
+        await asyncio.sleep(10 if "slow" in url else 0)
+        return url, 0.1
+
+    async def collect():
+        return [
+            url
+            async for url, _ in check_deeplx_stream(
+                ["http://slow", "http://fast1", "http://fast2"],
+                concurrency=3,
+                deadline=0.2,
+                checker=checker,
+            )
+        ]
+
+    assert asyncio.run(collect()) == ["http://fast1", "http://fast2"]
+
+
+def test_check_deeplx_stream_checker_exception():
+    """An exception in checker becomes (url, message)."""
+
+    async def checker(url, **kwargs):  # pylint: disable=unused-argument
+        raise RuntimeError("boom")
+
+    _ = asyncio.run(check_deeplx_bounded(["http://x"], checker=checker))
+    assert _ == [("http://x", "boom")]
+
+
+def test_check_deeplx_stream_async_iterable():
+    """Probes start on urls from an async source before it is exhausted."""
+    checked = []
+
+    async def checker(url, **kwargs):  # pylint: disable=unused-argument
+        checked.append(url)
+        return url, 0.1
+
+    async def urls():
+        yield "http://a"
+        await asyncio.sleep(0.05)
+        # the first url is probed while the source is still busy
+        assert checked == ["http://a"]
+        yield "http://b"
+
+    async def main():
+        return [
+            _ async for _ in check_deeplx_stream(urls(), concurrency=4, checker=checker)
+        ]
+
+    assert sorted(asyncio.run(main())) == [("http://a", 0.1), ("http://b", 0.1)]
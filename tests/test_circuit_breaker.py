@@ -0,0 +1,59 @@
+"""
+Test circuit_breaker, no network needed.
+
+Use -s or --capture=no e.g., pytest -s test_foobar.py to show output
+"""
+
+from time import sleep
+
+from deeplx_pool.circuit_breaker import (
+    CLOSED,
+    HALF_OPEN,
+    OPEN,
+    CircuitBreaker,
+    CircuitBreakerBoard,
+)
+
+
+def test_circuit_breaker_cycle():
+    """closed -> open -> half_open -> closed/open."""
+    breaker = CircuitBreaker("http://a", min_calls=4, cooldown=0.05)
+    for ok in [True, False, False, False]:
+        breaker.record(ok)
+    assert breaker.state == OPEN
+    assert not breaker.available()
+
+    sleep(0.06)
+    assert breaker.state == HALF_OPEN
+    assert breaker.available()
+    breaker.acquire()
+    assert not breaker.available()  # one trial call at a time
+
+    breaker.record(False)  # trial failed, cooldown doubled
+    assert breaker.state == OPEN
+    assert breaker.cooldown == 0.1
+
+    sleep(0.11)
+    breaker.acquire()
+    breaker.record(True)
+    assert breaker.state == CLOSED
+    assert breaker.cooldown == 0.05
+
+
+def test_circuit_breaker_below_threshold():
+    """Failure rate below threshold keeps it closed."""
+    breaker = CircuitBreaker(min_calls=4)
+    for ok in [True, True, True, False] * 5:
+        breaker.record(ok)
+    assert breaker.state == CLOSED
+
+
+def test_circuit_breaker_board():
+    """Board creates breakers lazily and reports them."""
+    board = CircuitBreakerBoard(min_calls=2)
+    assert board.available("http://a")
+    board.record("http://a", False)
+    board.record("http://a", False)
+    assert not board.available("http://a")
+    assert board.open_urls() == ["http://a"]
+    assert board.snapshot()["http://a"]["state"] == OPEN
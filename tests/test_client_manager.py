@@ -0,0 +1,89 @@
+"""Test deeplx_client_async.ClientManager: per-host and global caps, one client per loop."""
+
+import asyncio
+
+import httpx
+import pytest
+
+from deeplx_pool.deeplx_client_async import ClientManager
+
+
+async def hold(manager, url, entered, release, timeout=None):
+    """Take a slot of url, note it, keep it until release is set."""
+    async with manager.slot(url, timeout):
+        entered.append(url)
+        await release.wait()
+
+
+def test_per_host_cap():
+    """A host gets per_host_limit slots, the next request waits."""
+
+    async def main():
+        manager = ClientManager(concurrency_limit=10, per_host_limit=2)
+        entered, release = [], asyncio.Event()
+        tasks = [asyncio.create_task(hold(manager, "http://a:1", entered, release)) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        assert len(entered) == 2
+        release.set()
+        await asyncio.gather(*tasks)
+        assert len(entered) == 3
+        await manager.aclose()
+
+    asyncio.run(main())
+
+
+def test_busy_host_does_not_block_others():
+    """Requests queued on a busy host hold no global slot."""
+
+    async def main():
+        manager = ClientManager(concurrency_limit=2, per_host_limit=1)
+        entered, release = [], asyncio.Event()
+        tasks = [asyncio.create_task(hold(manager, "http://a:1", entered, release)) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        tasks.append(asyncio.create_task(hold(manager, "http://b:1", entered, release)))
+        await asyncio.sleep(0.01)
+        assert entered == ["http://a:1", "http://b:1"]
+        release.set()
+        await asyncio.gather(*tasks)
+        await manager.aclose()
+
+    asyncio.run(main())
+
+
+def test_global_cap_and_slot_timeout():
+    """No more than concurrency_limit slots, a wait beyond timeout raises PoolTimeout."""
+
+    async def main():
+        manager = ClientManager(concurrency_limit=2, per_host_limit=5)
+        entered, release = [], asyncio.Event()
+        tasks = [
+            asyncio.create_task(hold(manager, f"http://{host}:1", entered, release))
+            for host in "ab"
+        ]
+        await asyncio.sleep(0.01)
+        with pytest.raises(httpx.PoolTimeout):
+            await hold(manager, "http://c:1", entered, release, timeout=0.05)
+        assert entered == ["http://a:1", "http://b:1"]
+        release.set()
+        await asyncio.gather(*tasks)
+        # slots given back, also by the one that timed out
+        await asyncio.wait_for(hold(manager, "http://c:1", entered, release), 1)
+        await manager.aclose()
+
+    asyncio.run(main())
+
+
+def test_client_per_loop():
+    """Same client within a loop, a new one for the next asyncio.run."""
+    manager = ClientManager()
+
+    async def main():
+        client = manager.client()
+        assert manager.client() is client
+        await manager.aclose()
+        return client
+
+    first = asyncio.run(main())
+    second = asyncio.run(main())
+    assert first is not second
+    assert first.is_closed and second.is_closed
@@ -0,0 +1,110 @@
+"""Test concurrency, and batch_deeplx_tr's adaptive default."""
+
+import asyncio
+
+import pytest
+
+import deeplx_pool.batch_deeplx_tr as bdt
+from deeplx_pool.concurrency import ConcurrencyController
+from deeplx_pool.tr_cache import TranslationCache
+
+
+def run_round(controller, seconds, failed=0, latency=1.0):
+    """Fill the limit, complete all requests seconds later."""
+
+    async def fill():
+        for _ in range(controller.permits):
+            await controller.acquire()
+
+    asyncio.run(fill())
+    controller.round_started = 0.0
+    for idx in range(controller.permits):
+        controller.release(latency, idx < failed, now=seconds)
+
+
+def test_slow_start_then_additive():
+    """Doubles while throughput scales, back to the last good limit, then +1."""
+    controller = ConcurrencyController(initial=4, max_limit=64)
+    run_round(controller, 1)  # 4/s
+    assert controller.limit == 8
+    run_round(controller, 1)  # 8/s
+    assert controller.limit == 16
+    run_round(controller, 2)  # 8/s, doubling did not pay off
+    assert controller.limit == 8 and not controller.slow_start
+    run_round(controller, 1)
+    assert controller.limit == 9
+
+
+def test_decrease_on_errors_and_latency():
+    """Overload errors or a queueing pool shrink the limit, not below min_limit."""
+    controller = ConcurrencyController(initial=10, max_limit=64)
+    run_round(controller, 1, failed=5)
+    assert controller.limit == pytest.approx(7)
+    run_round(controller, 1, latency=0.5)
+    run_round(controller, 1, latency=2.0)  # 4x the best median
+    assert controller.limit < 7
+    for _ in range(20):
+        run_round(controller, 1, failed=4)
+    assert controller.limit == 1
+
+
+def test_acquire_waits_for_permit():
+    """Requests beyond the limit wait for a release."""
+
+    async def main():
+        controller = ConcurrencyController(initial=2, max_limit=2)
+        await controller.acquire()
+        await controller.acquire()
+        waiter = asyncio.create_task(controller.acquire())
+        await asyncio.sleep(0)
+        assert not waiter.done()
+        controller.release()
+        await waiter
+        assert controller.in_flight == 2
+
+    asyncio.run(main())
+
+
+def test_batch_adaptive_default(monkeypatch):
+    """n_workers=None: all done, never more in flight than the pool allows."""
+    in_flight = peak = 0
+
+    async def fake(text, *args, **kwargs):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        return f"tr: {text}"
+
+    monkeypatch.setattr(bdt, "deeplx_client_async", fake)
+    monkeypatch.setattr(bdt, "DEQ", bdt.deque(["http://fake1", "http://fake2"]))
+    monkeypatch.setattr(bdt, "TR_CACHE", TranslationCache())
+
+    texts = [f"text {idx}" for idx in range(40)]
+    _ = asyncio.run(bdt.batch_deeplx_tr(texts, pack=False))
+    assert sorted(trtext for _, trtext in _) == sorted(f"tr: {text}" for text in texts)
+    assert 2 <= peak <= 8  # 2 urls, PER_URL 4
+
+
+def test_shared_controller_survives_deadline(monkeypatch):
+    """Permits of workers cancelled at the deadline are given back."""
+
+    async def fake(text, *args, **kwargs):
+        if "slow" in text:
+            await asyncio.sleep(10)
+        return f"tr: {text}"
+
+    monkeypatch.setattr(bdt, "deeplx_client_async", fake)
+    monkeypatch.setattr(bdt, "DEQ", bdt.deque(["http://fake1", "http://fake2"]))
+    monkeypatch.setattr(bdt, "TR_CACHE", TranslationCache())
+
+    controller = ConcurrencyController(initial=2, max_limit=2)
+    _ = asyncio.run(
+        bdt.batch_deeplx_tr(["slow 1", "slow 2"], n_workers=controller, timeout=0.2, pack=False)
+    )
+    assert not any(trtext for _, trtext in _)
+    assert controller.in_flight == 0
+
+    _ = asyncio.run(bdt.batch_deeplx_tr(["a", "b"], n_workers=controller, pack=False))
+    assert sorted(trtext for _, trtext in _) == ["tr: a", "tr: b"]
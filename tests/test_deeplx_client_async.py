@@ -0,0 +1,70 @@
+"""Test deeplx_client_async against a local server, no network needed."""
+
+import asyncio
+from time import monotonic
+
+import httpx
+import pytest
+
+from deeplx_pool.deeplx_client_async import CLIENT_MANAGER, deeplx_client_async
+
+
+async def serve(trickle: float):
+    """Start a server that answers with a byte every trickle seconds, return it and its url."""
+
+    async def handle(reader, writer):
+        await reader.read(65536)
+        body = b'{"code": 200, "data": "hallo", "alternatives": ["servus"]}'
+        writer.write(
+            b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+            b"Content-Length: %d\r\n\r\n" % len(body)
+        )
+        try:
+            for idx in range(len(body)):
+                writer.write(body[idx : idx + 1])
+                await writer.drain()
+                await asyncio.sleep(trickle)
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        writer.close()
+
+    server = await asyncio.start_server(handle, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    return server, f"http://127.0.0.1:{port}"
+
+
+def test_translate_and_split():
+    """Translation, alternatives joined or as a list."""
+
+    async def main():
+        server, url = await serve(0)
+        try:
+            kwargs = {"target_lang": "de", "url": url, "timeout": 5}
+            assert await deeplx_client_async("hello", **kwargs) == "hallo"
+            trtext = await deeplx_client_async("hello", alternatives=True, **kwargs)
+            assert trtext == "hallo / servus"
+            assert await deeplx_client_async(
+                "hello", alternatives=True, split=True, **kwargs
+            ) == ("hallo", ["servus"])
+        finally:
+            server.close()
+            await CLIENT_MANAGER.aclose()
+
+    asyncio.run(main())
+
+
+def test_timeout_bounds_the_whole_request():
+    """A server trickling bytes faster than the read timeout still ends at timeout."""
+
+    async def main():
+        server, url = await serve(0.05)  # about 3s for the body
+        then = monotonic()
+        try:
+            with pytest.raises(httpx.ReadTimeout):
+                await deeplx_client_async("hello", target_lang="de", url=url, timeout=0.5)
+        finally:
+            server.close()
+            await CLIENT_MANAGER.aclose()
+        return monotonic() - then
+
+    assert asyncio.run(main()) < 1.5
@@ -0,0 +1,53 @@
+"""Test deeplx_pool.discover_stream with fake sources, no network needed."""
+
+import asyncio
+
+from deeplx_pool.deeplx_pool import discover_stream, merge_feed
+
+
+def test_discover_stream_fast_first_dedup_deadline():
+    """Fast sources come first, duplicates and known urls dropped, late source skipped."""
+
+    async def fast():
+        return ["http://a", "http://b", "http://known"]
+
+    async def slow():
+        await asyncio.sleep(0.1)
+        return ["http://b", "http://c"]
+
+    async def stuck():
+        await asyncio.sleep(10)
+        return ["http://never"]
+
+    async def main():
+        return [
+            url
+            async for url in discover_stream(
+                {"slow": slow, "stuck": stuck, "fast": fast},
+                seen=["http://known"],
+                deadline=0.3,
+            )
+        ]
+
+    assert asyncio.run(main()) == ["http://a", "http://b", "http://c"]
+
+
+def test_merge_feed_discovery_from_the_start():
+    """New urls are not held back until all known urls are taken."""
+
+    async def new_urls():
+        await asyncio.sleep(0.02)
+        yield "http://new1"
+        yield "http://new2"
+
+    async def main():
+        urls = []
+        async for url in merge_feed([f"http://known{idx}" for idx in range(10)], new_urls()):
+            urls.append(url)
+            await asyncio.sleep(0.01)  # a slow consumer, e.g. busy probes
+        return urls
+
+    urls = asyncio.run(main())
+    known = [f"http://known{idx}" for idx in range(10)]
+    assert sorted(urls) == sorted(known + ["http://new1", "http://new2"])
+    assert urls.index("http://new1") < 5
@@ -0,0 +1,100 @@
+"""Test endpoint_registry on a tmp diskcache."""
+
+import diskcache
+
+from deeplx_pool.endpoint_registry import (
+    HEALTHY_INTERVAL,
+    PREFIX,
+    STATES_KEY,
+    EndpointRegistry,
+)
+from deeplx_pool.latency_stats import LatencyStats
+
+
+def test_migrate_and_merge(tmp_path):
+    """First load takes deeplx-states and urls only in deeplx-sites."""
+    cache_ = diskcache.Cache(tmp_path)
+    cache_.set(
+        STATES_KEY,
+        {
+            "http://a": {"latency": 0.5, "failures": 0, "last_checked": 1.0, "next_due": 9e9},
+            "http://b": {"latency": None, "failures": 2, "last_checked": 1.0, "next_due": 0},
+        },
+    )
+    cache_.set("deeplx-sites", [("http://a", 0.5), ("http://c", 0.2)])
+
+    registry = EndpointRegistry(cache_, LatencyStats()).load()
+    assert set(registry.records) == {"http://a", "http://b", "http://c"}
+    assert registry.ranked() == [("http://c", 0.2), ("http://a", 0.5)]
+    assert registry.due_urls() == ["http://b", "http://c"]
+    assert registry.records["http://c"].source == "deeplx-sites"
+
+    registry.save()
+    assert EndpointRegistry(cache_, LatencyStats()).load().ranked() == registry.ranked()
+
+
+def test_update_order_and_flush(tmp_path):
+    """Updates re-rank, only changed records are written."""
+    cache_ = diskcache.Cache(tmp_path)
+    registry = EndpointRegistry(cache_, LatencyStats())
+    registry.update("http://a", 0.3, now=100.0, source="shodan")
+    registry.update("http://b", 0.1, now=100.0)
+    assert registry.save() == [("http://b", 0.1), ("http://a", 0.3)]
+    assert not registry.dirty
+
+    record = registry.update("http://b", "timeout", now=200.0)
+    assert record.failures == 1
+    assert record.next_due == 200.0 + HEALTHY_INTERVAL * 2
+    assert registry.dirty == {"http://b"}
+    assert registry.flush() == 1
+    assert registry.ranked() == [("http://a", 0.3)]
+
+    registry.update("http://a", 0.2, now=300.0)
+    assert registry.records["http://a"].history == [0.3, 0.2]
+    assert cache_.get(PREFIX + "http://a")[1] == 0.3  # not flushed yet
+
+    registry.remove("http://b")
+    registry.save()
+    assert cache_.get(PREFIX + "http://b") is None
+
+    loaded = EndpointRegistry(cache_, LatencyStats()).load()
+    assert list(loaded.records) == ["http://a"]
+    assert loaded.records["http://a"].source == "shodan"
+    assert cache_.get("deeplx-sites") == [("http://a", 0.3)]  # tail, not the last probe
+
+
+def test_rank_by_tail(tmp_path):
+    """A fast last probe does not hide a slow tail, live samples count too."""
+    stats = LatencyStats()
+    registry = EndpointRegistry(diskcache.Cache(tmp_path), stats)
+    for latency in [0.2, 0.2, 3.0, 0.2]:
+        registry.update("http://spiky", latency)
+    registry.update("http://steady", 0.5)
+    assert registry.ranked() == [("http://steady", 0.5), ("http://spiky", 3.0)]
+
+    for _ in range(20):
+        stats.record("http://steady", 4.0)
+    assert registry.save()[0] == ("http://spiky", 3.0)
+
+
+def test_save_writes_sites_on_rank_change(tmp_path):
+    """deeplx-sites is rewritten when the order changes, or forced, not per probe."""
+    cache_ = diskcache.Cache(tmp_path)
+    registry = EndpointRegistry(cache_, latency_stats=None).load()
+    registry.update("http://a", 0.5, now=0.0)
+    registry.update("http://b", 0.9, now=0.0)
+    assert registry.save() == [("http://a", 0.5), ("http://b", 0.9)]
+
+    cache_.set("deeplx-sites", "untouched")
+    registry.update("http://a", 0.6, now=1.0)  # same order
+    registry.save()
+    assert cache_.get("deeplx-sites") == "untouched"
+    assert cache_.get(PREFIX + "http://a")[1] == 0.6  # the record is written
+
+    registry.update("http://b", "timeout", now=1.0)  # membership changes
+    assert registry.save() == [("http://a", 0.6)]
+    assert cache_.get("deeplx-sites") == [("http://a", 0.6)]
+
+    cache_.set("deeplx-sites", "untouched")
+    registry.save(force=True)
+    assert cache_.get("deeplx-sites") == [("http://a", 0.6)]
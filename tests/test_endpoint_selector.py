@@ -0,0 +1,52 @@
+"""
+Test endpoint_selector policies, no network needed.
+
+Use -s or --capture=no e.g., pytest -s test_foobar.py to show output
+"""
+
+from collections import Counter
+
+import pytest
+
+from deeplx_pool.endpoint_selector import SELECTORS, make_selector
+
+SITES = [("http://fast", 0.3), ("http://mid", 1.0), ("http://slow", 9.0)]
+
+
+@pytest.mark.parametrize("policy", ["ewma", "p2c", "least_outstanding"])
+def test_selector_prefers_fast(policy):
+    """Latency-aware policies give the fast url the largest share."""
+    selector = make_selector(policy, SITES)
+    _ = Counter()
+    for _n in range(300):
+        url = selector.select()
+        _[url] += 1
+        selector.acquire(url)
+        selector.release(url, dict(SITES)[url])
+    assert _.most_common(1)[0][0] == "http://fast"
+
+
+@pytest.mark.parametrize("policy", list(SELECTORS))
+def test_selector_skips_failed(policy):
+    """A url that just failed is not picked again right away."""
+    selector = make_selector(policy, SITES)
+    selector.acquire("http://fast")
+    selector.release("http://fast", 0.1, ok=False)
+    assert "http://fast" not in {selector.select() for _ in range(50)}
+
+
+def test_round_robin_order():
+    """round_robin rotates fastest first, like deq[-1] + deq.rotate()."""
+    selector = make_selector("round_robin", SITES)
+    assert [selector.select() for _ in range(4)] == [
+        "http://fast",
+        "http://mid",
+        "http://slow",
+        "http://fast",
+    ]
+
+
+def test_selector_empty():
+    """No url, LookupError."""
+    with pytest.raises(LookupError):
+        make_selector("p2c").select()
@@ -0,0 +1,91 @@
+"""Test fastapi_app's /translate and /translate/batch with a fake deeplx_client_async."""
+# pylint: disable=redefined-outer-name
+
+import asyncio
+
+import diskcache
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+import deeplx_pool.batch_deeplx_tr as bdt
+import deeplx_pool.fastapi_app as fa
+import deeplx_pool.pool_translator as pt
+
+
+@pytest.fixture
+def client(monkeypatch, tmp_path):
+    """App client, TRANSLATOR over fake urls listed in a cache at tmp_path."""
+    cache_ = diskcache.Cache(tmp_path)
+    cache_.set("deeplx-sites", [("http://fake1", 0.1)])
+    monkeypatch.setattr(fa, "TRANSLATOR", pt.PoolTranslator(cache_=cache_, tr_cache=None))
+    monkeypatch.setattr(fa, "TOKENS", None)
+    return TestClient(fa.app)
+
+
+def use_fake(monkeypatch, fake):
+    """Replace deeplx_client_async for translate and batches."""
+    monkeypatch.setattr(pt, "deeplx_client_async", fake)
+    monkeypatch.setattr(bdt, "deeplx_client_async", fake)
+
+
+def test_translate(client, monkeypatch):
+    """DeepLX response shape: raw data, alternatives as a list."""
+
+    async def fake(text, source_lang="", target_lang="", alternatives=False, split=False, **kwargs):
+        alts = ["hallo!", "servus"] if alternatives else []
+        return ("hallo", alts) if split else "hallo"
+
+    use_fake(monkeypatch, fake)
+    resp = client.post("/translate", json={"text": "hello", "target_lang": "DE"})
+    assert resp.status_code == 200
+    assert resp.json()["data"] == "hallo" and resp.json()["alternatives"] == []
+
+    resp = client.post(
+        "/translate", json={"text": "hello", "target_lang": "DE", "alternatives": True}
+    )
+    assert resp.json()["data"] == "hallo"
+    assert resp.json()["alternatives"] == ["hallo!", "servus"]
+
+
+def test_translate_unavailable(client, monkeypatch):
+    """503 if no url delivered."""
+
+    async def fake(*args, **kwargs):
+        raise httpx.ConnectError("fake down")
+
+    use_fake(monkeypatch, fake)
+    resp = client.post("/translate", json={"text": "hello"})
+    assert resp.status_code == 503
+
+
+@pytest.mark.parametrize("upstream, expected", [(400, 400), (413, 422), (422, 422)])
+def test_translate_rejected(client, monkeypatch, upstream, expected):
+    """A text the deeplx rejects is a client error."""
+
+    async def fake(*args, url=None, **kwargs):
+        request = httpx.Request("POST", f"{url}/translate")
+        raise httpx.HTTPStatusError(
+            str(upstream), request=request, response=httpx.Response(upstream, request=request)
+        )
+
+    use_fake(monkeypatch, fake)
+    resp = client.post("/translate", json={"text": "hello"})
+    assert resp.status_code == expected
+
+
+def test_translate_batch(client, monkeypatch):
+    """Texts in order, 503 if there is no url at all."""
+
+    async def fake(text, source_lang="", target_lang="", *args, **kwargs):
+        return "\n".join(f"{target_lang}: {line}" for line in text.split("\n"))
+
+    use_fake(monkeypatch, fake)
+    resp = client.post("/translate/batch", json={"texts": ["one", "two"], "target_lang": "fr"})
+    assert resp.status_code == 200
+    assert resp.json()["data"] == ["fr: one", "fr: two"]
+
+    fa.TRANSLATOR.cache.set("deeplx-sites", [])
+    asyncio.run(fa.TRANSLATOR.refresh(force=True))
+    resp = client.post("/translate/batch", json={"texts": ["one"]})
+    assert resp.status_code == 503
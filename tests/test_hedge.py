@@ -0,0 +1,67 @@
+"""Test hedge with a fake call, no network needed."""
+
+import asyncio
+
+from deeplx_pool.endpoint_selector import RoundRobinSelector
+from deeplx_pool.hedge import HedgeBudget, hedged
+from deeplx_pool.retry_policy import ENDPOINT_FATAL, classify
+
+
+def make_call(cancelled, slow=2.0):
+    """Return a fake call that sleeps per url and records cancellations."""
+    delays = {"http://slow": slow, "http://fast": 0.01}
+
+    async def call(url):
+        try:
+            await asyncio.sleep(delays[url])
+        except asyncio.CancelledError:
+            cancelled.append(url)
+            raise
+        return f"from {url}"
+
+    return call
+
+
+def test_hedge_wins_loser_cancelled():
+    """Slow primary is hedged, the fast answer wins, the slow one is cancelled."""
+    cancelled = []
+    selector = RoundRobinSelector(["http://slow", "http://fast"])
+    budget = HedgeBudget(min_delay=0.05)
+
+    url, trtext = asyncio.run(hedged(make_call(cancelled), selector, budget))
+    assert (url, trtext) == ("http://fast", "from http://fast")
+    assert cancelled == ["http://slow"]
+    assert budget.snapshot() == {"requests": 1, "hedges": 1, "wins": 1}
+    assert all(elm.outstanding == 0 for elm in selector.stats.values())
+    assert selector.stats["http://slow"].n_fail == 0  # not a failure
+
+
+def test_budget_caps_hedges():
+    """No token left: wait for the primary."""
+    cancelled = []
+    selector = RoundRobinSelector(["http://slow", "http://fast"])
+    budget = HedgeBudget(min_delay=0.05)
+    budget.tokens = 0
+
+    url, _ = asyncio.run(hedged(make_call(cancelled, slow=0.2), selector, budget))
+    assert url == "http://slow"
+    assert budget.hedges == 0 and not cancelled
+
+    budget = HedgeBudget(ratio=0.25)
+    budget.tokens = 0
+    for _ in range(4):
+        budget.on_request()
+    assert budget.try_spend() and not budget.try_spend()
+
+
+def test_non_str_result_is_a_failure():
+    """None (json without "data") is a failed attempt, not a crash."""
+
+    async def call(url):
+        return None
+
+    selector = RoundRobinSelector(["http://a"])
+    url, trtext = asyncio.run(hedged(call, selector))
+    assert url == "http://a" and isinstance(trtext, TypeError)
+    assert classify(trtext) == ENDPOINT_FATAL
+    assert selector.stats["http://a"].n_fail == 1
@@ -0,0 +1,35 @@
+"""Test latency_stats and its use in endpoint_selector."""
+
+from deeplx_pool.endpoint_selector import LeastOutstandingSelector
+from deeplx_pool.latency_stats import LatencyStats, LatencyWindow, quantile
+
+
+def test_quantiles_rolling():
+    """Nearest rank, old samples drop out."""
+    assert quantile([], 0.5) is None
+    assert quantile([3, 1, 2], 0.5) == 2
+    assert quantile(range(1, 101), 0.95) == 95
+    assert quantile(range(1, 101), 0.99) == 99
+
+    window = LatencyWindow(maxlen=10)
+    for latency in range(20):
+        window.add(float(latency))
+    assert window.snapshot() == {"n": 10, "p50": 14.0, "p95": 19.0, "p99": 19.0}
+
+    stats = LatencyStats()
+    stats.record("http://a", 1.0)
+    stats.record("http://a", 9.0, ok=False)
+    assert stats.samples("http://a") == [1.0]
+    assert stats.quantile("http://b") is None
+
+
+def test_selector_avoids_slow_tail():
+    """Same ewma-ish average, the one with the slow tail loses."""
+    selector = LeastOutstandingSelector(["http://steady", "http://spiky"])
+    for _ in range(20):
+        selector.release("http://steady", 0.6)
+    for idx in range(20):
+        selector.release("http://spiky", 5.0 if idx % 5 == 0 else 0.2)
+    spiky = selector.stats["http://spiky"]
+    assert spiky.latency == 5.0 > spiky.ewma
+    assert selector.select() == "http://steady"
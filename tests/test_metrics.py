@@ -0,0 +1,81 @@
+"""Test metrics.MetricsRegistry against a cache at tmp_path."""
+
+import asyncio
+
+import diskcache
+
+import deeplx_pool.batch_deeplx_tr as bdt
+from deeplx_pool.metrics import MetricsRegistry
+from deeplx_pool.tr_cache import TranslationCache
+
+
+def test_counters():
+    """incr/get/total/snapshot."""
+    metrics = MetricsRegistry()
+    metrics.incr("workers_succ", 0)
+    metrics.incr("workers_succ", 1, 2)
+    assert metrics.get("workers_succ") == {0: 1, 1: 2}
+    assert metrics.total("workers_succ") == 3
+    assert not metrics.get("unknown")
+    assert metrics.snapshot() == {"workers_succ": {0: 1, 1: 2}}
+
+
+def test_flush_merges(tmp_path):
+    """Concurrent registries add up in the cache, a repeated flush adds nothing."""
+    cache_ = diskcache.Cache(tmp_path)
+    first, second = MetricsRegistry(cache_), MetricsRegistry(cache_)
+    first.incr("endpoints_succ", "http://a", 3)
+    second.incr("endpoints_succ", "http://a")
+    second.incr("endpoints_succ", "http://b")
+    first.flush()
+    second.flush()
+    second.flush()
+    assert cache_.get("endpoints_succ") == {"http://a": 4, "http://b": 1}
+
+    first.incr("endpoints_succ", "http://a")
+    asyncio.run(first.aflush())
+    assert cache_.get("endpoints_succ") == {"http://a": 5, "http://b": 1}
+
+
+def test_flush_replaces_legacy_list(tmp_path):
+    """A list left by older versions is not merged into, the counter starts over."""
+    cache_ = diskcache.Cache(tmp_path)
+    cache_.set("workers_succ", [0, 7, 3])
+    metrics = MetricsRegistry(cache_)
+    metrics.incr("workers_succ", 1)
+    metrics.flush()
+    assert cache_.get("workers_succ") == {1: 1}
+
+
+def test_late_older_snapshot(tmp_path):
+    """An older snapshot flushed after a newer one changes nothing."""
+    cache_ = diskcache.Cache(tmp_path)
+    metrics = MetricsRegistry(cache_, prefix="job-")
+    metrics.incr("workers_fail", 0)
+    older = metrics.snapshot()
+    metrics.incr("workers_fail", 0)
+    metrics.flush()
+    metrics.flush(older)
+    assert cache_.get("job-workers_fail") == {0: 2}
+
+
+def test_concurrent_batches_add_up(monkeypatch, metrics_cache):
+    """Two batches at the same time: the cached counters hold both."""
+
+    async def fake(text, *args, **kwargs):
+        await asyncio.sleep(0.01)
+        return f"tr: {text}"
+
+    monkeypatch.setattr(bdt, "deeplx_client_async", fake)
+    monkeypatch.setattr(bdt, "DEQ", bdt.deque(["http://fake1", "http://fake2"]))
+    monkeypatch.setattr(bdt, "TR_CACHE", TranslationCache())
+
+    async def main():
+        return await asyncio.gather(
+            bdt.batch_deeplx_tr([f"a {idx}" for idx in range(5)], pack=False),
+            bdt.batch_deeplx_tr([f"b {idx}" for idx in range(7)], pack=False),
+        )
+
+    asyncio.run(main())
+    assert sum(metrics_cache.get("workers_succ").values()) == 12
+    assert sum(metrics_cache.get("endpoints_succ").values()) == 12
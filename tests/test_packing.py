@@ -0,0 +1,88 @@
+"""Test packing."""
+
+import asyncio
+
+import deeplx_pool.batch_deeplx_tr as bdt
+from deeplx_pool.packing import Packer, split_sentences
+from deeplx_pool.retry_policy import RetryPolicy
+from deeplx_pool.tr_cache import TranslationCache
+
+
+def test_split_sentences():
+    """Pieces fit max_chars, cut at sentence ends, nothing lost."""
+    text = "First one. Second one! Third? 第四句。第五句。" + "x" * 30
+    pieces = split_sentences(text, 25)
+    assert "".join(pieces) == text
+    assert all(len(piece) <= 25 for piece in pieces)
+    assert pieces[0] == "First one. Second one! "
+    assert split_sentences("short", 25) == ["short"]
+
+
+def test_pack_unpack():
+    """Packed texts come back per seqno."""
+    packer = Packer(budget=20, max_chars=0)
+    units = packer.pack([(0, "a"), (1, "b"), (2, "multi\nline"), (3, "c")])
+    assert units == [(0, "multi\nline"), (1, "a\nb\nc")]
+
+    assert packer.unpack(1, "A\nB\nC") == ([(0, "A"), (1, "B"), (3, "C")], [])
+    assert packer.unpack(0, "MULTI\nLINE") == ([(2, "MULTI\nLINE")], [])
+
+
+def test_unpack_mismatch_falls_back():
+    """Lines merged by the translator: texts are sent one by one."""
+    packer = Packer(budget=20)
+    [(unit_id, _)] = packer.pack([(5, "a"), (6, "b")])
+    done, units = packer.unpack(unit_id, "A B")
+    assert not done
+    assert [text for _, text in units] == ["a", "b"]
+    assert packer.unpack(units[1][0], "B") == ([(6, "B")], [])
+    assert packer.unpack(units[0][0], "A") == ([(5, "A")], [])
+
+
+def test_unpack_empty_part_resent():
+    """A line that came back empty is sent again alone, the others are done."""
+    packer = Packer(budget=20)
+    [(unit_id, _)] = packer.pack([(0, "a"), (1, "b"), (2, "c")])
+    done, units = packer.unpack(unit_id, "A\n \nC")
+    assert done == [(0, "A"), (2, "C")]
+    assert [text for _, text in units] == ["b"]
+    assert packer.unpack(units[0][0], "B") == ([(1, "B")], [])
+
+
+def test_pieces_reassembled():
+    """A split text is done when all its pieces are."""
+    packer = Packer(budget=0, max_chars=12)
+    units = packer.pack([(0, "One two. Three four. Five.")])
+    assert [text for _, text in units] == ["One two.", "Three four.", "Five."]
+    assert packer.unpack(units[2][0], "5.") == ([], [])
+    assert packer.unpack(units[0][0], "1 2.") == ([], [])
+    assert packer.unpack(units[1][0], "3 4.") == ([(0, "1 2. 3 4. 5.")], [])
+
+
+def test_pieces_have_own_retry_budget(monkeypatch):
+    """Done pieces of a split text do not use up the attempts of the others."""
+    calls = []
+
+    async def fake(text, *args, **kwargs):
+        calls.append(text)
+        if len(calls) == 6:
+            raise RuntimeError("one transient 503")
+        return text.upper()
+
+    monkeypatch.setattr(bdt, "deeplx_client_async", fake)
+    monkeypatch.setattr(bdt, "DEQ", bdt.deque(["http://fake1", "http://fake2"]))
+    monkeypatch.setattr(bdt, "TR_CACHE", TranslationCache())
+
+    text = " ".join(f"Sentence {idx}." for idx in range(12))
+    _ = asyncio.run(
+        bdt.batch_deeplx_tr(
+            [text],
+            n_workers=1,
+            pack=Packer(budget=0, max_chars=12),
+            retry_policy=RetryPolicy(max_attempts=5),
+            timeout=10,
+        )
+    )
+    assert _ == [(0, text.upper())]
+    n_pieces = len(Packer(budget=0, max_chars=12).pack([(0, text)]))
+    assert n_pieces > 5 and len(calls) == n_pieces + 1
@@ -0,0 +1,136 @@
+"""Test PoolTranslator with a fake deeplx_client_async, no network needed."""
+# pylint: disable=redefined-outer-name
+
+import asyncio
+import threading
+
+import diskcache
+import httpx
+import pytest
+
+import deeplx_pool.batch_deeplx_tr as bdt
+import deeplx_pool.pool_translator as pt
+from deeplx_pool.tr_cache import TranslationCache
+
+
+@pytest.fixture
+def translator(monkeypatch, tmp_path):
+    """PoolTranslator over two fake urls, fake2 always fails."""
+    calls = []
+
+    async def fake(
+        text,
+        source_lang="",
+        target_lang="",
+        alternatives=False,
+        url=None,
+        timeout=None,
+        split=False,
+    ):
+        calls.append(url)
+        if url == "http://fake2":
+            raise RuntimeError("fake 503")
+        trtext = "\n".join(f"{target_lang}: {line}" for line in text.split("\n"))
+        alts = [f"{trtext}!"] if alternatives else []
+        if split:
+            return trtext, alts
+        return f"{trtext} / {', '.join(alts)}" if alts else trtext
+
+    monkeypatch.setattr(pt, "deeplx_client_async", fake)
+    monkeypatch.setattr(bdt, "deeplx_client_async", fake)
+
+    cache_ = diskcache.Cache(tmp_path)
+    cache_.set("deeplx-sites", [("http://fake2", 0.1), ("http://fake1", 0.5)])
+    translator = pt.PoolTranslator(cache_=cache_, tr_cache=TranslationCache())
+    translator.calls = calls
+    return translator
+
+
+def test_translate_fails_over(translator):
+    """A failing url is skipped within the same request."""
+    for _ in range(5):
+        assert asyncio.run(translator.translate("hello", target_lang="de")) == "de: hello"
+        translator.tr_cache.clear()
+    assert "http://fake1" in translator.calls
+    assert translator.breakers.snapshot()["http://fake2"]["calls"] > 0
+
+
+def test_translate_all_fail(translator):
+    """TranslateError once every url failed."""
+    translator.selector.remove("http://fake1")
+    translator.cache.set("deeplx-sites", [("http://fake2", 0.1)])
+    with pytest.raises(pt.TranslateError):
+        asyncio.run(translator.translate("hello"))
+
+
+def test_translate_batch(translator):
+    """Batch keeps the order of texts."""
+    texts = ["one", "two", "one"]
+    assert asyncio.run(translator.translate_batch(texts, target_lang="fr")) == [
+        "fr: one",
+        "fr: two",
+        "fr: one",
+    ]
+
+
+def test_translate_rejected(translator, monkeypatch):
+    """A 400 ends the request at once, as TranslateRejected, the url's breaker untouched."""
+    request = httpx.Request("POST", "http://fake1/translate")
+    error = httpx.HTTPStatusError(
+        "400", request=request, response=httpx.Response(400, request=request)
+    )
+
+    async def fake(*args, **kwargs):
+        raise error
+
+    monkeypatch.setattr(pt, "deeplx_client_async", fake)
+    with pytest.raises(pt.TranslateRejected) as exc_info:
+        asyncio.run(translator.translate("bad"))
+    assert exc_info.value.status == 400
+    assert all(elm["calls"] == 0 for elm in translator.breakers.snapshot().values())
+
+
+def test_translate_alternatives(translator):
+    """translate_full gives the alternatives as a list, translate joins them."""
+    translator.selector.remove("http://fake2")
+    translator.cache.set("deeplx-sites", [("http://fake1", 0.5)])
+    assert asyncio.run(
+        translator.translate_full("hello", target_lang="de", alternatives=True)
+    ) == ("de: hello", ["de: hello!"])
+    assert asyncio.run(
+        translator.translate("hello", target_lang="de", alternatives=True)
+    ) == "de: hello / de: hello!"
+
+
+def test_cancelled_request_gives_url_back(translator, monkeypatch):
+    """A cancelled request (client gone) leaves nothing in flight, no failure recorded."""
+
+    async def fake(*args, **kwargs):
+        await asyncio.sleep(10)
+
+    async def main():
+        task = asyncio.create_task(translator.translate("hello"))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    monkeypatch.setattr(pt, "deeplx_client_async", fake)
+    asyncio.run(main())
+    assert all(elm.outstanding == 0 for elm in translator.selector.stats.values())
+    assert all(elm.n_fail == 0 for elm in translator.selector.stats.values())
+
+
+def test_refresh_reads_off_the_loop(translator):
+    """The "deeplx-sites" read of a refresh happens in a thread."""
+    threads = []
+    cache_ = translator.cache
+    get = cache_.get
+
+    def spy(*args, **kwargs):
+        threads.append(threading.get_ident())
+        return get(*args, **kwargs)
+
+    cache_.get = spy
+    asyncio.run(translator.refresh(force=True))
+    assert threads and threading.get_ident() not in threads
@@ -0,0 +1,126 @@
+"""Test rate_limit, and batch_deeplx_tr avoiding a rate limited url."""
+
+import asyncio
+from email.utils import formatdate
+from time import time
+
+import pytest
+
+import deeplx_pool.batch_deeplx_tr as bdt
+from deeplx_pool.circuit_breaker import CircuitBreakerBoard
+from deeplx_pool.rate_limit import (
+    MIN_RATE,
+    RateLimited,
+    RateLimiter,
+    TokenBucket,
+    parse_retry_after,
+)
+from deeplx_pool.retry_policy import RetryPolicy
+from deeplx_pool.tr_cache import TranslationCache
+
+
+def test_parse_retry_after():
+    """Seconds or http date, capped, None if unusable."""
+    assert parse_retry_after("7") == 7
+    assert parse_retry_after("-3") == 0
+    assert parse_retry_after("99999") == 300
+    assert 55 < parse_retry_after(formatdate(time() + 60, usegmt=True)) <= 60
+    assert parse_retry_after("soon") is None
+    assert parse_retry_after(None) is None
+
+
+def test_bucket_learns_from_429():
+    """Half the observed rate, blocked for Retry-After, waiters queue up."""
+    bucket = TokenBucket(burst=2)
+    for sec in range(20):
+        bucket.take(now=100 + sec * 0.5)  # 2 requests per second
+    assert bucket.wait_time(now=110) == 0
+
+    bucket.on_429(retry_after=3, now=110)
+    assert bucket.rate == pytest.approx(1.0)
+    assert bucket.wait_time(now=110) == pytest.approx(4.0)  # 3s blocked + 1 token
+    bucket.take(now=110)
+    assert bucket.wait_time(now=110) == pytest.approx(5.0)  # next in turn
+    assert bucket.wait_time(now=115) == 0
+
+    for _ in range(100):
+        bucket.on_success()
+    assert bucket.rate == pytest.approx(6.0)
+
+    idle = TokenBucket()
+    idle.on_429(now=0)  # nothing observed: the floor
+    assert idle.rate == MIN_RATE
+
+
+def test_limiter_acquire_and_limited():
+    """A url out of tokens is reported limited, a wait over max_wait fails fast."""
+    limiter = RateLimiter(burst=1)
+    limiter.on_429("http://a", "30")
+    assert limiter.limited(["http://a", "http://b"]) == ["http://a"]
+    assert list(limiter.snapshot()) == ["http://a"]
+
+    with pytest.raises(RateLimited):
+        asyncio.run(limiter.acquire("http://a", max_wait=1))
+    asyncio.run(limiter.acquire("http://b", max_wait=1))  # unlimited
+
+
+def test_batch_avoids_limited_url(monkeypatch):
+    """Texts go to the url with tokens."""
+    urls = []
+
+    async def fake(text, *args, url=None, **kwargs):
+        urls.append(url)
+        return f"tr: {text}"
+
+    limiter = RateLimiter()
+    limiter.on_429("http://fake1", "60")
+    monkeypatch.setattr(bdt, "LIMITER", limiter)
+    monkeypatch.setattr(bdt, "deeplx_client_async", fake)
+    monkeypatch.setattr(bdt, "DEQ", bdt.deque(["http://fake1", "http://fake2"]))
+    monkeypatch.setattr(bdt, "TR_CACHE", TranslationCache())
+
+    texts = [f"text {idx}" for idx in range(6)]
+    _ = asyncio.run(bdt.batch_deeplx_tr(texts, n_workers=2, pack=False))
+    assert sorted(trtext for _, trtext in _) == sorted(f"tr: {text}" for text in texts)
+    assert set(urls) == {"http://fake2"}
+
+
+def test_one_cut_per_overload_episode():
+    """429s of requests sent before the cut extend the block, not cut the rate again."""
+    bucket = TokenBucket()
+    for sec in range(40):
+        bucket.take(now=100 + sec * 0.25)  # 4 requests per second
+    for idx in range(8):  # 8 requests sent at 109.9, their 429s come in one by one
+        bucket.on_429(retry_after=idx, now=110 + idx * 0.01, sent=109.9)
+    assert bucket.rate == pytest.approx(2.0)
+    assert bucket.blocked_until == pytest.approx(110.07 + 7)
+
+    bucket.on_429(now=120, sent=119)  # sent after the cut: a new episode
+    assert bucket.rate < 2.0
+
+
+def test_batch_rate_limited_costs_nothing(monkeypatch):
+    """RateLimited: no attempt used, no failure for the url, another url is picked."""
+
+    async def fake(text, *args, url=None, **kwargs):
+        if url == "http://fake1":
+            raise RateLimited(f"{url}: no token")
+        return f"tr: {text}"
+
+    monkeypatch.setattr(bdt, "deeplx_client_async", fake)
+    monkeypatch.setattr(bdt, "DEQ", bdt.deque(["http://fake1", "http://fake2"]))
+    monkeypatch.setattr(bdt, "TR_CACHE", TranslationCache())
+
+    breakers = CircuitBreakerBoard()
+    policy = RetryPolicy(max_attempts=1)
+    texts = [f"text {idx}" for idx in range(6)]
+    _ = dict(
+        asyncio.run(
+            bdt.batch_deeplx_tr(
+                texts, n_workers=2, breakers=breakers, retry_policy=policy, pack=False, timeout=5
+            )
+        )
+    )
+    assert [_[idx] for idx in range(6)] == [f"tr: {text}" for text in texts]
+    assert breakers.get("http://fake1").snapshot()["calls"] == 0
+    assert not policy.backing_off()
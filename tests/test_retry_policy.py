@@ -0,0 +1,118 @@
+"""Test retry_policy, and its use in batch_deeplx_tr with a fake client."""
+
+import asyncio
+import json
+
+import httpx
+
+import deeplx_pool.batch_deeplx_tr as bdt
+from deeplx_pool.circuit_breaker import CircuitBreakerBoard
+from deeplx_pool.retry_policy import (
+    ENDPOINT_FATAL,
+    NON_RETRYABLE,
+    RETRYABLE,
+    RetryPolicy,
+    classify,
+)
+from deeplx_pool.tr_cache import TranslationCache
+
+
+def status_error(status):
+    """Return what resp.raise_for_status() raises for status."""
+    request = httpx.Request("POST", "http://a/translate")
+    response = httpx.Response(status, request=request)
+    return httpx.HTTPStatusError(f"{status}", request=request, response=response)
+
+
+def test_classify():
+    """Bad request, bad url, try again."""
+    assert classify(status_error(400)) == NON_RETRYABLE
+    assert classify(status_error(404)) == ENDPOINT_FATAL
+    assert classify(status_error(429)) == RETRYABLE
+    assert classify(status_error(503)) == RETRYABLE
+    assert classify(httpx.ReadTimeout("slow")) == RETRYABLE
+    assert classify(httpx.ConnectError("[SSL: WRONG_VERSION_NUMBER]")) == ENDPOINT_FATAL
+    assert classify(json.JSONDecodeError("x", "<html>", 0)) == ENDPOINT_FATAL
+    assert classify(None) == RETRYABLE
+
+
+def test_backoff_per_url():
+    """Failing urls back off, fatal ones for long, success resets."""
+    policy = RetryPolicy(backoff_base=10, backoff_max=10)
+    policy.backoff = lambda url: 10.0  # no jitter
+    policy.on_failure("http://a", status_error(503))
+    policy.on_failure("http://b", status_error(400))  # the text, not the url
+    assert policy.backing_off() == ["http://a"]
+    assert policy.wait_time(["http://a", "http://b"]) == 0
+    assert 9 < policy.wait_time(["http://a"]) <= 10
+
+    policy.on_failure("http://c", status_error(403))
+    assert policy.wait_time(["http://c"]) > 500
+
+    policy.on_success("http://a")
+    assert policy.backing_off(["http://a", "http://c"]) == ["http://c"]
+
+
+def test_batch_rejected_and_capped(monkeypatch):
+    """A rejected text fails at once (after its pack is split), a failing one after max_attempts."""
+    calls = []
+
+    async def fake(text, *args, **kwargs):
+        calls.append(text)
+        if "bad input" in text:
+            raise status_error(400)
+        if "flaky" in text:
+            raise status_error(503)
+        return "\n".join(f"tr: {line}" for line in text.split("\n"))
+
+    monkeypatch.setattr(bdt, "deeplx_client_async", fake)
+    monkeypatch.setattr(bdt, "DEQ", bdt.deque(["http://fake1", "http://fake2"]))
+    monkeypatch.setattr(bdt, "TR_CACHE", TranslationCache())
+
+    policy = RetryPolicy(max_attempts=3, backoff_base=0.01)
+    _ = dict(
+        asyncio.run(
+            bdt.batch_deeplx_tr(
+                ["one", "bad input", "two", "flaky\n"], n_workers=2, retry_policy=policy
+            )
+        )
+    )
+    assert _[0] == "tr: one" and _[2] == "tr: two"
+    assert _[1].reason == "rejected" and _[1].attempts == 2  # packed, then alone
+    assert _[3].reason == "attempts" and _[3].attempts == 3
+    assert calls.count("bad input") == 1
+
+
+def test_rejected_texts_do_not_trip_breakers(monkeypatch):
+    """400s are the texts' fault: no failure recorded for the urls."""
+
+    async def fake(text, *args, **kwargs):
+        raise status_error(400)
+
+    monkeypatch.setattr(bdt, "deeplx_client_async", fake)
+    monkeypatch.setattr(bdt, "DEQ", bdt.deque(["http://fake1", "http://fake2"]))
+    monkeypatch.setattr(bdt, "TR_CACHE", TranslationCache())
+
+    breakers = CircuitBreakerBoard()
+    texts = [f"bad {idx}" for idx in range(20)]
+    _ = asyncio.run(bdt.batch_deeplx_tr(texts, n_workers=4, breakers=breakers, pack=False))
+    assert all(trtext.reason == "rejected" for _, trtext in _)
+    assert breakers.open_urls() == []
+
+
+def test_batch_no_data_url_avoided(monkeypatch):
+    """A url answering json without "data" (None) fails the attempt and is avoided."""
+    calls = []
+
+    async def fake(text, *args, url=None, **kwargs):
+        calls.append(url)
+        return None if url == "http://fake1" else f"tr: {text}"
+
+    monkeypatch.setattr(bdt, "deeplx_client_async", fake)
+    monkeypatch.setattr(bdt, "DEQ", bdt.deque(["http://fake1", "http://fake2"]))
+    monkeypatch.setattr(bdt, "TR_CACHE", TranslationCache())
+
+    texts = [f"text {idx}" for idx in range(10)]
+    _ = dict(asyncio.run(bdt.batch_deeplx_tr(texts, n_workers=2, pack=False, timeout=5)))
+    assert [_[idx] for idx in range(10)] == [f"tr: {text}" for text in texts]
+    assert calls.count("http://fake1") <= 2
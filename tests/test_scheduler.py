@@ -0,0 +1,57 @@
+"""Test scheduler."""
+
+import asyncio
+
+from deeplx_pool.scheduler import Scheduler
+
+
+def test_jobs_run_periodically():
+    """Jobs run every interval, a failing one keeps going."""
+    runs = []
+
+    async def ok():
+        runs.append("ok")
+
+    async def boom():
+        runs.append("boom")
+        raise RuntimeError("boom")
+
+    async def main():
+        scheduler = Scheduler()
+        scheduler.add("ok", ok, 0.02, jitter=0, first_delay=0)
+        scheduler.add("boom", boom, 0.02, jitter=0, first_delay=0)
+        scheduler.start()
+        await asyncio.sleep(0.09)
+        await scheduler.stop()
+        return scheduler.snapshot()
+
+    stats = asyncio.run(main())
+    assert runs.count("ok") >= 3
+    assert stats["boom"]["failures"] == stats["boom"]["runs"] >= 3
+    assert stats["boom"]["last_error"] == "boom"
+
+
+def test_group_no_overlap():
+    """A job due while its group is busy is skipped."""
+    running = []
+    overlaps = []
+
+    async def slow():
+        if running:
+            overlaps.append(1)
+        running.append(1)
+        await asyncio.sleep(0.05)
+        running.pop()
+
+    async def main():
+        scheduler = Scheduler()
+        scheduler.add("one", slow, 0.01, jitter=0, first_delay=0, group="probe")
+        scheduler.add("two", slow, 0.01, jitter=0, first_delay=0.01, group="probe")
+        scheduler.start()
+        await asyncio.sleep(0.2)
+        await scheduler.stop()
+        return scheduler.snapshot()
+
+    stats = asyncio.run(main())
+    assert not overlaps
+    assert stats["two"]["skips"] + stats["one"]["skips"] > 0
@@ -0,0 +1,44 @@
+"""Test sites_snapshot."""
+
+import json
+
+import diskcache
+
+from deeplx_pool.sites_snapshot import SitesSnapshot, SnapshotHolder
+
+SITES = [("http://a", 0.1), ("http://b", 0.2), ("http://c", 0.3)]
+
+
+def test_snapshot_bodies():
+    """Bodies are the json the endpoints used to build, ETags differ per body."""
+    snapshot = SitesSnapshot(SITES)
+    body, etag = snapshot.body()
+    assert json.loads(body) == dict(SITES)
+    assert snapshot.body(10) == (body, etag)
+
+    body2, etag2 = snapshot.body(2)
+    assert json.loads(body2) == dict(SITES[:2])
+    assert etag2 != etag
+    assert snapshot.body(2)[0] is body2  # serialized once
+
+    # only 0 means all, a negative num is one url as /set always did
+    assert json.loads(snapshot.body(-1)[0]) == dict(SITES[:1])
+    assert snapshot.body(-5) == snapshot.body(1)
+
+    assert json.loads(snapshot.num_body()[0]) == 3
+
+
+def test_holder_publish_reload(tmp_path):
+    """Swap only on change, reload from diskcache."""
+    cache_ = diskcache.Cache(tmp_path)
+    holder = SnapshotHolder(cache_)
+    assert not holder.reload()  # nothing in cache yet, still empty
+    assert len(holder.current) == 0
+
+    cache_.set("deeplx-sites", SITES)
+    assert holder.reload()
+    old = holder.current
+    assert not holder.publish(list(SITES))
+    assert holder.current is old
+    assert holder.publish(SITES[:1])
+    assert len(holder.current) == 1
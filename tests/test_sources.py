@@ -0,0 +1,140 @@
+"""Test sources with a fake source, no network needed."""
+
+import asyncio
+import threading
+from importlib import import_module
+
+import diskcache
+
+from deeplx_pool import sources
+from deeplx_pool.sources import Source, StaticSource
+
+
+class FakeSource(Source):
+    """Counts upstream calls, fails on demand."""
+
+    name = "fake"
+    queries = ("q1", "q2")
+    attempts = 2
+
+    def __init__(self, *args, **kwargs):
+        """Init."""
+        super().__init__(*args, **kwargs)
+        self.calls = []
+        self.fail = False
+
+    def fetch(self, query, timeout):
+        """Return one url per query, or raise."""
+        self.calls.append((query, timeout))
+        if self.fail:
+            raise RuntimeError("blocked")
+        return [f"http://{query}"]
+
+
+def test_throttled_query_reuses_raw_results(tmp_path):
+    """Within min_interval: no upstream call, last results instead of []."""
+    cache_ = diskcache.Cache(tmp_path)
+    source = FakeSource(cache_, min_interval=60)
+    assert asyncio.run(source.run()) == ["http://q1", "http://q2"]
+    assert len(source.calls) == 2
+
+    # e.g. a restart: a new instance on the same cache
+    source = FakeSource(cache_, min_interval=60)
+    assert asyncio.run(source.run_query("q1")) == ["http://q1"]
+    assert not source.calls
+
+
+def test_failure_retried_then_cached(tmp_path):
+    """Failed attempts are retried with growing timeout, then cached results are used."""
+    cache_ = diskcache.Cache(tmp_path)
+    source = FakeSource(cache_, min_interval=0, timeout=10, backoff=2)
+    asyncio.run(source.run_query("q1"))
+
+    source.fail = True
+    source.calls.clear()
+    assert asyncio.run(source.run_query("q1")) == ["http://q1"]
+    assert source.calls == [("q1", 10), ("q1", 20)]
+
+
+def test_attempts_fit_in_deadline(tmp_path, monkeypatch):
+    """Timeouts are cut to what is left of deadline, no attempt past it."""
+    clock = [1000.0]
+    monkeypatch.setattr(sources, "time", lambda: clock[0])
+
+    class TimingOut(FakeSource):
+        """Every attempt uses up its timeout."""
+
+        def fetch(self, query, timeout):
+            self.calls.append((query, timeout))
+            clock[0] += timeout
+            raise TimeoutError
+
+    cache_ = diskcache.Cache(tmp_path)
+    source = TimingOut(cache_, min_interval=0, attempts=3, timeout=60, backoff=1.5, deadline=235)
+    assert asyncio.run(source.run_query("q1")) == []
+    assert [timeout for _, timeout in source.calls] == [60, 90, 85]
+    assert clock[0] == 1235
+
+    source = TimingOut(cache_, min_interval=0, attempts=3, timeout=60, deadline=60)
+    asyncio.run(source.run_query("q1"))
+    assert len(source.calls) == 1  # no attempt with nothing left
+
+
+def test_fetch_in_source_threads(tmp_path):
+    """Fetches run in EXECUTOR, not the loop's default executor."""
+    names = []
+
+    class Recording(FakeSource):
+        """Notes the thread of each fetch."""
+
+        def fetch(self, query, timeout):
+            names.append(threading.current_thread().name)
+            return super().fetch(query, timeout)
+
+    asyncio.run(Recording(diskcache.Cache(tmp_path), min_interval=0).run())
+    assert names and all(name.startswith("source") for name in names)
+
+
+def test_cache_io_off_the_loop(tmp_path):
+    """Throttle check and raw result cache run in the source thread too."""
+    names = []
+
+    class Spy(diskcache.Cache):
+        """Notes the thread of each get/set."""
+
+        def get(self, *args, **kwargs):
+            names.append(threading.current_thread().name)
+            return super().get(*args, **kwargs)
+
+        def set(self, *args, **kwargs):
+            names.append(threading.current_thread().name)
+            return super().set(*args, **kwargs)
+
+    asyncio.run(FakeSource(Spy(tmp_path), min_interval=60).run_query("q1"))
+    assert len(names) == 4  # raw get, last get/set, raw set
+    assert all(name.startswith("source") for name in names)
+
+
+def test_fofa_hack_honours_timeout(monkeypatch):
+    """No next page after timeout, even if fofa-hack would go on forever."""
+    module = import_module("deeplx_pool.fetch_urls_fofa_hack")
+    requested = []
+
+    def api(query, endcount=100, timeout=180, proxy=None, **kwargs):
+        requested.append(timeout)
+        while True:
+            clock[0] += 4
+            yield [f"http://{clock[0]}"]
+
+    clock = [0.0]
+    monkeypatch.setattr(module.fofa, "api", api)
+    monkeypatch.setattr(module, "monotonic", lambda: clock[0])
+    assert len(module.fetch_urls_fofa_hack("q", timeout=10)) == 3
+    assert requested == [10]
+
+
+def test_static_source(tmp_path):
+    """No throttling, no cache."""
+    source = StaticSource(["http://a"], diskcache.Cache(tmp_path))
+    assert asyncio.run(source.run()) == ["http://a"]
+    assert asyncio.run(source.run()) == ["http://a"]
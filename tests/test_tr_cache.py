@@ -0,0 +1,83 @@
+"""Test tr_cache."""
+
+import asyncio
+import threading
+
+import diskcache
+
+from deeplx_pool.tr_cache import TranslationCache
+
+
+def test_lru_eviction():
+    """Least recently used entry goes first."""
+    tr_cache = TranslationCache(maxsize=2)
+    tr_cache.set("a", "A")
+    tr_cache.set("b", "B")
+    assert tr_cache.get("a") == "A"  # b is now the oldest
+    tr_cache.set("c", "C")
+
+    assert tr_cache.get("b") is None
+    assert tr_cache.get("a") == "A"
+    assert tr_cache.get("c") == "C"
+    assert tr_cache.stats()["hits"] == 3
+    assert tr_cache.stats()["misses"] == 1
+
+
+def test_key_includes_langs():
+    """Same text, different language pair: different entries."""
+    tr_cache = TranslationCache()
+    tr_cache.set("hello", "hallo", "en", "de")
+    assert tr_cache.get("hello", "EN", "de") == "hallo"
+    assert tr_cache.get("hello", "en", "fr") is None
+    assert tr_cache.get("hello") is None
+
+
+def test_empty_not_stored():
+    """An empty translation is a failure, not a cache entry."""
+    tr_cache = TranslationCache()
+    tr_cache.set("b", "")
+    tr_cache.set("c", "  ")
+    assert tr_cache.get("b") is None and tr_cache.get("c") is None
+
+
+def test_disk_tier(tmp_path):
+    """Entries survive the memory tier, promoted on a disk hit."""
+    tr_cache = TranslationCache(disk=tmp_path)
+    tr_cache.set("hello", "hallo", "en", "de")
+
+    tr_cache1 = TranslationCache(disk=tmp_path)
+    assert tr_cache1.get("hello", "en", "de") == "hallo"
+    assert tr_cache1.stats()["disk_hits"] == 1
+
+    assert tr_cache1.get("hello", "en", "de") == "hallo"
+    assert tr_cache1.stats()["disk_hits"] == 1  # from memory this time
+
+
+def test_disk_io_off_the_loop(tmp_path):
+    """In a running loop, disk reads and writes happen in executor threads."""
+    threads = []
+
+    class Spy(diskcache.Cache):
+        """Cache noting the threads it is used from."""
+
+        def get(self, *args, **kwargs):  # pylint: disable=arguments-differ
+            threads.append(threading.get_ident())
+            return super().get(*args, **kwargs)
+
+        def set(self, *args, **kwargs):  # pylint: disable=arguments-differ
+            threads.append(threading.get_ident())
+            return super().set(*args, **kwargs)
+
+    async def main():
+        tr_cache = TranslationCache(disk=Spy(tmp_path))
+        tr_cache.set("hello", "hallo", "en", "de")
+        await asyncio.sleep(0.1)  # the write in the executor
+
+        tr_cache1 = TranslationCache(disk=Spy(tmp_path))
+        trtexts = await tr_cache1.aget_many(["hello", "world", "hello"], "en", "de")
+        assert trtexts == ["hallo", None, "hallo"]
+        assert tr_cache1.stats()["disk_hits"] == 2
+        assert await tr_cache1.aget("hello", "en", "de") == "hallo"  # memory now
+
+    asyncio.run(main())
+    assert threads and threading.get_ident() not in threads